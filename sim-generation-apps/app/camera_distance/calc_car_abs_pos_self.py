@@ -1,7 +1,5 @@
 import os
 import argparse
-import json
-import copy
 import math
 import sys
 
@@ -9,46 +7,22 @@ import pandas as pd
 import numpy as np
 
 from cvt_lat_long_cartesian import (
-    convert_lat_long_to_cartesian,
+    convert_lat_long_to_cartesian_array,
     cvt_plane_cartesian_to_world,
     cvt_world_to_plane_cartesian,
     convert_cartesian_to_lat_long,
     calc_org_lat_long,
 )
 from commons.constants import *
-from commons.math_util import unit_v, get_perp_vec, get_distance_2d, get_angle_2d
-from tools.estimate_abs_pos import interpolate_abs_pos
-
-
-def calc_detect_car_pos(owned_prev_abs_pos: list, owned_curr_abs_pos: list, dx: float, dy: float):
-    """検出車の絶対座標を求める
-
-    Args:
-        owned_prev_abs_pos (list): 過去フレームのそれぞれ自車の平面座標 (世界座標系)
-        owned_curr_abs_pos (list): 現フレームのそれぞれ自車の平面座標 (世界座標系)
-        dx (float): 相対距離 (X-axis)
-        dy (float): 相対距離 (Y-axis)
-
-    Returns:
-        list: 検出車の絶対座標
-    """
-    # 移動方向ベクトル
-    curr_dir = (owned_curr_abs_pos[0] - owned_prev_abs_pos[0],
-                owned_curr_abs_pos[1] - owned_prev_abs_pos[1])
-    curr_dir = unit_v(curr_dir)
-
-    # 自車の現在方向にdx dyの方向を計算
-    dy_dir = curr_dir
-    is_right_side = dx > 0
-    dx_dir = get_perp_vec(dy_dir, is_right_side)
-
-    # 検出車の絶対座標
-    dy_world = [dy_dir[0] * dy, dy_dir[1] * dy]
-    dx_world = [dx_dir[0] * abs(dx), dx_dir[1] * abs(dx)]
-    xd_world = owned_curr_abs_pos[0] + dy_world[0] + dx_world[0]
-    yd_world = owned_curr_abs_pos[1] + dy_world[1] + dx_world[1]
-
-    return [xd_world, yd_world]
+from commons.result_io import (
+    RESULT_FORMAT_JSON,
+    RESULT_FORMATS,
+    get_abs_coord_file_name,
+    load_result_json,
+    save_result_json,
+)
+from commons.math_util import get_distance_2d, get_angle_2d
+from tools.estimate_abs_pos import interpolate_own_car_abs_pos
 
 
 def str2second(time_s: str, fps: int, delimiter: str):
@@ -74,14 +48,14 @@ def angle_between_vectors(vector1, vector2):
     angle_deg = round(math.degrees(angle_rad), 2)
     return angle_rad, angle_deg
 
-def main():
+def main(argv=None):
     # 引数をパースする
     parser = argparse.ArgumentParser(description="対象の相対座標の計算")
     parser.add_argument(
         "--rel_coord_file",
         type=str,
         required=True,
-        help="相対距離推定結果jsonファイルパス",
+        help="相対距離推定結果ファイルパス (.json / フレームごとに書き込んだ .jsonl)",
     )
     parser.add_argument(
         "--gps_coord_file",
@@ -114,9 +88,17 @@ def main():
         default=30,
         help="FPS",
     )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        required=False,
+        default=RESULT_FORMAT_JSON,
+        choices=RESULT_FORMATS,
+        help="車両座標の結果ファイルの形式 (json: jsonファイル、npz: 列形式の軌跡データ)",
+    )
 
     # parse input arguments
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     rel_coord_file = args.rel_coord_file
     assert isinstance(rel_coord_file, str)
@@ -145,9 +127,7 @@ def main():
         return
 
     # read data files
-    det_rel_coord_result = {}
-    with open(rel_coord_file, mode='r', encoding='utf-8') as f:
-        det_rel_coord_result = json.load(f)
+    det_rel_coord_result = load_result_json(rel_coord_file, for_update=True)
 
     gps_data = pd.read_csv(gps_coord_file)
     gps_data_lat = gps_data['lat'].values
@@ -225,8 +205,7 @@ def main():
     # execute
     # get same frame index of gps data and detected result
     detected_frame_idxes = [item['frame'] for item in det_rel_coord_result['results']]
-    target_frame_idxes = list(set(gps_data_frame_idxes).intersection(detected_frame_idxes))
-    target_frame_idxes = sorted(target_frame_idxes)
+    target_frame_idxes = set(gps_data_frame_idxes).intersection(detected_frame_idxes)
     target_idxes = [(detected_idx, detected_frame_idx) for detected_idx, detected_frame_idx in enumerate(
         detected_frame_idxes) if detected_frame_idx in target_frame_idxes]
     detected_idxes = [x[0] for x in target_idxes]
@@ -243,18 +222,25 @@ def main():
     first_result = []
 
     # output result
-    output_results = copy.deepcopy(det_rel_coord_result['results'])
+    output_results = det_rel_coord_result['results']
+
+    # gps data row of each target frame (first row of the same frame)
+    gps_frames, gps_first_row_idxes = np.unique(gps_data_frame_idxes, return_index=True)
+    target_gps_row_idxes = gps_first_row_idxes[np.searchsorted(gps_frames, [x[1] for x in target_idxes])]
+
+    # convert lat, lon of all target frames to cartesian coord
+    owned_cartesian_xs, owned_cartesian_ys = convert_lat_long_to_cartesian_array(
+        gps_data_lat[target_gps_row_idxes], gps_data_lon[target_gps_row_idxes], phi0_deg, lambda0_deg)
+    owned_abs_coords = np.column_stack(
+        cvt_plane_cartesian_to_world(owned_cartesian_xs, owned_cartesian_ys)).tolist()
 
     # CALCULATE OWN CAR ABS POS
     for ii, (detected_idx, detected_frame_idx) in enumerate(target_idxes):
         result = output_results[detected_idx]
 
-        # convert lat, lon to cartesian coord
-        gps_row_idx = np.where(gps_data_frame_idxes == detected_frame_idx)[0][0]
+        gps_row_idx = target_gps_row_idxes[ii]
         lat, lon = gps_data_lat[gps_row_idx], gps_data_lon[gps_row_idx]
-        owned_cartesian_coord = convert_lat_long_to_cartesian(lat, lon, phi0_deg, lambda0_deg)
-        owned_abs_coord = cvt_plane_cartesian_to_world(owned_cartesian_coord[0], owned_cartesian_coord[1])
-        result['self']['world_coordinate'] = owned_abs_coord
+        result['self']['world_coordinate'] = owned_abs_coords[ii]
         result['self']['latitude'] = lat
         result['self']['longitude'] = lon
         result['self']['acc_x'] = None
@@ -271,7 +257,7 @@ def main():
             owned_curr_abs_pos = result['self']['world_coordinate']
             prev_detected_idx, prev_detected_frame_idx = target_idxes[ii-1]
             owned_prev_abs_pos_tmp = output_results[prev_detected_idx]['self']['world_coordinate']
-            prev_gps_row_idx = np.where(gps_data_frame_idxes == prev_detected_frame_idx)[0][0]
+            prev_gps_row_idx = target_gps_row_idxes[ii-1]
 
             # owned vehicle velocity
             movement_dist = get_distance_2d(owned_prev_abs_pos_tmp, owned_curr_abs_pos)
@@ -318,44 +304,15 @@ def main():
     first_result['self']['yaw'] = second_result['self']['yaw']
     
     # INTERPOLATE/EXTRAPOLATE OWN CAR ABS POS
-    for ii, result in enumerate(output_results):
-        if ii not in detected_idxes:
-            if ii < detected_idxes[0]:
-                idx1 = detected_idxes[0]
-                idx2 = detected_idxes[1]
-            elif ii > detected_idxes[-1]:
-                idx1 = detected_idxes[-2]
-                idx2 = detected_idxes[-1]
-            else:
-                idx1 = sorted([x for x in detected_idxes if x < ii], reverse=True)[0]
-                idx2 = sorted([x for x in detected_idxes if x > ii])[0]
-                
-            xy_est, lat_est, lon_est, velocity_est, yaw_est = interpolate_abs_pos(result["frame"],
-                                                                        output_results[idx1]["frame"], 
-                                                                        output_results[idx2]["frame"],
-                                                                        output_results[idx1]["self"]["world_coordinate"],
-                                                                        output_results[idx2]["self"]["world_coordinate"],
-                                                                        output_results[idx1]["self"]["velocity"],
-                                                                        output_results[idx2]["self"]["velocity"],
-                                                                        phi0_deg, lambda0_deg)
-            est_own_car = {
-                "world_coordinate": xy_est,
-                "latitude": lat_est,
-                "longitude": lon_est,
-                "velocity": velocity_est,
-                "yaw": yaw_est
-            }
-            result["self"] |= est_own_car
+    interpolate_own_car_abs_pos(output_results, detected_idxes, phi0_deg, lambda0_deg)
 
     # output result to json
-    output_dict = copy.deepcopy(det_rel_coord_result)
+    output_dict = det_rel_coord_result
     output_dict['EPSG'] = epsg_code
-    output_dict['results'] = output_results
 
-    output_abs_coord_file_path = os.path.join(os.path.dirname(rel_coord_file), ABS_COORD_JSON_FILE_NAME)
+    output_abs_coord_file_path = os.path.join(os.path.dirname(rel_coord_file), get_abs_coord_file_name(args.output_format))
 
-    with open(output_abs_coord_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(output_dict, f, ensure_ascii=False, indent=2)
+    save_result_json(output_abs_coord_file_path, output_dict)
 
 
 if __name__ == '__main__':
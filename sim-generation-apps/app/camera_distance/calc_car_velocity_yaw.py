@@ -1,46 +1,48 @@
 import argparse
-import copy
-import json
-import math
 import os
 
-from commons.constants import ABS_COORD_JSON_FILE_NAME, DETECTION_YAW_THD
-from commons.math_util import get_angle_2d, get_distance_2d
+import numpy as np
 
-def limit_yaw(self_yaw, detection_yaw):
-    # calculate difference from 2 angles
-    diff_angle = abs(((self_yaw - detection_yaw) + 180) % 360 - 180)
-    
-    # detection yaw within limit range
-    if diff_angle <= DETECTION_YAW_THD:
-        return detection_yaw
-    
-    # detection yaw out of limit range
-    max_angle = ((self_yaw + DETECTION_YAW_THD) + 360) % 360
-    min_angle = ((self_yaw - DETECTION_YAW_THD) + 360) % 360
-    
-    diff_max_angle = abs(((max_angle - detection_yaw) + 180) % 360 - 180)
-    diff_min_angle = abs(((min_angle - detection_yaw) + 180) % 360 - 180)
-    
-    return max_angle if diff_max_angle <= diff_min_angle else min_angle
+from commons.constants import DETECTION_YAW_THD
+from commons.detection_table import DetectionTable
+from commons.result_io import get_abs_coord_file_name, get_result_format, load_result_columns, update_result_columns
+from commons.track_index import TrackIndex
+
+def limit_yaw(self_yaws, detection_yaws):
+    # calculate difference from 2 angles (element-wise for arrays)
+    diff_angle = np.abs(((self_yaws - detection_yaws) + 180) % 360 - 180)
+
+    # detection yaw out of limit range => nearer limit of range
+    max_angle = ((self_yaws + DETECTION_YAW_THD) + 360) % 360
+    min_angle = ((self_yaws - DETECTION_YAW_THD) + 360) % 360
+
+    diff_max_angle = np.abs(((max_angle - detection_yaws) + 180) % 360 - 180)
+    diff_min_angle = np.abs(((min_angle - detection_yaws) + 180) % 360 - 180)
+    limited_yaws = np.where(diff_max_angle <= diff_min_angle, max_angle, min_angle)
+
+    # detection yaw within limit range => as is
+    return np.where(diff_angle <= DETECTION_YAW_THD, detection_yaws, limited_yaws)
+
+def cal_velocity_yaw(prev_abs_pos, curr_abs_pos, prev_frames, curr_frames, fps):
+    # positions (N, 2 or more) and frames (N,) of each movement
+    movement_dx = curr_abs_pos[:, 0] - prev_abs_pos[:, 0]
+    movement_dy = curr_abs_pos[:, 1] - prev_abs_pos[:, 1]
 
-def cal_velocity_yaw(prev_abs_pos, curr_abs_pos, prev_frame, curr_frame, fps):
     # vehicle velocity
-    movement_dist = get_distance_2d(prev_abs_pos, curr_abs_pos)
-    movement_time = (curr_frame - prev_frame) / fps
+    movement_dist = np.sqrt(movement_dx**2 + movement_dy**2)
+    movement_time = (curr_frames - prev_frames) / fps
     movement_velocity = movement_dist / movement_time
     # m/s => km/h
-    velocity = 3.6 * movement_velocity
+    velocities = 3.6 * movement_velocity
 
-    # vehicle direction (z-axis rotation angle)
-    movement_dx = curr_abs_pos[0] - prev_abs_pos[0]
-    movement_dy = curr_abs_pos[1] - prev_abs_pos[1]
-    yaw = get_angle_2d(movement_dx, movement_dy)
-    yaw = math.degrees(yaw)
-    
-    return velocity, yaw
+    # vehicle direction (z-axis rotation angle, 0 to 2pi)
+    yaws = np.arctan2(movement_dy, movement_dx)
+    yaws = np.where(yaws >= 0, yaws, yaws + np.pi * 2)
+    yaws = np.degrees(yaws)
 
-def main():
+    return velocities, yaws
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="隣接フレーム間の座標から自車・他車の向き、速度を計算する"
     )
@@ -63,65 +65,75 @@ def main():
         help="他車の向きの範囲を制限する",
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     car_abs_coord_file_path = args.car_abs_coord_file_path
     fps = args.fps
     limit_detect_yaw_range = args.limit_detect_yaw_range
     
-    # read car absolute coords (.json file)
-    with open(car_abs_coord_file_path, "r", errors="ignore") as f:
-        car_abs_coords = json.load(f)
+    # read car absolute coords (only columns used here)
+    frame_columns, detection_columns = load_result_columns(
+        car_abs_coord_file_path,
+        frame_keys=["frame", "self.world_coordinate"],
+        detection_keys=["obj_id", "world_coordinate", "velocity", "yaw"],
+    )
     
+    # calculate for self car (between adjacent frames)
+    frames = np.array(frame_columns["frame"], dtype=np.int64)
+    self_abs_pos = np.array([coord[:2] for coord in frame_columns["self.world_coordinate"]], dtype=np.float64)
+    self_velocities, self_yaws = cal_velocity_yaw(self_abs_pos[:-1], self_abs_pos[1:], frames[:-1], frames[1:], fps)
+
+    # first frame uses the values of second frame
+    self_values = {
+        "self.velocity": (list(range(len(frames))), self_velocities[:1].tolist() + self_velocities.tolist()),
+        "self.yaw": (list(range(len(frames))), self_yaws[:1].tolist() + self_yaws.tolist()),
+    }
+
+    # calculate for detections
+    # (only detections tracked from first frame, compared with previous detection of same obj_id)
+    track_index = TrackIndex.from_columns(frame_columns["frame"], detection_columns["result_index"], detection_columns["obj_id"])
+    table = DetectionTable(track_index, detection_columns)
+    detections = table.data
+    prev_rows = detections["prev_row"]
+    first_obj_ids = detections["obj_id"][detections["result_index"] == 0]
+    rows = np.nonzero(
+        (detections["result_index"] > 0) & np.isin(detections["obj_id"], first_obj_ids) & (prev_rows >= 0)
+    )[0]
+    curr_abs_pos = detections["world_coordinate"][rows]
+    prev_abs_pos = detections["world_coordinate"][prev_rows[rows]]
+
+    # 同座標に補正されていた場合の暫定対応
+    moved = curr_abs_pos[:, 0] != prev_abs_pos[:, 0]
+    rows, curr_abs_pos, prev_abs_pos = rows[moved], curr_abs_pos[moved], prev_abs_pos[moved]
+
+    result_idxes = detections["result_index"][rows]
+    velocities, yaws = cal_velocity_yaw(
+        prev_abs_pos, curr_abs_pos, frames[result_idxes - 1], frames[result_idxes], fps)
+    if limit_detect_yaw_range:
+        # self yaw of result ii is self_yaws[ii - 1]
+        yaws = limit_yaw(self_yaws[result_idxes - 1], yaws)
+    detections["velocity"][rows] = velocities
+    detections["yaw"][rows] = yaws
+    detection_values = table.get_column_values(["velocity", "yaw"], rows)
+
+    # calculate for first frame (copy from detection of same obj_id in second frame)
+    for name, (column_rows, values) in detection_values.items():
+        column = detection_columns[name]
+        for row, value in zip(column_rows, values):
+            column[row] = value
+    second_start = int(np.searchsorted(detection_columns["result_index"], 1))
+    for row in range(second_start):
+        jj = track_index.find(detection_columns["obj_id"][row], 1)
+        if jj is not None:
+            for name, (column_rows, values) in detection_values.items():
+                column_rows.append(row)
+                values.append(detection_columns[name][second_start + jj])
+
     # output result
-    output_results = copy.deepcopy(car_abs_coords['results'])
-    
-    detections_prev_abs_pos = {}
-    for ii, result in enumerate(output_results):
-        prev_frame = output_results[ii-1]["frame"]
-        curr_frame = result["frame"]
-        
-        if ii == 0:
-            for jj, detection in enumerate(result["detections"]):
-                detections_prev_abs_pos |= {
-                    str(detection["obj_id"]): detection["world_coordinate"]
-                }
-        
-        if ii > 0:
-            # calculate for self car
-            prev_abs_pos = output_results[ii-1]["self"]["world_coordinate"]
-            curr_abs_pos = result["self"]["world_coordinate"]
-            result["self"]["velocity"], result["self"]["yaw"] = cal_velocity_yaw(prev_abs_pos, curr_abs_pos, prev_frame, curr_frame, fps)
-            
-            # calculate for detections
-            for jj, detection in enumerate(result["detections"]):
-                if str(detection["obj_id"]) in detections_prev_abs_pos.keys():
-                    prev_abs_pos = detections_prev_abs_pos[str(detection["obj_id"])]
-                    curr_abs_pos = detection["world_coordinate"]
-
-                    # 同座標に補正されていた場合の暫定対応
-                    if(curr_abs_pos[0] != prev_abs_pos[0]):
-                        detection["velocity"], detection["yaw"] = cal_velocity_yaw(prev_abs_pos, curr_abs_pos, prev_frame, curr_frame, fps)
-                        if limit_detect_yaw_range:
-                            detection["yaw"] = limit_yaw(result["self"]["yaw"], detection["yaw"])
-                    
-                    detections_prev_abs_pos[str(detection["obj_id"])] = curr_abs_pos
-                
-    # calculate for first frame
-    output_results[0]["self"]["velocity"] = output_results[1]["self"]["velocity"]
-    output_results[0]["self"]["yaw"] = output_results[1]["self"]["yaw"]
-    for detection in output_results[0]["detections"]:
-        detections_second_frame = [(det["velocity"], det["yaw"]) for det in output_results[1]["detections"] if det["obj_id"] == detection["obj_id"]]
-        if len(detections_second_frame) > 0:
-            (detection["velocity"], detection["yaw"]) = detections_second_frame[0]
-
-    # output result to json
-    output_dict = copy.deepcopy(car_abs_coords)
-    output_dict['results'] = output_results
-    
-    output_abs_coord_file_path = os.path.join(os.path.dirname(car_abs_coord_file_path), ABS_COORD_JSON_FILE_NAME)
+    output_abs_coord_file_path = os.path.join(os.path.dirname(car_abs_coord_file_path),
+                                              get_abs_coord_file_name(get_result_format(car_abs_coord_file_path)))
 
-    with open(output_abs_coord_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(output_dict, f, ensure_ascii=False, indent=2)
+    update_result_columns(car_abs_coord_file_path, frame_values=self_values, detection_values=detection_values,
+                          output_path=output_abs_coord_file_path)
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
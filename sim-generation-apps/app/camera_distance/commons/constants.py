@@ -29,6 +29,11 @@ TARGET_DETECTION_CLASS = ["car", "bus", "truck"]
 DETECTION_CONF_THD = 0.6
 DETECTION_IOU_THD = 0.45
 DEPRICATE_IOU_THD = 0.97  # 物体検出後、重複物体とみなす閾値
+DETECTION_BATCH_SIZE = 1  # 1回の推論で検出するフレーム数 (1の場合は1フレームずつトラッキング)
+DETECTION_TRACKER = "botsort.yaml"  # トラッカーの設定 (botsort.yaml / bytetrack.yaml)
+DETECTION_BACKEND = "pytorch"  # 推論バックエンド (pytorch / openvino / onnx)
+DETECTION_INT8 = False  # INT8量子化したモデルを使用するかどうか (openvinoのみ)
+DISTANCE_LUT = False  # 画素ごとの相対座標のテーブルを使用するかどうか
 
 # original tracking settings
 MAX_DISTANCE_TRACKER = 300  # トラッキングで同一物体とみなす距離の最大値
@@ -41,8 +46,10 @@ MOVING_AVERAGE_WIDTH_TRACKER = 3  # トラッキングで移動平均を考え
 REL_COORD_IMG_SUFFIX = '_visualized_rel_coords'
 ABS_COORD_IMG_SUFFIX = '_visualized_abs_coords'
 REL_COORD_JSON_FILE_NAME = 'detection_distance_result.json'
+REL_COORD_STREAM_FILE_NAME = 'detection_distance_result.jsonl'
 GPS_CSV_SUFFIX = "_updated"
 ABS_COORD_JSON_FILE_NAME = 'car_abs_pos_result.json'
+ABS_COORD_STORE_FILE_NAME = 'car_abs_pos_result.npz'
 ABS_COORD_JSON_SUFFIX = '_abs_coord'            # detection_distance_result_abs_coord.json
 ABS_COORD_CORRECTED_JSON_SUFFIX = '_corrected'  # detection_distance_result_abs_coord_corrected.json
 ROAD_CORRECT_TARGETS_FILE_NAME = 'road_correct_targets.json'
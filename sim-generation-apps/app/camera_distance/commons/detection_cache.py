@@ -0,0 +1,186 @@
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# キャッシュの形式、または検出結果に影響する処理を変更した場合は値を上げる (古いキャッシュは使用しなくなる)
+DETECTION_CACHE_VERSION = 1
+
+# フレームセットのハッシュ値の計算対象とする画像の拡張子 (LoadBGRImagesと同じ)
+IMAGE_EXTENSIONS = ('bmp', 'jpg', 'jpeg', 'png', 'tif', 'tiff', 'dng', 'webp', 'mpo')
+
+# ファイルを読み込む単位(バイト)
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+def update_file_hash(sha, file_path):
+    """ファイルの内容でハッシュオブジェクトを更新する
+
+    Args:
+        sha (hashlib._Hash): ハッシュオブジェクト
+        file_path (str): ファイルパス
+    """
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+
+
+def calc_file_hash(file_path):
+    """ファイルの内容からハッシュ値を計算する
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        str: ハッシュ値(16進数文字列)
+    """
+    sha = hashlib.sha256()
+    update_file_hash(sha, file_path)
+    return sha.hexdigest()
+
+
+def calc_image_dir_hash(input_dir):
+    """フォルダ内の画像(ファイル名と内容)からハッシュ値を計算する
+
+    Args:
+        input_dir (str): 入力画像フォルダパス
+
+    Returns:
+        str: ハッシュ値(16進数文字列)
+    """
+    files = sorted(glob.glob(os.path.join(input_dir, '*.*')))
+    sha = hashlib.sha256()
+    for file_path in files:
+        if file_path.split('.')[-1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        sha.update(os.path.basename(file_path).encode('utf-8'))
+        update_file_hash(sha, file_path)
+    return sha.hexdigest()
+
+
+def calc_frame_set_hash(input_source):
+    """検出対象のフレームセットのハッシュ値を計算する
+
+    Args:
+        input_source (str | FrameStream): 入力画像フォルダパス、または補正済みフレームのストリーム
+
+    Returns:
+        str: ハッシュ値(16進数文字列)
+    """
+    if isinstance(input_source, str):
+        return calc_image_dir_hash(input_source)
+    return input_source.calc_source_hash()
+
+
+def calc_detection_cache_key(cache_params):
+    """検出結果のキャッシュキーを計算する
+
+    Args:
+        cache_params (dict): 検出結果に影響するパラメータ (フレームセット・重みのハッシュ値、閾値、トラッカー設定など)
+
+    Returns:
+        str: キャッシュキー(16進数文字列)
+    """
+    params = dict(cache_params, cache_version=DETECTION_CACHE_VERSION)
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def load_detection_arrays(cache_path):
+    """キャッシュファイルを配列のまま読み込む
+
+    Args:
+        cache_path (str): キャッシュファイルパス
+
+    Returns:
+        dict: 以下のキーを持つ辞書 (Fはフレーム数、Nは全フレームの検出数)
+            image_names (np.ndarray): 画像名 (F,)
+            image_sizes (np.ndarray): 解像度(w, h) (F, 2)
+            counts (np.ndarray): フレームごとの検出数 (F,)
+            bboxes (np.ndarray): 矩形(xmin, ymin, xmax, ymax) (N, 4)
+            names (np.ndarray): クラス名 (N,)
+            ids (np.ndarray): トラッキングID (N,)
+            labels (str): ラベルファイル(labels.txt)の内容
+
+    Raises:
+        OSError, ValueError, KeyError: キャッシュファイルを読み込めない場合
+    """
+    with np.load(cache_path, allow_pickle=False) as cache:
+        arrays = {key: cache[key] for key in ('image_names', 'image_sizes', 'counts', 'bboxes', 'names', 'ids')}
+        arrays['labels'] = str(cache['labels'])
+    return arrays
+
+
+class DetectionCache:
+    """物体検出・トラッキング結果(矩形、クラス名、トラッキングID)のキャッシュ
+
+    フレームセット・モデルの重み・閾値・トラッカー設定から計算したキーごとに1ファイル保存する。
+    カメラパラメータ(theta, camera_height など)はキーに含まないため、
+    カメラパラメータのみを変更して再実行する場合は物体検出を実行せずに結果を読み込める。
+    """
+
+    def __init__(self, cache_dir, cache_params):
+        """
+        Args:
+            cache_dir (str): キャッシュの保存先フォルダ
+            cache_params (dict): 検出結果に影響するパラメータ (calc_detection_cache_key を参照)
+        """
+        self.cache_dir = cache_dir
+        self.cache_key = calc_detection_cache_key(cache_params)
+        self.cache_path = os.path.join(cache_dir, f'detections_{self.cache_key}.npz')
+
+    def load(self):
+        """キャッシュを読み込む
+
+        Returns:
+            Tuple[list, str] | None:
+                フレームごとの(画像名, 解像度(w, h), 矩形のリスト, クラス名のリスト, トラッキングIDのリスト)のリスト、
+                ラベルファイル(labels.txt)の内容。キャッシュが無い場合はNone
+        """
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            arrays = load_detection_arrays(self.cache_path)
+        except (OSError, ValueError, KeyError):
+            print(f"Warning: 検出結果のキャッシュを読み込めないため、物体検出を実行します。: {self.cache_path}")
+            return None
+
+        image_sizes = arrays['image_sizes'].tolist()
+        bboxes = arrays['bboxes'].tolist()
+        names = arrays['names'].tolist()
+        ids = arrays['ids'].tolist()
+        offsets = np.concatenate([[0], np.cumsum(arrays['counts'])]).tolist()
+        records = []
+        for ii, image_name in enumerate(arrays['image_names'].tolist()):
+            start, end = offsets[ii], offsets[ii + 1]
+            records.append((image_name, tuple(image_sizes[ii]), bboxes[start:end], names[start:end], ids[start:end]))
+        print(f"Loaded detection cache: {self.cache_path}")
+        return records, arrays['labels']
+
+    def save(self, records, labels):
+        """キャッシュを保存する
+
+        Args:
+            records (list): フレームごとの(画像名, 解像度(w, h), 矩形のリスト, クラス名のリスト, トラッキングIDのリスト)のリスト
+            labels (str): ラベルファイル(labels.txt)の内容
+        """
+        bboxes = [bbox for record in records for bbox in record[2]]
+        data = {
+            'image_names': np.array([record[0] for record in records], dtype=str),
+            'image_sizes': np.array([record[1] for record in records], dtype=np.int64).reshape(-1, 2),
+            'counts': np.array([len(record[3]) for record in records], dtype=np.int64),
+            'bboxes': np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+            'names': np.array([name for record in records for name in record[3]], dtype=str),
+            'ids': np.array([obj_id for record in records for obj_id in record[4]], dtype=np.int64),
+            'labels': np.array(labels, dtype=str),
+        }
+
+        # 複数ジョブから同時に書き込まれても壊れないように、一時ファイルに書いてから置き換える
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **data)
+        os.replace(tmp_path, self.cache_path)
+        print(f"Saved detection cache: {self.cache_path}")
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import pickle
+
+# チェックポイントの形式、または再開時の処理を変更した場合は値を上げる (古いチェックポイントからは再開しない)
+DETECTION_CHECKPOINT_VERSION = 1
+
+# チェックポイントのファイル名 (出力結果フォルダに保存する)
+DETECTION_CHECKPOINT_FILE_NAME = 'detection_checkpoint.pkl'
+
+
+def calc_checkpoint_key(checkpoint_params):
+    """チェックポイントのキーを計算する
+
+    Args:
+        checkpoint_params (dict): 結果に影響するパラメータ (引数、距離推定の設定など)
+
+    Returns:
+        str: キー(16進数文字列)
+    """
+    params = dict(checkpoint_params, checkpoint_version=DETECTION_CHECKPOINT_VERSION)
+    text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class DetectionCheckpoint:
+    """相対距離推定(INFER_DISTANCE)の途中経過のチェックポイント
+
+    処理済みのフレーム数、結果ファイル(jsonl)の行数、ラベルファイルのサイズ、トラッカーの状態などを出力結果フォルダに保存する。
+    同じパラメータで再実行した場合は、チェックポイントの時点から検出・トラッキングを再開できる。
+    """
+
+    def __init__(self, output_dir, checkpoint_params):
+        """
+        Args:
+            output_dir (str): 出力結果フォルダパス
+            checkpoint_params (dict): 結果に影響するパラメータ (calc_checkpoint_key を参照)
+        """
+        self.checkpoint_path = os.path.join(output_dir, DETECTION_CHECKPOINT_FILE_NAME)
+        self.checkpoint_key = calc_checkpoint_key(checkpoint_params)
+
+    def load(self):
+        """チェックポイントを読み込む
+
+        Returns:
+            dict | None: save() で保存した状態。チェックポイントが無い、またはパラメータが異なる場合はNone
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            print(f"Warning: チェックポイントを読み込めないため、最初から実行します。: {self.checkpoint_path}")
+            return None
+        if checkpoint.get('key') != self.checkpoint_key:
+            print("Warning: チェックポイントとパラメータが異なるため、最初から実行します。")
+            return None
+        return checkpoint['state']
+
+    def save(self, state):
+        """チェックポイントを保存する
+
+        Args:
+            state (dict): 再開に必要な状態 (pickle で保存できること)
+        """
+        # 書き込み中に中断されても壊れないように、一時ファイルに書いてから置き換える
+        tmp_path = f'{self.checkpoint_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'key': self.checkpoint_key, 'state': state}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def remove(self):
+        """チェックポイントを削除する (全フレームの処理が終わった場合)"""
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
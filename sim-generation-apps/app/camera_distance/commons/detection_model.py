@@ -0,0 +1,148 @@
+# 検出(結果の detections の要素)のキー
+DETECTION_KEYS = (
+    "obj_id",
+    "detection_point",
+    "distance",
+    "angle",
+    "world_coordinate",
+    "latitude",
+    "longitude",
+    "velocity",
+    "yaw",
+    "interpolation_type",
+    "road_correction",
+)
+_DETECTION_KEY_SET = frozenset(DETECTION_KEYS)
+
+# キーの順序 (同じ順序のタプルを検出間で共有する)
+_key_orders = {}
+
+
+class _Missing:
+    """キーが無いことを表す値"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+    def __bool__(self):
+        return False
+
+
+MISSING = _Missing()
+
+
+class Detection:
+    """1つの検出 (結果の detections の要素)
+
+    DETECTION_KEYS のキーを属性として持つ (キーが無い場合は MISSING)。それ以外のキーは extra に保持する (無い場合はNone)。
+    キーの順序を保持し、属性に値を設定した場合は辞書にキーを追加した場合と同じく末尾に追加する
+    (MISSING を設定した場合はキーを削除する)。to_dict では作成時の辞書と同じ順序の辞書を返す。
+
+    各ステップは結果を読み込んだ後に from_results で検出を Detection に置き換えて処理し、
+    保存する前に to_results で辞書に戻す。
+    """
+
+    __slots__ = DETECTION_KEYS + ("extra", "_keys")
+
+    def __init__(self, **values):
+        """
+        Args:
+            values: 検出のキーと値 (キーの順序を保持する)
+        """
+        keys = tuple(key for key, value in values.items() if value is not MISSING)
+        object.__setattr__(self, "_keys", _key_orders.setdefault(keys, keys))
+        for key in DETECTION_KEYS:
+            object.__setattr__(self, key, values.pop(key, MISSING))
+        object.__setattr__(self, "extra", values or None)
+
+    def __setattr__(self, name, value):
+        if name in _DETECTION_KEY_SET:
+            keys = None
+            if value is MISSING:
+                keys = tuple(key for key in self._keys if key != name)
+            elif name not in self._keys:
+                keys = self._keys + (name,)
+            if keys is not None:
+                object.__setattr__(self, "_keys", _key_orders.setdefault(keys, keys))
+        object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_dict(cls, detection):
+        """辞書から検出を作成する
+
+        Args:
+            detection (dict): 検出
+
+        Returns:
+            Detection: 検出
+        """
+        obj = cls.__new__(cls)
+        keys = tuple(detection)
+        _set_keys(obj, _key_orders.setdefault(keys, keys))
+        get = detection.get
+        for set_value, key in _SLOT_SETTERS:
+            set_value(obj, get(key, MISSING))
+        if _DETECTION_KEY_SET.issuperset(keys):
+            _set_extra(obj, None)
+        else:
+            _set_extra(obj, {key: value for key, value in detection.items() if key not in _DETECTION_KEY_SET})
+        return obj
+
+    def to_dict(self):
+        """辞書に変換する
+
+        Returns:
+            dict: 検出 (値が MISSING のキーは含めない)
+        """
+        detection = {}
+        extra = self.extra or {}
+        for key in self._keys:
+            value = getattr(self, key) if key in _DETECTION_KEY_SET else extra.get(key, MISSING)
+            if value is not MISSING:
+                detection[key] = value
+        for key, value in extra.items():
+            # keys added to extra after creation
+            if key not in detection:
+                detection[key] = value
+        return detection
+
+    @staticmethod
+    def from_results(results):
+        """結果の検出(辞書)を Detection に置き換える
+
+        Args:
+            results (list): 結果 ("detections" を持つ辞書) のリスト
+
+        Returns:
+            list: 検出を置き換えた results
+        """
+        from_dict = Detection.from_dict
+        for result in results:
+            if "detections" in result:
+                result["detections"] = [from_dict(detection) for detection in result["detections"]]
+        return results
+
+    @staticmethod
+    def to_results(results):
+        """結果の検出(Detection)を辞書に戻す (from_results の逆の変換)
+
+        Args:
+            results (list): from_results で検出を置き換えた結果のリスト
+
+        Returns:
+            list: 検出を辞書に戻した results
+        """
+        for result in results:
+            if "detections" in result:
+                result["detections"] = [detection.to_dict() for detection in result["detections"]]
+        return results
+
+    def __repr__(self):
+        return f"Detection({self.to_dict()!r})"
+
+
+# setters of slots (faster than setattr in from_dict)
+_SLOT_SETTERS = [(Detection.__dict__[key].__set__, key) for key in DETECTION_KEYS]
+_set_keys = Detection.__dict__["_keys"].__set__
+_set_extra = Detection.__dict__["extra"].__set__
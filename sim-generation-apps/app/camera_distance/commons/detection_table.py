@@ -0,0 +1,97 @@
+import numpy as np
+
+# 検出の構造化配列の型 (座標の要素が無い場合、値が無い場合はNaN)
+DETECTION_DTYPE = np.dtype([
+    ("row", np.int64),  # 検出の列 (load_result_columns で読み込んだもの) の行
+    ("result_index", np.int64),  # 結果のインデックス
+    ("frame", np.int64),
+    ("obj_id", np.int64),
+    ("prev_row", np.int64),  # 前の結果にある同じ物体の直近の検出の行 (TrackIndex.find_prev と同じ、無い場合は-1)
+    ("world_coordinate", np.float64, 3),
+    ("velocity", np.float64),
+    ("yaw", np.float64),
+])
+
+# DetectionTable.get_column_values で結果に書き戻せる列
+UPDATABLE_FIELDS = ("velocity", "yaw")
+
+
+def _get_coords(values):
+    coords = np.full((len(values), 3), np.nan)
+    lengths = {-1 if value is None else len(value) for value in values}
+    if len(lengths) == 1 and 0 < min(lengths) <= 3:
+        # all coordinates have the same number of elements
+        coords[:, :min(lengths)] = values
+        return coords
+    for ii, value in enumerate(values):
+        if value:
+            value = value[:3]
+            coords[ii, :len(value)] = value
+    return coords
+
+
+class DetectionTable:
+    """全物体の検出をまとめた構造化配列 (DETECTION_DTYPE、1行が1つの検出)
+
+    TrackIndex の索引と検出の列 (load_result_columns で読み込んだもの) から作成し、
+    行は物体ごと(TrackIndex の順)に、物体内は結果の順に並べる。
+    world_coordinate は検出の列から読み込み、velocity、yaw は値が無い(NaN)状態で作成する。
+    配列で計算した値は get_column_values で update_result_columns に渡す形式にして結果に書き戻す。
+    """
+
+    __slots__ = ("track_index", "data")
+
+    def __init__(self, track_index, detection_columns):
+        """
+        Args:
+            track_index (TrackIndex): 検出の索引
+            detection_columns (dict): 検出の列 ("result_index"、"world_coordinate" を持つもの)
+        """
+        self.track_index = track_index
+        obj_ids = track_index.obj_ids()
+        tracks = [track_index.get_track(obj_id) for obj_id in obj_ids]
+        lengths = [len(frames) for frames, _, _ in tracks]
+
+        data = np.zeros(sum(lengths), dtype=DETECTION_DTYPE)
+        if len(data):
+            data["frame"] = np.concatenate([frames for frames, _, _ in tracks])
+            data["result_index"] = np.concatenate([result_idxes for _, result_idxes, _ in tracks])
+            # row in detection columns (first row of the result + index of detection in the result)
+            data["row"] = np.searchsorted(detection_columns["result_index"], data["result_index"]) + np.concatenate(
+                [detection_idxes for _, _, detection_idxes in tracks])
+            data["obj_id"] = np.repeat(obj_ids, lengths)
+            # previous detection of same obj_id (row of track start + position in track)
+            track_starts = np.cumsum([0] + lengths[:-1])
+            prev_positions = [track_index.get_prev_positions(obj_id) for obj_id in obj_ids]
+            data["prev_row"] = np.concatenate([
+                np.where(positions >= 0, start + positions, -1)
+                for start, positions in zip(track_starts, prev_positions)
+            ])
+
+        world_coordinates = detection_columns["world_coordinate"]
+        data["world_coordinate"] = _get_coords([world_coordinates[row] for row in data["row"].tolist()])
+        data["velocity"] = np.nan
+        data["yaw"] = np.nan
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_column_values(self, fields, rows=None):
+        """配列の値を update_result_columns で結果に書き戻す形式にする
+
+        Args:
+            fields (list): 書き戻す列 (UPDATABLE_FIELDS)
+            rows (np.ndarray): 書き戻す行のインデックス (Noneの場合は全ての行)
+
+        Returns:
+            dict: {列: (検出の列の行のインデックスのリスト, 値のリスト)}
+        """
+        rows = np.arange(len(self.data)) if rows is None else np.asarray(rows)
+        data = self.data[rows]
+        values = {}
+        for name in fields:
+            if name not in UPDATABLE_FIELDS:
+                raise ValueError(f"field cannot be updated: {name}")
+            values[name] = (data["row"].tolist(), data[name].tolist())
+        return values
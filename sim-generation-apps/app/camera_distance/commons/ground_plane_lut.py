@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from commons.relative_coord import calc_ground_coords, calc_relative_coords
+
+# テーブルの形式、または計算方法を変更した場合は値を上げる (古いテーブルは使用しなくなる)
+GROUND_PLANE_LUT_VERSION = 2
+
+# テーブルの各チャンネル
+LUT_CHANNELS = ("tan_psi_x", "tan_psi_y")
+
+
+class GroundPlaneLUT:
+    """画素(x, y)ごとの水平方向角ψx・垂直方向角ψyの正接のルックアップテーブル (float64)
+
+    画像の解像度、水平視野角、射影方式が同じであれば画素から角度への変換は固定のため、全画素分を1度だけ計算し、
+    検出ごとの角度の計算を配列の参照(周囲4点の双線形補間)に置き換える。距離は補間した角度から calc_ground_coords で計算する。
+    (距離は地平線付近で 1/tan(ψy - 仰角) に従って急増するため、距離を直接補間すると遠方・地平線付近の誤差が大きくなる。
+    tanψ は中心射影方式では画素に対して線形のため、calc_relative_coords と丸め誤差の範囲で一致する。
+    等距離射影方式では、1920×1080、θ=120、高さ1.2m、仰角-3〜2度の 100m 以内で直線距離の相対誤差は 3e-6 未満)
+    矩形の下端は画像の下端(y = h)になり得るため、テーブルは整数座標 0〜w、0〜h の (h+1)×(w+1) とする。
+    cache_dir を指定した場合は、テーブルのパラメータをキーとしてファイルに保存し、
+    同じパラメータのテーブルは計算せずにメモリマップで読み込む。
+    """
+
+    def __init__(
+        self,
+        image_size,
+        theta,
+        camera_elevation_angle,
+        camera_height,
+        proj_mode,
+        cache_dir=None,
+    ):
+        """
+        Args:
+            image_size (Tuple[int, int]): 画像の解像度(w, h)
+            theta (float): 水平視野角θの値(degrees)
+            camera_elevation_angle (float): カメラの仰角(degrees)
+            camera_height (float): カメラの高さ
+            proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
+            cache_dir (str): テーブルの保存先フォルダ (Noneの場合はファイルに保存しない)
+        """
+        self.image_size = tuple(int(v) for v in image_size)
+        self.theta = theta
+        self.camera_elevation_angle = camera_elevation_angle
+        self.camera_height = camera_height
+        self.proj_mode = proj_mode
+        self.cache_dir = cache_dir
+        self.table = self.load_table()
+
+    def get_cache_path(self):
+        """テーブルの保存先ファイルパス (角度はカメラの仰角・高さによらないため、キーに含めない)"""
+        params = [
+            GROUND_PLANE_LUT_VERSION,
+            self.image_size,
+            self.theta,
+            self.proj_mode,
+        ]
+        key = hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()
+        w, h = self.image_size
+        return os.path.join(self.cache_dir, f"ground_plane_lut_{key}_{w}x{h}.npy")
+
+    def build_table(self):
+        """全画素の角度を計算する
+
+        Returns:
+            np.ndarray: (チャンネル, h+1, w+1)のテーブル (チャンネルは LUT_CHANNELS の順)
+        """
+        w, h = self.image_size
+        ys, xs = np.mgrid[0:h + 1, 0:w + 1].astype(np.float64)
+        _, _, _, psi_x, psi_y = calc_relative_coords(
+            xs, ys, self.image_size, self.theta, self.camera_elevation_angle, self.camera_height, self.proj_mode
+        )
+        table = np.stack([np.tan(psi_x), np.tan(psi_y)])
+        # equidistant projection is 0/0 at image center, where both angles are 0
+        return np.nan_to_num(table, nan=0.0)
+
+    def load_table(self):
+        """テーブルを取得する (保存済みの場合はメモリマップで読み込み、無い場合は計算する)"""
+        cache_path = None
+        if self.cache_dir is not None:
+            cache_path = self.get_cache_path()
+            if os.path.exists(cache_path):
+                try:
+                    table = np.load(cache_path, mmap_mode="r")
+                    if table.shape == (len(LUT_CHANNELS), self.image_size[1] + 1, self.image_size[0] + 1):
+                        print(f"Loaded ground plane LUT: {cache_path}")
+                        return table
+                except (OSError, ValueError):
+                    pass
+                print(f"Warning: 相対座標のテーブルを読み込めないため、作成し直します。: {cache_path}")
+
+        table = self.build_table()
+        if cache_path is not None:
+            # 複数ジョブから同時に書き込まれても壊れないように、一時ファイルに書いてから置き換える
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp_path, cache_path)
+            print(f"Saved ground plane LUT: {cache_path}")
+            table = np.load(cache_path, mmap_mode="r")
+        return table
+
+    def lookup(self, xs, ys):
+        """座標(複数)の相対座標を求める (角度はテーブルから整数座標の間を双線形補間し、距離は角度から計算する)
+
+        Args:
+            xs (np.ndarray): 検出車矩形の中央下部のx座標(ピクセル)
+            ys (np.ndarray): 検出車矩形の中央下部のy座標(ピクセル)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+                calc_relative_coords と同じ (カメラ座標系の横方向距離dx、奥行き方向距離dy、直線距離d、
+                水平方向角ψx(radians)、垂直方向角ψy(radians))
+        """
+        w, h = self.image_size
+        xs = np.clip(np.asarray(xs, dtype=np.float64), 0, w)
+        ys = np.clip(np.asarray(ys, dtype=np.float64), 0, h)
+        x0 = np.minimum(np.floor(xs).astype(np.intp), w - 1)
+        y0 = np.minimum(np.floor(ys).astype(np.intp), h - 1)
+        fx = xs - x0
+        fy = ys - y0
+
+        # 周囲4点 (チャンネル, 検出数)
+        v00 = self.table[:, y0, x0]
+        v01 = self.table[:, y0, x0 + 1]
+        v10 = self.table[:, y0 + 1, x0]
+        v11 = self.table[:, y0 + 1, x0 + 1]
+        tan_psi_x, tan_psi_y = (v00 * (1 - fx) + v01 * fx) * (1 - fy) + (v10 * (1 - fx) + v11 * fx) * fy
+        psi_x = np.arctan(tan_psi_x)
+        psi_y = np.arctan(tan_psi_y)
+
+        dx, dy, d = calc_ground_coords(tan_psi_x, psi_y, self.camera_elevation_angle, self.camera_height)
+        return dx, dy, d, psi_x, psi_y
@@ -0,0 +1,210 @@
+import json
+import os
+
+import numpy as np
+
+from commons.detection_cache import calc_file_hash
+from cvt_lat_long_cartesian import calc_org_lat_long, convert_cartesian_to_lat_long_array
+
+# サイドカーの形式、または変換方法を変更した場合は値を上げる (古いサイドカーは作成し直す)
+LANE_GEOMETRY_VERSION = 2
+
+# サイドカーのファイル名の接尾辞 (レーン座標のjsonファイルと同じフォルダに保存する)
+LANE_GEOMETRY_SUFFIX = "_lane_geometry.npz"
+
+
+def get_lane_geometry_path(input_json_path):
+    """レーン座標のjsonファイルに対応するサイドカーのファイルパス
+
+    Args:
+        input_json_path (str): レーン座標のjsonファイルパス
+
+    Returns:
+        str: サイドカーのファイルパス
+    """
+    return os.path.splitext(input_json_path)[0] + LANE_GEOMETRY_SUFFIX
+
+
+class LaneGeometry:
+    """緯度・経度、および世界座標に変換済みのレーン座標 (全レーンの頂点を1つの配列に連結して保持する)
+
+    レーン i の頂点は coords[lane_offsets[i]:lane_offsets[i + 1]] となる。
+    """
+
+    def __init__(self, epsg, map_offset, road_ids, lane_ids, lane_offsets, coords, world_coords, source_hash):
+        """
+        Args:
+            epsg (str): EPSGコード
+            map_offset (list): 座標系原点のオフセット
+            road_ids (np.ndarray): レーンごとの道路ID (L,)
+            lane_ids (np.ndarray): レーンごとのレーンID (L,)
+            lane_offsets (np.ndarray): レーンごとの頂点の開始位置 (L+1,)
+            coords (np.ndarray): 全レーンの頂点(緯度, 経度, z) (V, 3)
+            world_coords (np.ndarray): 全レーンの頂点の世界座標(x, y, z) (座標系原点のオフセットを加えたもの) (V, 3)
+            source_hash (str): 変換元のjsonファイルのハッシュ値
+        """
+        self.epsg = epsg
+        self.map_offset = map_offset
+        self.road_ids = road_ids
+        self.lane_ids = lane_ids
+        self.lane_offsets = lane_offsets
+        self.coords = coords
+        self.world_coords = world_coords
+        self.source_hash = source_hash
+
+    @classmethod
+    def from_json(cls, input_json_path, source_hash):
+        """レーン座標のjsonファイルを読み込み、全頂点を緯度・経度に変換する
+
+        Args:
+            input_json_path (str): レーン座標のjsonファイルパス
+            source_hash (str): jsonファイルのハッシュ値
+
+        Returns:
+            LaneGeometry: 変換済みのレーン座標
+        """
+        with open(input_json_path, "r", encoding="utf-8", errors="ignore") as f:
+            data = json.load(f)
+
+        road_ids = []
+        lane_ids = []
+        counts = []
+        vertices = []
+        for road in data["roads"]:
+            for lane in road["lanes"]:
+                road_ids.append(road["id"])
+                lane_ids.append(lane["lane_id"])
+                counts.append(len(lane["coordinate"]))
+                vertices.extend(lane["coordinate"])
+
+        map_offset = data["map_offset"]
+        world_coords = np.array(vertices, dtype=np.float64).reshape(-1, 3)
+        world_coords[:, 0] += map_offset[0]
+        world_coords[:, 1] += map_offset[1]
+
+        phi0_deg, lambda0_deg, _ = calc_org_lat_long(epsg_code=data["EPSG"])
+        # 世界座標(x, y)は平面直角座標系の(y, x)
+        lat, long = convert_cartesian_to_lat_long_array(
+            world_coords[:, 1], world_coords[:, 0], phi0_deg, lambda0_deg)
+        coords = np.column_stack([lat, long, world_coords[:, 2]])
+
+        return cls(
+            data["EPSG"],
+            map_offset,
+            np.array(road_ids, dtype=str),
+            np.array(lane_ids, dtype=str),
+            np.concatenate([[0], np.cumsum(counts, dtype=np.int64)]),
+            coords,
+            world_coords,
+            source_hash,
+        )
+
+    @classmethod
+    def load(cls, sidecar_path):
+        """サイドカーを読み込む
+
+        Args:
+            sidecar_path (str): サイドカーのファイルパス
+
+        Returns:
+            LaneGeometry: 変換済みのレーン座標
+
+        Raises:
+            OSError, ValueError, KeyError: サイドカーを読み込めない場合
+        """
+        with np.load(sidecar_path, allow_pickle=False) as sidecar:
+            if int(sidecar["version"]) != LANE_GEOMETRY_VERSION:
+                raise ValueError(f"unsupported lane geometry version: {int(sidecar['version'])}")
+            return cls(
+                str(sidecar["epsg"]),
+                sidecar["map_offset"].tolist(),
+                sidecar["road_ids"],
+                sidecar["lane_ids"],
+                sidecar["lane_offsets"],
+                sidecar["coords"],
+                sidecar["world_coords"],
+                str(sidecar["source_hash"]),
+            )
+
+    def save(self, sidecar_path):
+        """サイドカーを保存する
+
+        Args:
+            sidecar_path (str): サイドカーのファイルパス
+        """
+        # 複数ジョブから同時に書き込まれても壊れないように、一時ファイルに書いてから置き換える
+        tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(LANE_GEOMETRY_VERSION),
+                epsg=np.array(self.epsg, dtype=str),
+                map_offset=np.array(self.map_offset, dtype=np.float64),
+                road_ids=self.road_ids,
+                lane_ids=self.lane_ids,
+                lane_offsets=self.lane_offsets,
+                coords=self.coords,
+                world_coords=self.world_coords,
+                source_hash=np.array(self.source_hash, dtype=str),
+            )
+        os.replace(tmp_path, sidecar_path)
+
+    def to_road_data(self, world=False):
+        """レーン座標のjsonと同じ構造(EPSG, map_offset, roads)の辞書に変換する
+
+        roads には補正処理で使用する道路ID、レーンID、頂点座標のみを含める。
+
+        Args:
+            world (bool): 頂点座標を世界座標(x, y, z)とするかどうか (Falseの場合は(緯度, 経度, z))
+
+        Returns:
+            dict: 変換済みのレーン座標
+        """
+        coords = (self.world_coords if world else self.coords).tolist()
+        offsets = self.lane_offsets.tolist()
+        roads = []
+        for ii, (road_id, lane_id) in enumerate(zip(self.road_ids.tolist(), self.lane_ids.tolist())):
+            if not roads or roads[-1]["id"] != road_id:
+                roads.append({"id": road_id, "lanes": []})
+            roads[-1]["lanes"].append({
+                "lane_id": lane_id,
+                "coordinate": coords[offsets[ii]:offsets[ii + 1]],
+            })
+        return {
+            "EPSG": self.epsg,
+            "map_offset": self.map_offset,
+            "roads": roads,
+        }
+
+
+def load_lane_geometry(input_json_path):
+    """緯度・経度に変換済みのレーン座標を取得する
+
+    jsonファイルと同じフォルダのサイドカーが同じ内容のjsonファイルから作成されたものであれば読み込み、
+    無い場合、またはjsonファイルが更新されている場合は変換してサイドカーに保存する。
+
+    Args:
+        input_json_path (str): レーン座標のjsonファイルパス
+
+    Returns:
+        LaneGeometry: 変換済みのレーン座標
+    """
+    sidecar_path = get_lane_geometry_path(input_json_path)
+    source_hash = calc_file_hash(input_json_path)
+    if os.path.exists(sidecar_path):
+        try:
+            geometry = LaneGeometry.load(sidecar_path)
+            if geometry.source_hash == source_hash:
+                print(f"Loaded lane geometry: {sidecar_path}")
+                return geometry
+        except (OSError, ValueError, KeyError):
+            pass
+        print(f"Warning: レーン座標のサイドカーが古い、または読み込めないため、作成し直します。: {sidecar_path}")
+
+    geometry = LaneGeometry.from_json(input_json_path, source_hash)
+    try:
+        geometry.save(sidecar_path)
+        print(f"Saved lane geometry: {sidecar_path}")
+    except OSError as e:
+        print(f"Warning: レーン座標のサイドカーを保存できません。: {sidecar_path} ({e})")
+    return geometry
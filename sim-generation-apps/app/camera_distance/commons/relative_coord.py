@@ -0,0 +1,121 @@
+import numpy as np
+
+# 射影方式
+PROJ_MODE_CENTER = 0        # 中心射影方式
+PROJ_MODE_EQUIDISTANT = 1   # 等距離射影方式
+
+
+def calc_vertical_aov(image_size, theta, proj_mode):
+    """垂直視野角Φを計算する
+
+    Args:
+        image_size (Tuple[int, int]): 画像の解像度(w, h)
+        theta (float): 水平視野角θの値(degrees)
+        proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
+
+    Returns:
+        float: 垂直視野角Φ(radians)
+    """
+    w, h = image_size
+    theta_rad = np.radians(theta)
+    if proj_mode == PROJ_MODE_EQUIDISTANT:
+        return theta_rad * (h / w)
+    return 2 * np.arctan((h / w) * np.tan(theta_rad / 2))
+
+
+def calc_relative_coords(
+    xs,
+    ys,
+    image_size,
+    theta,
+    camera_elevation_angle,
+    camera_height,
+    proj_mode,
+):
+    """検出車矩形の中央下部の座標(複数)から、対象の相対座標をまとめて計算する
+
+    画像は読み込まず、画像の解像度のみを使用する。
+
+    Args:
+        xs (np.ndarray): 検出車矩形の中央下部のx座標(ピクセル)
+        ys (np.ndarray): 検出車矩形の中央下部のy座標(ピクセル)
+        image_size (Tuple[int, int]): 画像の解像度(w, h)
+        theta (float): 水平視野角θの値(degrees)
+        camera_elevation_angle (float): カメラの仰角(degrees)
+        camera_height (float): カメラの高さ
+        proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            カメラ座標系の横方向距離dx、奥行き方向距離dy、直線距離d、水平方向角ψx(radians)、垂直方向角ψy(radians)
+    """
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    w, h = image_size
+    cx, cy = w / 2, h / 2
+    theta_rad = np.radians(theta)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if proj_mode == PROJ_MODE_EQUIDISTANT:
+            # 対象点と画像中心の距離
+            dist_to_center = np.sqrt((xs - cx)**2 + (ys - cy)**2)
+            # 対象点への対角方向角
+            psi_xy = dist_to_center / w * theta_rad
+            # 奥行きピクセル距離
+            ptemp = dist_to_center * (1 / np.tan(psi_xy))
+            # 対象点への水平方向角、垂直方向角
+            psi_x = np.arctan((xs - cx) / ptemp)
+            psi_y = np.arctan((ys - cy) / ptemp)
+            tan_psi_x = np.tan(psi_x)
+        else:
+            # 車を検出したときの下向きの視点の角度ψy
+            phi = calc_vertical_aov(image_size, theta, proj_mode)
+            tan_psi_y = ((ys - cy) / cy) * np.tan(phi / 2)
+            psi_y = np.arctan(tan_psi_y)
+            # 水平方向の視点の角度ψx
+            tan_psi_x = ((xs - cx) / cx) * np.tan(theta_rad / 2)
+            psi_x = np.arctan(tan_psi_x)
+
+    dx, dy, d = calc_ground_coords(tan_psi_x, psi_y, camera_elevation_angle, camera_height)
+
+    return dx, dy, d, psi_x, psi_y
+
+
+def calc_ground_coords(tan_psi_x, psi_y, camera_elevation_angle, camera_height):
+    """対象への水平方向角・垂直方向角から、地面上の対象の相対座標を計算する
+
+    Args:
+        tan_psi_x (np.ndarray): 水平方向角ψxの正接
+        psi_y (np.ndarray): 垂直方向角ψy(radians)
+        camera_elevation_angle (float): カメラの仰角(degrees)
+        camera_height (float): カメラの高さ
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: カメラ座標系の横方向距離dx、奥行き方向距離dy、直線距離d
+    """
+    camera_elevation_angle_rad = np.radians(camera_elevation_angle)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 奥行き方向の距離、横方向の距離
+        dy = camera_height / np.tan(psi_y - camera_elevation_angle_rad)
+        dx = dy * tan_psi_x
+
+    # 車までの直線距離
+    d = np.sqrt(dx * dx + dy * dy)
+
+    return dx, dy, d
+
+
+def calc_direction_coords(d, psi_x, camera_horizontal_angle):
+    """カメラ座標系の距離・角度から、進行方向に対する dx、dy を計算する
+
+    Args:
+        d (np.ndarray): 直線距離
+        psi_x (np.ndarray): 水平方向角ψx(radians)
+        camera_horizontal_angle (float): 進行方向とカメラの水平方向とのなす角度(degrees)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 進行方向に対する横方向距離dx、前方向距離dy
+    """
+    angle = np.asarray(psi_x) + np.radians(camera_horizontal_angle)
+    return d * np.sin(angle), d * np.cos(angle)
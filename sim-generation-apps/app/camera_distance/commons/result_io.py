@@ -0,0 +1,229 @@
+import json
+import os
+
+import numpy as np
+
+from commons.constants import ABS_COORD_JSON_FILE_NAME, ABS_COORD_STORE_FILE_NAME
+from commons.result_stream import is_result_stream_path, iter_result_stream, load_result_stream, save_result_stream
+from commons.trajectory_store import (
+    is_trajectory_store_path,
+    load_trajectory_columns,
+    load_trajectory_store,
+    save_trajectory_store,
+    update_trajectory_columns,
+)
+
+# 結果ファイルの形式 (json: jsonファイル、npz: 列形式の軌跡データ、jsonl: フレームごとの結果(JSON Lines))
+RESULT_FORMAT_JSON = "json"
+RESULT_FORMAT_STORE = "npz"
+RESULT_FORMAT_STREAM = "jsonl"
+RESULT_FORMATS = [RESULT_FORMAT_JSON, RESULT_FORMAT_STORE]
+# 相対座標の結果ファイル(detection_distance_result)の形式
+REL_COORD_FORMATS = [RESULT_FORMAT_JSON, RESULT_FORMAT_STREAM]
+
+# パイプライン実行時にステップ間で結果を受け渡すためのメモリキャッシュ
+# (None の場合はキャッシュ無効。各スクリプトを単体で実行した場合と同じ動作になる)
+_memory_cache = None
+
+
+def enable_memory_cache():
+    """結果jsonのメモリキャッシュを有効にする
+
+    有効にすると、save_result_json で書き込んだ結果は同一プロセス内で保持され、
+    以降の load_result_json ではファイルを読み直さずにその結果を返す。
+    """
+    global _memory_cache
+    if _memory_cache is None:
+        _memory_cache = {}
+
+
+def disable_memory_cache():
+    """結果jsonのメモリキャッシュを無効にし、保持している結果を破棄する"""
+    global _memory_cache
+    _memory_cache = None
+
+
+def get_result_format(file_path: str):
+    """結果ファイルの形式を拡張子から判定する
+
+    Args:
+        file_path (str): 結果ファイルパス
+
+    Returns:
+        str: 結果ファイルの形式 (RESULT_FORMATS)
+    """
+    if is_trajectory_store_path(file_path):
+        return RESULT_FORMAT_STORE
+    if is_result_stream_path(file_path):
+        return RESULT_FORMAT_STREAM
+    return RESULT_FORMAT_JSON
+
+
+def get_abs_coord_file_name(result_format: str):
+    """車両座標の結果ファイル名
+
+    Args:
+        result_format (str): 結果ファイルの形式 (RESULT_FORMATS)
+
+    Returns:
+        str: 結果ファイル名
+    """
+    return ABS_COORD_STORE_FILE_NAME if result_format == RESULT_FORMAT_STORE else ABS_COORD_JSON_FILE_NAME
+
+
+def load_result_json(file_path: str, for_update: bool = False):
+    """結果jsonファイルを読み込む
+
+    拡張子が .npz の場合は列形式の軌跡データ、.jsonl の場合はフレームごとの結果として読み込む。
+    for_update=True の場合は、返した結果を呼び出し元で直接変更してよい (コピーは作成しない)。
+    メモリキャッシュからは取り出して削除するため、変更した結果は save_result_json で保存すること。
+    (保存前に異常終了した場合も、以降の読み込みでは変更前のファイルを読み込む)
+
+    Args:
+        file_path (str): 結果jsonファイルパス
+        for_update (bool): 結果を直接変更するかどうか
+
+    Returns:
+        dict: 結果データ
+    """
+    key = os.path.abspath(file_path)
+    if _memory_cache is not None and key in _memory_cache:
+        return _memory_cache.pop(key) if for_update else _memory_cache[key]
+
+    result_format = get_result_format(file_path)
+    if result_format == RESULT_FORMAT_STORE:
+        data = load_trajectory_store(file_path)
+    elif result_format == RESULT_FORMAT_STREAM:
+        data = load_result_stream(file_path)
+    else:
+        with open(file_path, mode='r', encoding='utf-8', errors='ignore') as f:
+            data = json.load(f)
+
+    if _memory_cache is not None and not for_update:
+        _memory_cache[key] = data
+    return data
+
+
+def save_result_json(file_path: str, data: dict):
+    """結果jsonファイルを書き込む
+
+    メモリキャッシュが有効な場合もファイルへは必ず書き込む。
+    (途中のステップから再開する場合に、前ステップの結果をファイルから読み込めるようにするため)
+    拡張子が .npz の場合は列形式の軌跡データ、.jsonl の場合はフレームごとの結果として書き込む。
+
+    Args:
+        file_path (str): 結果jsonファイルパス
+        data (dict): 結果データ
+    """
+    result_format = get_result_format(file_path)
+    if result_format == RESULT_FORMAT_STORE:
+        save_trajectory_store(file_path, data)
+    elif result_format == RESULT_FORMAT_STREAM:
+        save_result_stream(file_path, data)
+    else:
+        with open(file_path, mode='w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    if _memory_cache is not None:
+        _memory_cache[os.path.abspath(file_path)] = data
+
+
+def iter_result_records(file_path: str):
+    """結果ファイルの results の要素を1フレームずつ返す
+
+    拡張子が .jsonl の場合はファイルから1行ずつ読み込むため、フレーム数によらずメモリ使用量は一定となる。
+    それ以外の形式の場合は load_result_json で読み込んだ結果を返す。
+
+    Args:
+        file_path (str): 結果ファイルパス
+
+    Yields:
+        dict: results の要素
+    """
+    key = os.path.abspath(file_path)
+    if get_result_format(file_path) == RESULT_FORMAT_STREAM and (_memory_cache is None or key not in _memory_cache):
+        yield from iter_result_stream(file_path)
+    else:
+        yield from load_result_json(file_path)["results"]
+
+
+def _get_record_columns(records, keys):
+    """辞書のリストから列の値を取り出す (キーが無い行はNone)"""
+    columns = {}
+    for key in keys:
+        values = records
+        for part in key.split("."):
+            values = [value.get(part) if isinstance(value, dict) else None for value in values]
+        columns[key] = values
+    return columns
+
+
+def _set_record_columns(records, values):
+    """辞書のリストの指定した行の値を更新する (update_result_columns と同じ形式)"""
+    for key, (rows, column_values) in values.items():
+        *parents, name = key.split(".")
+        for row, value in zip(rows, column_values):
+            record = records[row]
+            for part in parents:
+                record = record[part]
+            record[name] = value
+
+
+def load_result_columns(file_path: str, frame_keys=(), detection_keys=()):
+    """結果ファイルから指定した列のみを読み込む
+
+    拡張子が .npz の場合は指定した列の配列のみを読み込み、結果(辞書)には復元しない。
+    それ以外の形式の場合、またはメモリキャッシュに結果がある場合は、結果から列の値を取り出す。
+
+    Args:
+        file_path (str): 結果ファイルパス
+        frame_keys (list): 読み込むフレーム(results の要素)の列のキー (入れ子の辞書のキーは "self.latitude" のように "." で区切る)
+        detection_keys (list): 読み込む検出の列のキー (同上)
+
+    Returns:
+        Tuple[dict, dict]: フレームの列、検出の列 ({キー: 行ごとの値のリスト (キーが無い行はNone)})
+            検出の列は全フレームの検出を連結した順とし、各検出の結果のインデックス "result_index" (np.ndarray) を含む
+    """
+    key = os.path.abspath(file_path)
+    if get_result_format(file_path) == RESULT_FORMAT_STORE and (_memory_cache is None or key not in _memory_cache):
+        return load_trajectory_columns(file_path, frame_keys, detection_keys)
+
+    results = load_result_json(file_path)["results"]
+    detections = [detection for result in results for detection in result.get("detections", [])]
+    detection_columns = _get_record_columns(detections, detection_keys)
+    detection_columns["result_index"] = np.repeat(
+        np.arange(len(results)), [len(result.get("detections", [])) for result in results])
+    return _get_record_columns(results, frame_keys), detection_columns
+
+
+def update_result_columns(file_path: str, frame_values=None, detection_values=None, output_path=None):
+    """結果ファイルの指定した列のみを更新する
+
+    入力・出力の拡張子が .npz の場合は更新する列の配列のみを書き換え、結果(辞書)には復元しない。
+    それ以外の形式の場合は結果を読み込んで更新し、save_result_json で保存する。
+    メモリキャッシュに結果がある場合は、キャッシュの結果も同じく更新する。
+
+    Args:
+        file_path (str): 結果ファイルパス
+        frame_values (dict): フレームの更新する列 {キー: (行のインデックスのリスト, 値のリスト)}
+            (キーは load_result_columns と同じ。行にキーが無い場合は追加する)
+        detection_values (dict): 検出の更新する列 (同上、行は全フレームの検出を連結した順)
+        output_path (str): 保存先のファイルパス (Noneの場合は file_path)
+    """
+    output_path = file_path if output_path is None else output_path
+    is_store = get_result_format(file_path) == RESULT_FORMAT_STORE and get_result_format(output_path) == RESULT_FORMAT_STORE
+    key = os.path.abspath(file_path)
+    data = None
+    if not is_store or (_memory_cache is not None and key in _memory_cache):
+        data = load_result_json(file_path, for_update=True)
+        results = data["results"]
+        _set_record_columns(results, frame_values or {})
+        _set_record_columns([detection for result in results for detection in result.get("detections", [])],
+                            detection_values or {})
+
+    if not is_store:
+        save_result_json(output_path, data)
+        return
+    update_trajectory_columns(file_path, frame_values, detection_values, output_path)
+    if data is not None:
+        _memory_cache[os.path.abspath(output_path)] = data
@@ -0,0 +1,213 @@
+import json
+import os
+
+# フレームごとの結果(JSON Lines)のファイルの拡張子
+RESULT_STREAM_EXT = ".jsonl"
+
+
+def is_result_stream_path(file_path):
+    """フレームごとの結果(JSON Lines)のファイルパスかどうか
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        bool: 拡張子が RESULT_STREAM_EXT の場合はTrue
+    """
+    return os.path.splitext(file_path)[1].lower() == RESULT_STREAM_EXT
+
+
+def _dump_line(value):
+    return json.dumps(value, ensure_ascii=False) + "\n"
+
+
+def _iter_lines(file_path):
+    """書き込みが完了した行(改行で終わる行)を読み込む
+
+    異常終了により書き込み途中となった末尾の行は読み込まない。
+
+    Yields:
+        Tuple[dict, int]: 行の値、行末までのバイト数
+    """
+    size = 0
+    with open(file_path, mode="rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            size += len(line)
+            yield json.loads(line.decode("utf-8", errors="ignore")), size
+
+
+class ResultStreamWriter:
+    """結果をフレームごとに JSON Lines で書き込む
+
+    1行目はヘッダー (results 以外のキー: camera_parameter 等)、2行目以降は results の要素を1行ずつ書き込む。
+    1行書き込むごとにフラッシュするため、異常終了した場合も書き込み済みのフレームはそのまま読み込める。
+    """
+
+    def __init__(self, file_path, resume=False):
+        """
+        Args:
+            file_path (str): 書き込み先のファイルパス
+            resume (bool):
+                Trueの場合は既存のファイルの続きから書き込む (書き込み途中の末尾の行は削除する)。
+                Falseの場合、またはファイルが無い場合は新規に書き込む
+        """
+        self.file_path = file_path
+        self.header = None
+        self.num_results = 0
+
+        size = 0
+        if resume and os.path.isfile(file_path):
+            for ii, (value, size) in enumerate(_iter_lines(file_path)):
+                if ii == 0:
+                    self.header = value
+                else:
+                    self.num_results += 1
+            self._file = open(file_path, mode="r+b")
+            self._file.truncate(size)
+            self._file.seek(size)
+        else:
+            self._file = open(file_path, mode="wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_line(self, value):
+        self._file.write(_dump_line(value).encode("utf-8"))
+        self._file.flush()
+
+    def write_header(self, header):
+        """ヘッダーを書き込む (最初のフレームの前に1度だけ書き込むこと)
+
+        Args:
+            header (dict): results 以外のキーの値 (camera_parameter 等)
+        """
+        if self.header is not None:
+            raise ValueError(f"header is already written: {self.file_path}")
+        self._write_line(header)
+        self.header = header
+
+    def write(self, result):
+        """1フレームの結果を書き込む
+
+        Args:
+            result (dict): results の要素
+        """
+        if self.header is None:
+            raise ValueError(f"header is not written: {self.file_path}")
+        self._write_line(result)
+        self.num_results += 1
+
+    def truncate(self, num_results):
+        """先頭から num_results フレームより後の結果を削除する (チェックポイント以降に書き込んだ結果を破棄する場合)
+
+        Args:
+            num_results (int): 残すフレーム数
+        """
+        self._file.flush()
+        size = 0
+        self.num_results = 0
+        for ii, (_, line_end) in enumerate(_iter_lines(self.file_path)):
+            if ii > num_results:
+                break
+            size = line_end
+            # first line is header
+            self.num_results = ii
+        self._file.truncate(size)
+        self._file.seek(size)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def load_result_stream_header(file_path):
+    """フレームごとの結果(JSON Lines)のヘッダーを読み込む
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        dict: ヘッダー (ヘッダーが無い場合は空の辞書)
+    """
+    for value, _ in _iter_lines(file_path):
+        return value
+    return {}
+
+
+def iter_result_stream(file_path):
+    """フレームごとの結果(JSON Lines)を1フレームずつ読み込む
+
+    Args:
+        file_path (str): ファイルパス
+
+    Yields:
+        dict: results の要素
+    """
+    for ii, (value, _) in enumerate(_iter_lines(file_path)):
+        if ii > 0:
+            yield value
+
+
+def load_result_stream(file_path):
+    """フレームごとの結果(JSON Lines)を結果データとして読み込む
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        dict: 結果データ (ヘッダーのキーと results)
+    """
+    data = dict(load_result_stream_header(file_path))
+    data["results"] = list(iter_result_stream(file_path))
+    return data
+
+
+def save_result_stream(file_path, data):
+    """結果データをフレームごとの結果(JSON Lines)として書き込む
+
+    Args:
+        file_path (str): 書き込み先のファイルパス
+        data (dict): 結果データ
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with ResultStreamWriter(tmp_path) as writer:
+        writer.write_header({key: value for key, value in data.items() if key != "results"})
+        for result in data["results"]:
+            writer.write(result)
+    os.replace(tmp_path, file_path)
+
+
+def _indent(text, level):
+    return text.replace("\n", "\n" + " " * level)
+
+
+def convert_result_stream_to_json(stream_file_path, json_file_path):
+    """フレームごとの結果(JSON Lines)を1フレームずつ読み込み、jsonファイルに書き込む
+
+    出力は結果データを json.dump(indent=2) で書き込んだ場合と同じになる。
+
+    Args:
+        stream_file_path (str): フレームごとの結果のファイルパス
+        json_file_path (str): 書き込み先のjsonファイルパス
+    """
+    tmp_path = f"{json_file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as f:
+        f.write("{")
+        for key, value in load_result_stream_header(stream_file_path).items():
+            f.write(f"\n  {json.dumps(key, ensure_ascii=False)}: ")
+            f.write(_indent(json.dumps(value, ensure_ascii=False, indent=2), 2) + ",")
+
+        f.write('\n  "results": [')
+        num_results = 0
+        for result in iter_result_stream(stream_file_path):
+            f.write(("," if num_results > 0 else "") + "\n    ")
+            f.write(_indent(json.dumps(result, ensure_ascii=False, indent=2), 4))
+            num_results += 1
+        f.write("\n  ]" if num_results > 0 else "]")
+        f.write("\n}")
+    os.replace(tmp_path, json_file_path)
@@ -0,0 +1,178 @@
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+class TrackIndex:
+    """物体(obj_id)ごとの検出の索引
+
+    物体ごとに、検出がある結果のインデックスと結果内の検出のインデックスを結果の順に保持する。
+    results[result_idxes[k]]["detections"][detection_idxes[k]] が物体の k 番目の検出となる。
+    索引は1度だけ作成し、検出を追加・削除する場合は append() / filter() で results と索引を同時に更新する。
+    """
+
+    def __init__(self, results):
+        """
+        Args:
+            results (list): 結果 ("frame", "detections" を持つ辞書、検出は Detection.from_results で置き換えたもの) のリスト
+        """
+        self.results = results
+        self._build()
+
+    @classmethod
+    def from_columns(cls, frames, result_idxes, obj_ids):
+        """結果の列 (load_result_columns で読み込んだもの) から索引を作成する
+
+        結果(辞書)を持たないため、get_detections()、append()、filter() は使用できない。
+
+        Args:
+            frames (list): 結果ごとのフレーム番号
+            result_idxes (np.ndarray): 検出ごとの結果のインデックス (全結果の検出を連結した順)
+            obj_ids (list): 検出ごとの物体ID (同上)
+
+        Returns:
+            TrackIndex: 検出の索引
+        """
+        track_index = cls.__new__(cls)
+        track_index.results = None
+        track_index._frames = list(frames)
+        track_index._tracks = {}
+        track_index._arrays = {}
+        prev_ii, jj = None, 0
+        for ii, obj_id in zip(np.asarray(result_idxes).tolist(), obj_ids):
+            jj = jj + 1 if ii == prev_ii else 0
+            prev_ii = ii
+            result_idxes_of_obj, detection_idxes = track_index._tracks.setdefault(obj_id, ([], []))
+            result_idxes_of_obj.append(ii)
+            detection_idxes.append(jj)
+        return track_index
+
+    def _build(self):
+        """results から索引を作成する"""
+        self._frames = [result["frame"] for result in self.results]
+        self._tracks = {}  # {obj_id: ([idx of frame in results, ...], [idx of detection in frame, ...])}
+        self._arrays = {}
+        for ii, result in enumerate(self.results):
+            for jj, detection in enumerate(result["detections"]):
+                result_idxes, detection_idxes = self._tracks.setdefault(detection.obj_id, ([], []))
+                result_idxes.append(ii)
+                detection_idxes.append(jj)
+
+    def __contains__(self, obj_id):
+        return obj_id in self._tracks
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def obj_ids(self):
+        """物体IDのリスト (最初に検出された順)"""
+        return list(self._tracks)
+
+    def get_track(self, obj_id):
+        """物体の検出の索引を取得する
+
+        Args:
+            obj_id (int): 物体ID
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: フレーム番号、結果のインデックス、検出のインデックス (それぞれ (K,))
+        """
+        if obj_id not in self._arrays:
+            result_idxes, detection_idxes = self._tracks[obj_id]
+            frames = np.array([self._frames[ii] for ii in result_idxes], dtype=np.int64)
+            self._arrays[obj_id] = (
+                frames,
+                np.array(result_idxes, dtype=np.int64),
+                np.array(detection_idxes, dtype=np.int64),
+            )
+        return self._arrays[obj_id]
+
+    def get_detections(self, obj_id):
+        """物体の検出のリストを取得する (結果の順)
+
+        Args:
+            obj_id (int): 物体ID
+
+        Returns:
+            list: 検出(Detection)のリスト
+        """
+        result_idxes, detection_idxes = self._tracks[obj_id]
+        return [self.results[ii]["detections"][jj] for ii, jj in zip(result_idxes, detection_idxes)]
+
+    def find(self, obj_id, result_idx):
+        """結果内の物体の検出のインデックスを求める
+
+        Args:
+            obj_id (int): 物体ID
+            result_idx (int): 結果のインデックス
+
+        Returns:
+            int: 検出のインデックス (物体の検出が無い場合はNone)
+        """
+        if obj_id not in self._tracks:
+            return None
+        result_idxes, detection_idxes = self._tracks[obj_id]
+        k = bisect_left(result_idxes, result_idx)
+        if k == len(result_idxes) or result_idxes[k] != result_idx:
+            return None
+        return detection_idxes[k]
+
+    def find_prev(self, obj_id, result_idx):
+        """指定した結果より前にある、物体の直近の検出を求める
+
+        Args:
+            obj_id (int): 物体ID
+            result_idx (int): 結果のインデックス
+
+        Returns:
+            Tuple[int, int]: 結果のインデックス、検出のインデックス (前に検出が無い場合はNone)
+        """
+        if obj_id not in self._tracks:
+            return None
+        result_idxes, detection_idxes = self._tracks[obj_id]
+        k = bisect_left(result_idxes, result_idx)
+        if k == 0:
+            return None
+        return result_idxes[k - 1], detection_idxes[k - 1]
+
+    def get_prev_positions(self, obj_id):
+        """物体の検出ごとに、find_prev と同じく前の結果にある直近の検出を求める
+
+        Args:
+            obj_id (int): 物体ID
+
+        Returns:
+            np.ndarray: 前の検出の位置 (get_track の配列のインデックス、前に検出が無い場合は-1) (K,)
+        """
+        _, result_idxes, _ = self.get_track(obj_id)
+        return np.searchsorted(result_idxes, result_idxes, side="left") - 1
+
+    def append(self, result_idx, detection):
+        """結果に検出を追加し、索引を更新する
+
+        Args:
+            result_idx (int): 追加先の結果のインデックス
+            detection (Detection): 追加する検出
+        """
+        detections = self.results[result_idx]["detections"]
+        detections.append(detection)
+        obj_id = detection.obj_id
+        result_idxes, detection_idxes = self._tracks.setdefault(obj_id, ([], []))
+        k = bisect_right(result_idxes, result_idx)
+        result_idxes.insert(k, result_idx)
+        detection_idxes.insert(k, len(detections) - 1)
+        self._arrays.pop(obj_id, None)
+
+    def filter(self, valid_result_idxes):
+        """物体ごとに指定した結果の検出のみを残し、それ以外の検出を results から削除する
+
+        Args:
+            valid_result_idxes (dict): {物体ID: 検出を残す結果のインデックスの集合}
+        """
+        for ii, result in enumerate(self.results):
+            result["detections"] = [
+                detection for detection in result["detections"]
+                if ii in valid_result_idxes[detection.obj_id]
+            ]
+        # 結果内の検出のインデックスが変わるため作成し直す
+        self._build()
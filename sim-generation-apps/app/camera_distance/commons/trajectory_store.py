@@ -0,0 +1,412 @@
+import json
+import os
+
+import numpy as np
+
+# ファイルの形式を変更した場合は値を上げる
+TRAJECTORY_STORE_VERSION = 1
+
+# 軌跡データ(列形式)のファイルの拡張子
+TRAJECTORY_STORE_EXT = ".npz"
+
+# 値の状態 (state 配列)
+_STATE_MISSING = 0  # キーが無い
+_STATE_VALUE = 1  # 値がある
+_STATE_NULL = 2  # 値が None
+
+# キーが無いことを表すオブジェクト
+_MISSING = object()
+
+
+def is_trajectory_store_path(file_path):
+    """軌跡データ(列形式)のファイルパスかどうか
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        bool: 拡張子が TRAJECTORY_STORE_EXT の場合はTrue
+    """
+    return os.path.splitext(file_path)[1].lower() == TRAJECTORY_STORE_EXT
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _get_kind(values):
+    """値(None、_MISSING を除く)から列の種類を決める"""
+    if not values:
+        return "null"
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        if all(-2**63 <= v < 2**63 for v in values):
+            return "int"
+        return "json"
+    if all(_is_number(v) for v in values):
+        return "float"
+    if all(isinstance(v, str) for v in values):
+        return "str"
+    if all(isinstance(v, dict) for v in values):
+        return "dict"
+    if all(isinstance(v, list) and all(_is_number(x) for x in v) for v in values):
+        return "float_list"
+    return "json"
+
+
+def _encode_column(values, name, arrays):
+    """列(1つのキーの全行の値)を配列にする
+
+    Args:
+        values (list): 行ごとの値 (キーが無い行は _MISSING)
+        name (str): 配列名の接頭辞
+        arrays (dict): 配列の出力先 {配列名: np.ndarray}
+
+    Returns:
+        dict: 列の情報 (種類、子の列)
+    """
+    present = [v for v in values if v is not _MISSING and v is not None]
+    kind = _get_kind(present)
+    schema = {"kind": kind}
+    if len(present) != len(values):
+        arrays[f"{name}.state"] = np.array(
+            [_STATE_MISSING if v is _MISSING else _STATE_NULL if v is None else _STATE_VALUE for v in values],
+            dtype=np.int8)
+        values = [v if v is not _MISSING and v is not None else None for v in values]
+
+    if kind == "bool":
+        arrays[f"{name}.values"] = np.array([bool(v) for v in values], dtype=bool)
+    elif kind == "int":
+        arrays[f"{name}.values"] = np.array([0 if v is None else v for v in values], dtype=np.int64)
+    elif kind == "float":
+        arrays[f"{name}.values"] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        is_int = [isinstance(v, int) for v in values]
+        if any(is_int):
+            arrays[f"{name}.is_int"] = np.array(is_int, dtype=bool)
+    elif kind == "str":
+        arrays[f"{name}.values"] = np.array(["" if v is None else v for v in values], dtype=str)
+    elif kind == "float_list":
+        lists = [[] if v is None else v for v in values]
+        flat = [x for v in lists for x in v]
+        arrays[f"{name}.offsets"] = np.concatenate([[0], np.cumsum([len(v) for v in lists], dtype=np.int64)])
+        arrays[f"{name}.values"] = np.array(flat, dtype=np.float64)
+        is_int = [isinstance(x, int) for x in flat]
+        if any(is_int):
+            arrays[f"{name}.is_int"] = np.array(is_int, dtype=bool)
+    elif kind == "dict":
+        schema["records"] = _encode_records([{} if v is None else v for v in values], name, arrays)
+    elif kind == "json":
+        arrays[f"{name}.values"] = np.array(["" if v is None else json.dumps(v, ensure_ascii=False) for v in values],
+                                            dtype=str)
+    return schema
+
+
+def _decode_column(schema, name, arrays, length):
+    """配列から列(1つのキーの全行の値)を復元する
+
+    Returns:
+        list: 行ごとの値 (キーが無い行は _MISSING)
+    """
+    kind = schema["kind"]
+    if kind == "null":
+        values = [None] * length
+    elif kind in ("bool", "int", "str"):
+        values = arrays[f"{name}.values"].tolist()
+    elif kind == "float":
+        values = arrays[f"{name}.values"].tolist()
+        if f"{name}.is_int" in arrays:
+            values = [int(v) if is_int else v for v, is_int in zip(values, arrays[f"{name}.is_int"].tolist())]
+    elif kind == "float_list":
+        flat = arrays[f"{name}.values"].tolist()
+        if f"{name}.is_int" in arrays:
+            flat = [int(v) if is_int else v for v, is_int in zip(flat, arrays[f"{name}.is_int"].tolist())]
+        offsets = arrays[f"{name}.offsets"].tolist()
+        values = [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    elif kind == "dict":
+        values = _decode_records(schema["records"], name, arrays, length)
+    else:
+        values = [json.loads(v) if v else None for v in arrays[f"{name}.values"].tolist()]
+
+    if f"{name}.state" in arrays:
+        states = arrays[f"{name}.state"].tolist()
+        values = [
+            v if state == _STATE_VALUE else None if state == _STATE_NULL else _MISSING
+            for v, state in zip(values, states)
+        ]
+    return values
+
+
+def _encode_records(records, name, arrays, skip_keys=()):
+    """辞書のリストを列ごとの配列にする
+
+    列はキーが最初に現れた順とし、行ごとのキーの並び(パターン)も保存する。
+    skip_keys のキーは列にせず、キーの並びにのみ含める (復元時の値はNone)。
+
+    Returns:
+        dict: 列の情報のリスト "columns"、キーの並びのリスト "patterns" (列のインデックス、skip_keys は -1 - skip_keysのインデックス)、
+            "skip_keys"
+    """
+    keys = {}
+    patterns = {}
+    pattern_idxes = []
+    for record in records:
+        pattern = tuple(
+            -1 - skip_keys.index(key) if key in skip_keys else keys.setdefault(key, len(keys))
+            for key in record
+        )
+        pattern_idxes.append(patterns.setdefault(pattern, len(patterns)))
+    if len(patterns) > 1:
+        arrays[f"{name}.pattern"] = np.array(pattern_idxes, dtype=np.int32)
+
+    columns = []
+    for ii, key in enumerate(keys):
+        schema = _encode_column([record.get(key, _MISSING) for record in records], f"{name}.{ii}", arrays)
+        schema["key"] = key
+        columns.append(schema)
+    return {"columns": columns, "patterns": [list(pattern) for pattern in patterns], "skip_keys": list(skip_keys)}
+
+
+def _decode_records(schema, name, arrays, length):
+    """列ごとの配列から辞書のリストを復元する"""
+    columns = schema["columns"]
+    keys = [column["key"] for column in columns]
+    values = [_decode_column(column, f"{name}.{ii}", arrays, length) for ii, column in enumerate(columns)]
+    skipped = [(key, None) for key in schema.get("skip_keys", [])]
+    patterns = [
+        [skipped[-1 - ii] if ii < 0 else (keys[ii], values[ii]) for ii in pattern]
+        for pattern in schema["patterns"]
+    ]
+    if not patterns:
+        return [{} for _ in range(length)]
+    if len(patterns) == 1:
+        pattern_idxes = [0] * length
+    else:
+        pattern_idxes = arrays[f"{name}.pattern"].tolist()
+
+    records = []
+    for row, pattern_idx in enumerate(pattern_idxes):
+        record = {}
+        for key, column_values in patterns[pattern_idx]:
+            value = None if column_values is None else column_values[row]
+            if value is not _MISSING:
+                record[key] = value
+        records.append(record)
+    return records
+
+
+def save_trajectory_store(file_path, data):
+    """結果データ(results を持つ辞書)を列形式で保存する
+
+    フレーム(results の各要素、自車の値を含む)と検出(全フレームの detections を連結したもの)を
+    それぞれ1つの表とし、キーごとに1つの配列(数値の配列は値と区切り位置の2つ)として npz に保存する。
+    results 以外のキー(EPSG、camera_parameter 等)は json としてヘッダーに保存する。
+
+    Args:
+        file_path (str): 保存先のファイルパス
+        data (dict): 結果データ
+    """
+    results = data["results"]
+    detections = [detection for result in results for detection in result.get("detections", [])]
+    arrays = {}
+    header = {
+        "version": TRAJECTORY_STORE_VERSION,
+        "meta": {key: value for key, value in data.items() if key != "results"},
+        "keys": list(data.keys()),
+        "num_frames": len(results),
+        "num_detections": len(detections),
+        "frames": _encode_records(results, "frames", arrays, skip_keys=("detections",)),
+        "detections": _encode_records(detections, "detections", arrays),
+    }
+    # detections of frame ii are detections[detection_offsets[ii]:detection_offsets[ii + 1]]
+    arrays["detection_offsets"] = np.concatenate(
+        [[0], np.cumsum([len(result.get("detections", [])) for result in results], dtype=np.int64)])
+    arrays["header"] = np.array(json.dumps(header, ensure_ascii=False), dtype=str)
+
+    _save_arrays(file_path, arrays)
+
+
+def _save_arrays(file_path, arrays):
+    # 書き込み中に中断されても壊れないように、一時ファイルに書いてから置き換える
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, file_path)
+
+
+def _load_header(store):
+    header = json.loads(str(store["header"]))
+    if header["version"] != TRAJECTORY_STORE_VERSION:
+        raise ValueError(f"unsupported trajectory store version: {header['version']}")
+    return header
+
+
+def load_trajectory_store(file_path):
+    """列形式で保存した結果データを読み込む (save_trajectory_store で保存したものと同じ辞書を返す)
+
+    Args:
+        file_path (str): ファイルパス
+
+    Returns:
+        dict: 結果データ
+    """
+    with np.load(file_path, allow_pickle=False) as store:
+        header = _load_header(store)
+        arrays = {name: store[name] for name in store.files}
+
+    results = _decode_records(header["frames"], "frames", arrays, header["num_frames"])
+    detections = _decode_records(header["detections"], "detections", arrays, header["num_detections"])
+    offsets = arrays["detection_offsets"].tolist()
+    for ii, result in enumerate(results):
+        if "detections" in result:
+            result["detections"] = detections[offsets[ii]:offsets[ii + 1]]
+
+    meta = header["meta"]
+    return {key: (results if key == "results" else meta[key]) for key in header["keys"]}
+
+
+def _load_column(store, schema, name, length, key):
+    """列を1つ読み込む
+
+    Args:
+        store (NpzFile): 読み込んだファイル
+        schema (dict): 列を持つ表の情報 (_encode_records の戻り値)
+        name (str): 表の配列名の接頭辞
+        length (int): 行数
+        key (str): 列のキー (入れ子の辞書のキーは "." で区切る)
+
+    Returns:
+        list: 行ごとの値 (キーが無い行はNone)
+    """
+    path = key.split(".")
+    for depth, part in enumerate(path):
+        index = next((ii for ii, column in enumerate(schema["columns"]) if column["key"] == part), None)
+        if index is None:
+            return [None] * length
+        column, name = schema["columns"][index], f"{name}.{index}"
+        if depth < len(path) - 1 and column["kind"] != "dict":
+            break
+        schema = column.get("records")
+    arrays = {file: store[file] for file in store.files if file.startswith(f"{name}.")}
+    values = _decode_column(column, name, arrays, length)
+    for part in path[depth + 1:]:
+        # 辞書以外の値も含む列(json)の場合は、復元した値からキーを辿る
+        values = [value.get(part, _MISSING) if isinstance(value, dict) else _MISSING for value in values]
+    return [None if value is _MISSING else value for value in values]
+
+
+def load_trajectory_columns(file_path, frame_keys=(), detection_keys=()):
+    """列形式で保存した結果データから、指定した列のみを読み込む
+
+    Args:
+        file_path (str): ファイルパス
+        frame_keys (list): 読み込むフレームの列のキー (入れ子の辞書のキーは "self.latitude" のように "." で区切る)
+        detection_keys (list): 読み込む検出の列のキー (同上)
+
+    Returns:
+        Tuple[dict, dict]: フレームの列、検出の列 ({キー: 行ごとの値のリスト (キーが無い行はNone)})
+            検出の列は全フレームの検出を連結した順とし、各検出の結果のインデックス "result_index" (np.ndarray) を含む
+    """
+    with np.load(file_path, allow_pickle=False) as store:
+        header = _load_header(store)
+        frame_columns = {
+            key: _load_column(store, header["frames"], "frames", header["num_frames"], key)
+            for key in frame_keys
+        }
+        detection_columns = {
+            key: _load_column(store, header["detections"], "detections", header["num_detections"], key)
+            for key in detection_keys
+        }
+        counts = np.diff(store["detection_offsets"])
+    detection_columns["result_index"] = np.repeat(np.arange(len(counts)), counts)
+    return frame_columns, detection_columns
+
+
+def _update_column(arrays, schema, name, length, key, rows, values):
+    """列の指定した行の値を更新する
+
+    Args:
+        arrays (dict): 全ての配列 {配列名: np.ndarray} (更新した列の配列に置き換える)
+        schema (dict): 列を持つ表の情報 (_encode_records の戻り値、更新した列の情報に置き換える)
+        name (str): 表の配列名の接頭辞
+        length (int): 行数
+        key (str): 列のキー (入れ子の辞書のキーは "." で区切る)
+        rows (list): 更新する行のインデックス
+        values (list): 行ごとの値
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return
+    path = key.split(".")
+    for part in path[:-1]:
+        index = next((ii for ii, column in enumerate(schema["columns"]) if column["key"] == part), None)
+        if index is None or schema["columns"][index]["kind"] != "dict":
+            raise ValueError(f"not a dict column: {key}")
+        name = f"{name}.{index}"
+        if f"{name}.state" in arrays and np.any(arrays[f"{name}.state"][rows] != _STATE_VALUE):
+            raise ValueError(f"no dict to update in some rows: {key}")
+        schema = schema["columns"][index]["records"]
+
+    columns = schema["columns"]
+    index = next((ii for ii, column in enumerate(columns) if column["key"] == path[-1]), None)
+    if index is None:
+        index = len(columns)
+        columns.append(None)
+        column_values = [_MISSING] * length
+    else:
+        column_values = _decode_column(columns[index], f"{name}.{index}", arrays, length)
+    for row, value in zip(rows.tolist(), values):
+        column_values[row] = value
+    for file in [file for file in arrays if file.startswith(f"{name}.{index}.")]:
+        del arrays[file]
+    column = _encode_column(column_values, f"{name}.{index}", arrays)
+    column["key"] = path[-1]
+    columns[index] = column
+
+    # 行にキーが無い場合は、辞書にキーを追加した場合と同じくキーの並びの最後に追加する
+    patterns = schema["patterns"]
+    if f"{name}.pattern" in arrays:
+        pattern_idxes = arrays[f"{name}.pattern"].astype(np.int64)
+    else:
+        pattern_idxes = np.zeros(length, dtype=np.int64)
+    pattern_map = {tuple(pattern): ii for ii, pattern in enumerate(patterns)}
+    row_pattern_idxes = pattern_idxes[rows]
+    for pattern_idx in np.unique(row_pattern_idxes).tolist():
+        if index in patterns[pattern_idx]:
+            continue
+        pattern = patterns[pattern_idx] + [index]
+        if tuple(pattern) not in pattern_map:
+            pattern_map[tuple(pattern)] = len(patterns)
+            patterns.append(pattern)
+        pattern_idxes[rows[row_pattern_idxes == pattern_idx]] = pattern_map[tuple(pattern)]
+    used, pattern_idxes = np.unique(pattern_idxes, return_inverse=True)
+    schema["patterns"] = [patterns[ii] for ii in used.tolist()]
+    if len(used) > 1:
+        arrays[f"{name}.pattern"] = pattern_idxes.astype(np.int32)
+    else:
+        arrays.pop(f"{name}.pattern", None)
+
+
+def update_trajectory_columns(file_path, frame_values=None, detection_values=None, output_path=None):
+    """列形式で保存した結果データの指定した列のみを更新する
+
+    更新する列以外の配列は読み込んだまま書き出す (辞書に復元しない)。
+    行にキーが無い場合は、辞書にキーを追加した場合と同じくその行のキーの並びの最後に追加する。
+
+    Args:
+        file_path (str): ファイルパス
+        frame_values (dict): フレームの更新する列 {キー: (行のインデックスのリスト, 値のリスト)}
+            (キーは load_trajectory_columns と同じ。入れ子の辞書のキーの場合、更新する行に親の辞書があること)
+        detection_values (dict): 検出の更新する列 (同上、行は全フレームの検出を連結した順)
+        output_path (str): 保存先のファイルパス (Noneの場合は file_path)
+    """
+    with np.load(file_path, allow_pickle=False) as store:
+        header = _load_header(store)
+        arrays = {name: store[name] for name in store.files}
+
+    for table, length, values in (("frames", header["num_frames"], frame_values),
+                                  ("detections", header["num_detections"], detection_values)):
+        for key, (rows, column_values) in (values or {}).items():
+            _update_column(arrays, header[table], table, length, key, rows, column_values)
+    arrays["header"] = np.array(json.dumps(header, ensure_ascii=False), dtype=str)
+    _save_arrays(file_path if output_path is None else output_path, arrays)
@@ -0,0 +1,38 @@
+import argparse
+import os
+import sys
+
+from commons.result_io import load_result_json, save_result_json
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="結果ファイルの形式を変換する (列形式の軌跡データ(.npz) ⇔ jsonファイル)"
+    )
+    parser.add_argument(
+        "--input_file",
+        type=str,
+        required=True,
+        help="変換元の結果ファイルパス (.npz / .json)",
+    )
+    parser.add_argument(
+        "--output_file",
+        type=str,
+        required=True,
+        help="変換先の結果ファイルパス (.npz / .json、拡張子で形式を判定する)",
+    )
+
+    args = parser.parse_args(argv)
+    input_file = args.input_file
+    output_file = args.output_file
+
+    if not os.path.isfile(input_file):
+        print(f"結果ファイルが見つかりません。: {input_file}")
+        sys.exit()
+
+    save_result_json(output_file, load_result_json(input_file))
+    print(f"Saved: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
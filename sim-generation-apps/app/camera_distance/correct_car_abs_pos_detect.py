@@ -4,48 +4,29 @@ import shutil
 import sys
 import argparse
 import json
-import copy
 import math
 import time
 
 import numpy as np
 import pandas as pd
-from shapely.geometry import Point, LineString
-from shapely import line_interpolate_point, line_locate_point, remove_repeated_points
+from shapely.geometry import LineString
+from shapely import remove_repeated_points
 
 from commons import image_util
 from commons.constants import *
+from commons.detection_model import Detection
+from commons.result_io import load_result_json, save_result_json
 from tools.coordinate_converter import get_converted_coordinates_lane_coord
-from tools.visualize_absolute_coord import gen_batch_abs_coord_img
-from cvt_lat_long_cartesian import (
-    convert_lat_long_to_cartesian,
-    cvt_plane_cartesian_to_world,
-    calc_org_lat_long
+from tools.lane_corrector import (
+    CORRECTION_COORD_LAT_LONG,
+    CORRECTION_COORD_WORLD,
+    CORRECTION_COORDS,
+    LaneCorrector,
+    convert_corrected_coords,
+    get_detection_coords,
 )
-
-
-def correct_car_abs_coord(road_linestrings: list, car_coordinate: list):
-    """車両座標と最も近いレーン座標を求める
-
-    Args:
-        road_linestrings (list): レーン座標
-        car_coordinate (list): 車両座標
-    """
-    # find x, y
-    car_point = Point(car_coordinate[0], car_coordinate[1])
-    min_distance = float("inf")
-    for road in road_linestrings:
-        line = road["line"]
-        distance = car_point.distance(line)
-        if distance < min_distance:
-            min_distance = distance
-            dist_online = line_locate_point(line, car_point)
-            point = line_interpolate_point(line, dist_online)
-            corrected_car_coordinates = [point.x, point.y, point.z]
-            road_id = road["road"]
-            lane_id = road["lane"]
-
-    return corrected_car_coordinates, road_id, lane_id
+from tools.visualize_absolute_coord import gen_batch_abs_coord_img
+from cvt_lat_long_cartesian import calc_org_lat_long
 
 
 def filter_road_info(road_info, road_targets):
@@ -76,8 +57,29 @@ def cvt_road_data_to_linestring(road_coordinates):
             })
     return road_linestrings
 
+def get_lane_corrector(lane_correctors, road_info, road_targets=None):
+    """補正先道路ごとの LaneCorrector を取得する
+
+    同じ補正先道路(道路ID・レーンIDの組)の LaneCorrector は1度だけ作成し、複数の他車で共有する。
 
-def main():
+    Args:
+        lane_correctors (dict): 作成済みの LaneCorrector (補正先道路をfrozensetにしたものをキーとする)
+        road_info (list): 全道路のレーン座標
+        road_targets (dict): 補正先道路 (道路IDをキー、レーンIDのsetを値とする辞書、Noneの場合は全道路)
+
+    Returns:
+        LaneCorrector: 補正先道路の LaneCorrector
+    """
+    key = None
+    if road_targets is not None:
+        key = frozenset((road_id, frozenset(lane_ids)) for road_id, lane_ids in road_targets.items())
+    if key not in lane_correctors:
+        road_data = road_info if road_targets is None else filter_road_info(road_info, road_targets)
+        lane_correctors[key] = LaneCorrector(cvt_road_data_to_linestring(road_data))
+    return lane_correctors[key]
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="レーンのGPS座標から車の位置を求める, \
             GPS座標と最も近いレーン上の点を補正後の車両座標とする"
@@ -112,19 +114,28 @@ def main():
         action="store_true",
         help="車両座標標のjsonファイルを上書きしない",
     )
+    parser.add_argument(
+        "--correction_coord",
+        type=str,
+        choices=CORRECTION_COORDS,
+        default=CORRECTION_COORD_LAT_LONG,
+        help="最も近いレーンを求める座標系 (lat_long: 緯度・経度、world: 世界座標(平面直角座標系、m))",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     lane_coord_file_path = args.lane_coord_file_path
     car_abs_coord_file_path = args.car_abs_coord_file_path
     road_correct_targets_file_path = args.road_correct_targets_file_path
     target_option = args.target_option
     no_overwrite = args.no_overwrite
+    correction_coord = args.correction_coord
 
     using_road_correct_targets = (road_correct_targets_file_path is not None)
     
     # Read input files
-    all_road_data = get_converted_coordinates_lane_coord(lane_coord_file_path)
+    all_road_data = get_converted_coordinates_lane_coord(
+        lane_coord_file_path, world=(correction_coord == CORRECTION_COORD_WORLD))
 
     if using_road_correct_targets:
         road_correct_targets = {}
@@ -151,9 +162,8 @@ def main():
                     road_targets["detections"][obj_id][road_id].add(lane_id)
     
     # read detected car absolute coords (.json file)
-    with open(car_abs_coord_file_path, "r", errors="ignore") as f:
-        detection_abs_coords = json.load(f)
-    detection_results = detection_abs_coords["results"]
+    detection_abs_coords = load_result_json(car_abs_coord_file_path, for_update=True)
+    detection_results = Detection.from_results(detection_abs_coords["results"])
     
     if detection_abs_coords["EPSG"] != all_road_data["EPSG"]:
         print("「lane_coord_file_path」 と「detection_abs_coord_file_path」のEPSGコードが一致していない")
@@ -162,10 +172,13 @@ def main():
     # Correct self coord & detection coords
     lat0_deg, lon0_deg, epsg_code = calc_org_lat_long(epsg_code=detection_abs_coords["EPSG"])
 
-    output_dict = copy.deepcopy(detection_abs_coords)
+    output_dict = detection_abs_coords
     output_results = output_dict["results"]
     detections_targets = {}
     
+    # LaneCorrector for each road correct targets (shared by detections with the same targets)
+    lane_correctors = {}
+
     if target_option == "beforeIn":
         if not using_road_correct_targets:
             road_targets = {
@@ -175,76 +188,87 @@ def main():
         beforeIn_obj = {}
         for ii, result in enumerate(detection_results):
             for jj, detection in enumerate(result["detections"]):
-                if detection["interpolation_type"] == "beforeIn" and detection["obj_id"] not in beforeIn_obj.keys():
+                if detection.interpolation_type == "beforeIn" and detection.obj_id not in beforeIn_obj.keys():
                     beforeIn_obj |= {
-                        detection["obj_id"]: None
+                        detection.obj_id: None
                     }
-                elif detection["interpolation_type"] != "beforeIn" \
-                    and detection["obj_id"] in beforeIn_obj.keys() \
-                    and beforeIn_obj[detection["obj_id"]] == None:
+                elif detection.interpolation_type != "beforeIn" \
+                    and detection.obj_id in beforeIn_obj.keys() \
+                    and beforeIn_obj[detection.obj_id] == None:
                     # correct frame in
-                    detection_road_data = all_road_data["roads"]
-                    obj_id = detection["obj_id"]
+                    obj_id = detection.obj_id
+                    detection_road_targets = None
                     if using_road_correct_targets and road_targets["detections"]:
-                        detection_road_data = filter_road_info(all_road_data["roads"], road_targets["detections"][obj_id])
-                    detection_road_linestrings = cvt_road_data_to_linestring(detection_road_data)
+                        detection_road_targets = road_targets["detections"][obj_id]
+                    detection_corrector = get_lane_corrector(lane_correctors, all_road_data["roads"], detection_road_targets)
 
-                    detection_coord = [detection["latitude"], detection["longitude"], 0]
-                    corrected_detection_coord, corrected_road_id, corrected_lane_id = correct_car_abs_coord(
-                        detection_road_linestrings, detection_coord)
+                    detection_coords = get_detection_coords([detection], correction_coord)
+                    _, corrected_road_ids, corrected_lane_ids = detection_corrector.correct_array(detection_coords)
                     
-                    beforeIn_obj[detection["obj_id"]] = {
-                        corrected_road_id: {corrected_lane_id}
+                    beforeIn_obj[detection.obj_id] = {
+                        corrected_road_ids[0]: {corrected_lane_ids[0]}
                     }
                     
         road_targets["detections"] = beforeIn_obj
     
-    detection_road_linestrings = {}
+    # group detections by obj_id (the correct target lanes are decided by the first detection)
+    detection_correctors = {}
+    detection_indices = {}
     for ii, result in enumerate(detection_results):
         for jj, detection in enumerate(result["detections"]):
-            # correct all detection coords
-            detection_road_data = all_road_data["roads"]
-            obj_id = detection["obj_id"]
+            obj_id = detection.obj_id
 
-            if obj_id not in detection_road_linestrings:
-                if (using_road_correct_targets or (target_option == "beforeIn" and detection["interpolation_type"] == "beforeIn")) \
+            if obj_id not in detection_correctors:
+                detection_road_targets = None
+                if (using_road_correct_targets or (target_option == "beforeIn" and detection.interpolation_type == "beforeIn")) \
                     and road_targets["detections"] and obj_id in road_targets["detections"]:
-                    detection_road_data = filter_road_info(all_road_data["roads"], road_targets["detections"][obj_id])
-                road_linestrings = cvt_road_data_to_linestring(detection_road_data)
-                detection_road_linestrings |= {
-                    obj_id: road_linestrings
+                    detection_road_targets = road_targets["detections"][obj_id]
+                detection_correctors |= {
+                    obj_id: get_lane_corrector(lane_correctors, all_road_data["roads"], detection_road_targets)
                 }
-            
-            detection_coord = [detection["latitude"], detection["longitude"], 0]
-            corrected_detection_coord, corrected_road_id, corrected_lane_id = correct_car_abs_coord(
-                detection_road_linestrings[obj_id], detection_coord)
+                detection_indices[obj_id] = []
+            detection_indices[obj_id].append((ii, jj))
+
+    # correct all detection coords of each obj_id at once
+    detection_corrections = {}
+    for obj_id, indices in detection_indices.items():
+        detection_coords = get_detection_coords(
+            [detection_results[ii]["detections"][jj] for ii, jj in indices], correction_coord)
+        corrected_coords, corrected_road_ids, corrected_lane_ids = \
+            detection_correctors[obj_id].correct_array(detection_coords)
+        lat_long_coords, abs_coords = convert_corrected_coords(corrected_coords, correction_coord, lat0_deg, lon0_deg)
+        detection_corrections |= dict(zip(
+            indices,
+            zip(lat_long_coords.tolist(), abs_coords.tolist(), corrected_road_ids.tolist(), corrected_lane_ids.tolist())
+        ))
+
+    for ii, result in enumerate(detection_results):
+        for jj, detection in enumerate(result["detections"]):
+            obj_id = detection.obj_id
+            corrected_lat_long, corrected_abs_coord, corrected_road_id, corrected_lane_id = detection_corrections[(ii, jj)]
             
             # update x,y,z of target detections
-            if target_option == None or target_option == detection["interpolation_type"]:
-                output_results[ii]["detections"][jj]["latitude"] = corrected_detection_coord[0]
-                output_results[ii]["detections"][jj]["longitude"] = corrected_detection_coord[1]
-                detection_cartesian_coord = convert_lat_long_to_cartesian(
-                    corrected_detection_coord[0], corrected_detection_coord[1], lat0_deg, lon0_deg)
-                detection_abs_coord = cvt_plane_cartesian_to_world(detection_cartesian_coord[0], detection_cartesian_coord[1])
-                detection_abs_coord.append(corrected_detection_coord[2])
-                output_results[ii]["detections"][jj]["world_coordinate"] = detection_abs_coord
-                output_results[ii]["detections"][jj]["road_correction"] = {
+            if target_option == None or target_option == detection.interpolation_type:
+                output_results[ii]["detections"][jj].latitude = corrected_lat_long[0]
+                output_results[ii]["detections"][jj].longitude = corrected_lat_long[1]
+                output_results[ii]["detections"][jj].world_coordinate = corrected_abs_coord
+                output_results[ii]["detections"][jj].road_correction = {
                     "road" : corrected_road_id,
                     "lane" : corrected_lane_id
                 }
 
-                target_ = output_results[ii]["detections"][jj]["road_correction"]
+                target_ = output_results[ii]["detections"][jj].road_correction
                 
                 if obj_id not in detections_targets.keys():
                     detections_targets[obj_id] = [target_]
                 elif target_ not in detections_targets[obj_id]:
                     detections_targets[obj_id].append(target_)
             else: # only update z if not target detections
-                detection_abs_coord = output_results[ii]["detections"][jj]["world_coordinate"]
+                detection_abs_coord = output_results[ii]["detections"][jj].world_coordinate
                 if len(detection_abs_coord) < 3:
-                    detection_abs_coord.append(corrected_detection_coord[2])
+                    detection_abs_coord.append(corrected_abs_coord[2])
                 else:
-                    detection_abs_coord[2] = corrected_detection_coord[2]
+                    detection_abs_coord[2] = corrected_abs_coord[2]
 
     # save corrected abs coord (.json file)
     abs_coord_file_name = os.path.basename(car_abs_coord_file_path)
@@ -257,8 +281,8 @@ def main():
     output_path = os.path.dirname(car_abs_coord_file_path)
     output_abs_coord_file_path = os.path.join(output_path, output_fn)
 
-    with open(output_abs_coord_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(output_dict, f, ensure_ascii=False, indent=2)
+    Detection.to_results(output_results)
+    save_result_json(output_abs_coord_file_path, output_dict)
 
     # save road correct target (.json file)
     json_file_name = os.path.join(output_path, ROAD_CORRECT_TARGETS_FILE_NAME)
@@ -4,49 +4,29 @@ import shutil
 import sys
 import argparse
 import json
-import copy
 import math
 import time
 
 import numpy as np
 import pandas as pd
-from shapely.geometry import Point, LineString
-from shapely import line_interpolate_point, line_locate_point, remove_repeated_points
+from shapely.geometry import LineString
+from shapely import remove_repeated_points
 
 from commons import image_util
 from commons.constants import *
+from commons.result_io import load_result_json, save_result_json
 from tools.coordinate_converter import get_converted_coordinates_lane_coord
+from tools.lane_corrector import (
+    CORRECTION_COORD_LAT_LONG,
+    CORRECTION_COORD_WORLD,
+    CORRECTION_COORDS,
+    LaneCorrector,
+    convert_corrected_coords,
+    get_car_coords,
+)
 from tools.estimate_abs_pos import interpolate_abs_pos
 from tools.visualize_absolute_coord import gen_batch_abs_coord_img
-from cvt_lat_long_cartesian import (
-    convert_lat_long_to_cartesian,
-    cvt_plane_cartesian_to_world,
-    calc_org_lat_long
-)
-
-
-def correct_car_abs_coord(road_linestrings: list, car_coordinate: list):
-    """車両座標と最も近いレーン座標を求める
-
-    Args:
-        road_linestrings (list): レーン座標
-        car_coordinate (list): 車両座標
-    """
-    # find x, y
-    car_point = Point(car_coordinate[0], car_coordinate[1])
-    min_distance = float("inf")
-    for road in road_linestrings:
-        line = road["line"]
-        distance = car_point.distance(line)
-        if distance < min_distance:
-            min_distance = distance
-            dist_online = line_locate_point(line, car_point)
-            point = line_interpolate_point(line, dist_online)
-            corrected_car_coordinates = [point.x, point.y, point.z]
-            road_id = road["road"]
-            lane_id = road["lane"]
-
-    return corrected_car_coordinates, road_id, lane_id
+from cvt_lat_long_cartesian import calc_org_lat_long
 
 
 def filter_road_info(road_info, road_targets):
@@ -77,7 +57,7 @@ def cvt_road_data_to_linestring(road_coordinates):
             })
     return road_linestrings
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="レーンのGPS座標から車の位置を求める, \
             GPS座標と最も近いレーン上の点を補正後の車両座標とする"
@@ -110,19 +90,28 @@ def main():
         action="store_true",
         help="修正後の自車座標の可視化画像を出力する",
     )
+    parser.add_argument(
+        "--correction_coord",
+        type=str,
+        choices=CORRECTION_COORDS,
+        default=CORRECTION_COORD_LAT_LONG,
+        help="最も近いレーンを求める座標系 (lat_long: 緯度・経度、world: 世界座標(平面直角座標系、m))",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     lane_coord_file_path = args.lane_coord_file_path
     car_abs_coord_file_path = args.car_abs_coord_file_path
     road_correct_targets_file_path = args.road_correct_targets_file_path
     no_overwrite = args.no_overwrite
     visualize = args.visualize
+    correction_coord = args.correction_coord
 
     using_road_correct_targets = (road_correct_targets_file_path is not None)
     
     # Read input files
-    all_road_data = get_converted_coordinates_lane_coord(lane_coord_file_path)
+    all_road_data = get_converted_coordinates_lane_coord(
+        lane_coord_file_path, world=(correction_coord == CORRECTION_COORD_WORLD))
 
     if using_road_correct_targets:
         road_correct_targets = {}
@@ -144,8 +133,7 @@ def main():
                 road_targets["self"][road_id].add(lane_id)
     
     # read detected car absolute coords (.json file)
-    with open(car_abs_coord_file_path, "r", errors="ignore") as f:
-        detection_abs_coords = json.load(f)
+    detection_abs_coords = load_result_json(car_abs_coord_file_path, for_update=True)
     detection_results = detection_abs_coords["results"]
     
     if detection_abs_coords["EPSG"] != all_road_data["EPSG"]:
@@ -155,28 +143,36 @@ def main():
     # Correct self coord & detection coords
     phi0_deg, lambda0_deg, epsg_code = calc_org_lat_long(epsg_code=detection_abs_coords["EPSG"])
 
-    output_dict = copy.deepcopy(detection_abs_coords)
+    output_dict = detection_abs_coords
     output_results = output_dict["results"]
+    
+    # self coords before correction (results are updated in place)
+    if visualize:
+        self_car_coordinates = [(x["self"]["latitude"], x["self"]["longitude"]) for x in detection_results]
     self_targets = []
     
     # correct self coord
     self_road_data = all_road_data["roads"]
     if using_road_correct_targets and road_targets["self"]:
         self_road_data = filter_road_info(all_road_data["roads"], road_targets["self"])
-    self_road_linestrings = cvt_road_data_to_linestring(self_road_data)
+    self_corrector = LaneCorrector(cvt_road_data_to_linestring(self_road_data))
+    self_coords = get_car_coords([result["self"] for result in detection_results], correction_coord)
+    corrected_self_coords, corrected_road_ids, corrected_lane_ids = self_corrector.correct_array(self_coords)
+    self_lat_long_coords, self_abs_coords = convert_corrected_coords(
+        corrected_self_coords, correction_coord, phi0_deg, lambda0_deg)
+    self_lat_long_coords = self_lat_long_coords.tolist()
+    self_abs_coords = self_abs_coords.tolist()
+    corrected_road_ids = corrected_road_ids.tolist()
+    corrected_lane_ids = corrected_lane_ids.tolist()
         
     for ii, result in enumerate(detection_results):
-        self_coord = [result["self"]["latitude"], result["self"]["longitude"], 0]
-        corrected_self_coord, corrected_road_id, corrected_lane_id = correct_car_abs_coord(self_road_linestrings, self_coord)
+        corrected_road_id = corrected_road_ids[ii]
+        corrected_lane_id = corrected_lane_ids[ii]
 
         # update self coord
-        output_results[ii]["self"]["latitude"] = corrected_self_coord[0]
-        output_results[ii]["self"]["longitude"] = corrected_self_coord[1]
-        self_cartesian_coord = convert_lat_long_to_cartesian(
-            corrected_self_coord[0], corrected_self_coord[1], phi0_deg, lambda0_deg)
-        self_abs_coord = cvt_plane_cartesian_to_world(self_cartesian_coord[0], self_cartesian_coord[1])
-        self_abs_coord.append(corrected_self_coord[2])
-        output_results[ii]["self"]["world_coordinate"] = self_abs_coord
+        output_results[ii]["self"]["latitude"] = self_lat_long_coords[ii][0]
+        output_results[ii]["self"]["longitude"] = self_lat_long_coords[ii][1]
+        output_results[ii]["self"]["world_coordinate"] = self_abs_coords[ii]
         output_results[ii]["self"]["road_correction"] = {
             "road" : corrected_road_id,
             "lane" : corrected_lane_id
@@ -197,8 +193,7 @@ def main():
     output_path = os.path.dirname(car_abs_coord_file_path)
     output_abs_coord_file_path = os.path.join(output_path, output_fn)
 
-    with open(output_abs_coord_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(output_dict, f, ensure_ascii=False, indent=2)
+    save_result_json(output_abs_coord_file_path, output_dict)
 
     # save road correct target (.json file)
     json_file_name = os.path.join(output_path, ROAD_CORRECT_TARGETS_FILE_NAME)
@@ -215,9 +210,10 @@ def main():
     # visualize corrected self coord
     if visualize:
         print("Visualize")
-        self_car_coordinates = [(x["self"]["latitude"], x["self"]["longitude"]) for x in detection_results]
         self_car_frames = [x["frame"] for x in detection_results]
         corrected_coordinates = [(x["self"]["latitude"], x["self"]["longitude"]) for x in output_results]
+        if correction_coord == CORRECTION_COORD_WORLD:
+            all_road_data = get_converted_coordinates_lane_coord(lane_coord_file_path)
         output_images = gen_batch_abs_coord_img(self_car_coordinates, corrected_coordinates, all_road_data)
         
         for idx in range(len(output_images)):
@@ -1,10 +1,181 @@
+import functools
+
 import numpy as np
 
 from commons.constants import *
 
 
+# 定数 (a, F: 世界測地系-測地基準系1980（GRS80）楕円体)
+M0 = 0.9999
+GRS80_A = 6378137.
+GRS80_F = 298.257222101
+
+
+class GaussKrugerProjection:
+    """平面直角座標系原点ごとのガウス・クリューゲル投影 (緯度経度 ⇔ 平面直角座標)
+
+    級数の係数は原点ごとに1度だけ計算する (get_projection で原点ごとのインスタンスを共有する)。
+    変換は配列(任意の形状)をまとめて処理する。
+    """
+
+    def __init__(self, phi0_deg, lambda0_deg):
+        """
+        Args:
+            phi0_deg (float): 平面直角座標系原点の緯度[度]（分・秒でなく小数であることに注意）
+            lambda0_deg (float): 平面直角座標系原点の経度[度]（分・秒でなく小数であることに注意）
+        """
+        # 平面直角座標系原点をラジアンに直す
+        self.phi0_rad = np.deg2rad(phi0_deg)
+        self.lambda0_rad = np.deg2rad(lambda0_deg)
+
+        n = 1. / (2*GRS80_F - 1)
+        A0 = 1 + (n**2)/4. + (n**4)/64
+        A1 = -(3./2)*(n - (n**3)/8 - (n**5)/64)
+        A2 = (15./16)*(n**2 - (n**4)/4)
+        A3 = -(35./48)*(n**3 - (5./16)*(n**5))
+        A4 = (315./512)*(n**4)
+        A5 = -(693./1280)*(n**5)
+        A_array = np.array([A0, A1, A2, A3, A4, A5])
+
+        alpha1 = n/2 - 2*n**2/3 + 5*(n**3)/16 + 41*(n**4)/180 - 127*(n**5)/288
+        alpha2 = 13*n**2/48 - 3*(n**3)/5 + 557*(n**4)/1440 + 281*(n**5)/630
+        alpha3 = 61*(n**3)/240 - 103*(n**4)/140 + 15061*(n**5)/26880
+        alpha4 = 49561*(n**4)/161280 - 179*(n**5)/168
+        alpha5 = 34729*(n**5)/80640
+        self.alpha_array = np.array([alpha1, alpha2, alpha3, alpha4, alpha5])
+
+        b1 = (1./2)*n - (2./3)*(n**2) + (37./96) * \
+            (n**3) - (1./360)*(n**4) - (81./512)*(n**5)
+        b2 = (1./48)*(n**2) + (1./15)*(n**3) - \
+            (437./1440)*(n**4) + (46./105)*(n**5)
+        b3 = (17./480)*(n**3) - (37./840)*(n**4) - (209./4480)*(n**5)
+        b4 = (4397./161280)*(n**4) - (11./504)*(n**5)
+        b5 = (4583./161280)*(n**5)
+        self.beta_array = np.array([b1, b2, b3, b4, b5])
+
+        d1 = 2.*n - (2./3)*(n**2) - 2.*(n**3) + (116./45) * \
+            (n**4) + (26./45)*(n**5) - (2854./675)*(n**6)
+        d2 = (7./3)*(n**2) - (8./5)*(n**3) - (227./45) * \
+            (n**4) + (2704./315)*(n**5) + (2323./945)*(n**6)
+        d3 = (56./15)*(n**3) - (136./35)*(n**4) - \
+            (1262./105)*(n**5) + (73814./2835)*(n**6)
+        d4 = (4279./630)*(n**4) - (332./35)*(n**5) - (399572./14175)*(n**6)
+        d5 = (4174./315)*(n**5) - (144838./6237)*(n**6)
+        d6 = (601676./22275)*(n**6)
+        self.delta_array = np.array([d1, d2, d3, d4, d5, d6])
+
+        self.t1 = 2*np.sqrt(n)/(1+n)
+        self.A_hat = ((M0*GRS80_A)/(1.+n))*A0
+        self.Sphi0_hat = ((M0*GRS80_A)/(1.+n))*(A0*self.phi0_rad +
+                                                A_array[1:] @ np.sin(2*self.phi0_rad*np.arange(1, 6)))
+
+        # 級数の次数 (配列の最後の軸で和を取る)
+        self.k5 = np.arange(1, 6)
+        self.k6 = np.arange(1, 7)
+
+    def to_lat_long(self, x, y):
+        """平面直角座標を緯度経度に変換する
+
+        Args:
+            x (float | np.ndarray): 変換したいx座標[m]
+            y (float | np.ndarray): 変換したいy座標[m]
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 緯度[度], 経度[度] (x, y と同じ形状)
+        """
+        Xi = (np.asarray(x, dtype=np.float64) + self.Sphi0_hat) / self.A_hat
+        Eta = np.asarray(y, dtype=np.float64) / self.A_hat
+
+        Xi_k = 2*Xi[..., np.newaxis]*self.k5
+        Eta_k = 2*Eta[..., np.newaxis]*self.k5
+        Xi_comma = Xi - np.sum(self.beta_array * np.sin(Xi_k) * np.cosh(Eta_k), axis=-1)
+        Eta_comma = Eta - np.sum(self.beta_array * np.cos(Xi_k) * np.sinh(Eta_k), axis=-1)
+
+        chi = np.arcsin(np.sin(Xi_comma)/np.cosh(Eta_comma))
+        latitude = chi + np.sum(self.delta_array * np.sin(2*chi[..., np.newaxis]*self.k6), axis=-1)
+        longitude = self.lambda0_rad + np.arctan(np.sinh(Eta_comma)/np.cos(Xi_comma))
+
+        return np.rad2deg(latitude), np.rad2deg(longitude)
+
+    def to_cartesian(self, phi_deg, lambda_deg):
+        """緯度経度を平面直角座標に変換する
+
+        Args:
+            phi_deg (float | np.ndarray): 変換したい緯度[度]（分・秒でなく小数であることに注意）
+            lambda_deg (float | np.ndarray): 変換したい経度[度]（分・秒でなく小数であることに注意）
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: x, y (変換後の平面直角座標[m]。phi_deg, lambda_deg と同じ形状)
+        """
+        phi_rad = np.deg2rad(np.asarray(phi_deg, dtype=np.float64))
+        lambda_rad = np.deg2rad(np.asarray(lambda_deg, dtype=np.float64))
+
+        lambda_c = np.cos(lambda_rad - self.lambda0_rad)
+        lambda_s = np.sin(lambda_rad - self.lambda0_rad)
+
+        t = np.sinh(np.arctanh(np.sin(phi_rad)) -
+                    self.t1*np.arctanh(self.t1*np.sin(phi_rad)))
+        t_hat = np.sqrt(1 + t**2)
+
+        Xi_comma = np.arctan(t/lambda_c)
+        Eta_comma = np.arctanh(lambda_s/t_hat)
+
+        Xi_k = 2*Xi_comma[..., np.newaxis]*self.k5
+        Eta_k = 2*Eta_comma[..., np.newaxis]*self.k5
+        sum_2 = np.sum(self.alpha_array * np.sin(Xi_k) * np.cosh(Eta_k), axis=-1)
+        sum_3 = np.sum(self.alpha_array * np.cos(Xi_k) * np.sinh(Eta_k), axis=-1)
+        x = self.A_hat * (Xi_comma + sum_2) - self.Sphi0_hat
+        y = self.A_hat * (Eta_comma + sum_3)
+
+        return x, y
+
+
+@functools.lru_cache(maxsize=None)
+def get_projection(phi0_deg, lambda0_deg):
+    """平面直角座標系原点のガウス・クリューゲル投影を取得する (原点ごとに1度だけ係数を計算する)
+
+    Args:
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+
+    Returns:
+        GaussKrugerProjection: 原点のガウス・クリューゲル投影
+    """
+    return GaussKrugerProjection(phi0_deg, lambda0_deg)
+
+
+def convert_cartesian_to_lat_long_array(x, y, phi0_deg, lambda0_deg):
+    """平面直角座標(配列)を緯度経度(配列)に変換する
+
+    Args:
+        x (np.ndarray): 変換したいx座標[m]
+        y (np.ndarray): 変換したいy座標[m]
+        phi0_deg (float): 平面直角座標系原点の緯度[度]（分・秒でなく小数であることに注意）
+        lambda0_deg (float): 平面直角座標系原点の経度[度]（分・秒でなく小数であることに注意）
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 緯度[度], 経度[度]
+    """
+    return get_projection(phi0_deg, lambda0_deg).to_lat_long(x, y)
+
+
+def convert_lat_long_to_cartesian_array(phi_deg, lambda_deg, phi0_deg, lambda0_deg):
+    """緯度経度(配列)を平面直角座標(配列)に変換する
+
+    Args:
+        phi_deg (np.ndarray): 変換したい緯度[度]（分・秒でなく小数であることに注意）
+        lambda_deg (np.ndarray): 変換したい経度[度]（分・秒でなく小数であることに注意）
+        phi0_deg (float): 平面直角座標系原点の緯度[度]（分・秒でなく小数であることに注意）
+        lambda0_deg (float): 平面直角座標系原点の経度[度]（分・秒でなく小数であることに注意）
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: x, y (変換後の平面直角座標[m])
+    """
+    return get_projection(phi0_deg, lambda0_deg).to_cartesian(phi_deg, lambda_deg)
+
+
 def convert_cartesian_to_lat_long(x, y, phi0_deg, lambda0_deg):
-    """平面直角座標を緯度経度に変換する
+    """平面直角座標を緯度経度に変換する (複数点をまとめて変換する場合は convert_cartesian_to_lat_long_array を使用する)
 
     Args:
         x (float): 変換したいx座標[m]
@@ -15,65 +186,11 @@ def convert_cartesian_to_lat_long(x, y, phi0_deg, lambda0_deg):
     Returns:
         [float, float]: 緯度[度], 経度[度]
     """
-    # 緯度経度・平面直角座標系原点をラジアンに直す
-    phi0_rad = np.deg2rad(phi0_deg)
-    lambda0_rad = np.deg2rad(lambda0_deg)
-
-    # 定数 (a, F: 世界測地系-測地基準系1980（GRS80）楕円体)
-    m0 = 0.9999
-    a = 6378137.
-    F = 298.257222101
-
-    n = 1. / (2*F - 1)
-    A0 = 1 + (n**2)/4. + (n**4)/64
-    A1 = -(3./2)*(n - (n**3)/8 - (n**5)/64)
-    A2 = (15./16)*(n**2 - (n**4)/4)
-    A3 = -(35./48)*(n**3 - (5./16)*(n**5))
-    A4 = (315./512)*(n**4)
-    A5 = -(693./1280)*(n**5)
-    A_array = np.array([A0, A1, A2, A3, A4, A5])
-
-    b1 = (1./2)*n - (2./3)*(n**2) + (37./96) * \
-        (n**3) - (1./360)*(n**4) - (81./512)*(n**5)
-    b2 = (1./48)*(n**2) + (1./15)*(n**3) - \
-        (437./1440)*(n**4) + (46./105)*(n**5)
-    b3 = (17./480)*(n**3) - (37./840)*(n**4) - (209./4480)*(n**5)
-    b4 = (4397./161280)*(n**4) - (11./504)*(n**5)
-    b5 = (4583./161280)*(n**5)
-    beta_array = np.array([b1, b2, b3, b4, b5])
-
-    d1 = 2.*n - (2./3)*(n**2) - 2.*(n**3) + (116./45) * \
-        (n**4) + (26./45)*(n**5) - (2854./675)*(n**6)
-    d2 = (7./3)*(n**2) - (8./5)*(n**3) - (227./45) * \
-        (n**4) + (2704./315)*(n**5) + (2323./945)*(n**6)
-    d3 = (56./15)*(n**3) - (136./35)*(n**4) - \
-        (1262./105)*(n**5) + (73814./2835)*(n**6)
-    d4 = (4279./630)*(n**4) - (332./35)*(n**5) - (399572./14175)*(n**6)
-    d5 = (4174./315)*(n**5) - (144838./6237)*(n**6)
-    d6 = (601676./22275)*(n**6)
-    delta_array = np.array([d1, d2, d3, d4, d5, d6])
-
-    A_hat = ((m0*a)/(1.+n))*A_array[0]
-    Sphi0_hat = ((m0*a)/(1.+n))*(A_array[0]*phi0_rad +
-                                 A_array[1:] @ np.sin(2*phi0_rad*np.arange(1, 6)))
-
-    Xi = (x + Sphi0_hat) / A_hat
-    Eta = y / A_hat
-
-    Xi_comma = Xi - (beta_array * np.sin(2*Xi*np.arange(1, 6))
-                     ) @ np.cosh(2*Eta*np.arange(1, 6))
-    Eta_comma = Eta - (beta_array * np.cos(2*Xi*np.arange(1, 6))
-                       ) @ np.sinh(2*Eta*np.arange(1, 6))
-
-    chi = np.arcsin(np.sin(Xi_comma)/np.cosh(Eta_comma))
-    latitude = chi + delta_array @ np.sin(2*chi*np.arange(1, 7))
-    longitude = lambda0_rad + np.arctan(np.sinh(Eta_comma)/np.cos(Xi_comma))
-
-    return [np.rad2deg(latitude), np.rad2deg(longitude)]
+    return list(convert_cartesian_to_lat_long_array(x, y, phi0_deg, lambda0_deg))
 
 
 def convert_lat_long_to_cartesian(phi_deg, lambda_deg, phi0_deg, lambda0_deg):
-    """緯度経度を平面直角座標に変換する
+    """緯度経度を平面直角座標に変換する (複数点をまとめて変換する場合は convert_lat_long_to_cartesian_array を使用する)
 
     Args:
         phi_deg (float): 変換したい緯度[度]（分・秒でなく小数であることに注意）
@@ -84,57 +201,7 @@ def convert_lat_long_to_cartesian(phi_deg, lambda_deg, phi0_deg, lambda0_deg):
     Returns:
         [float, float]: x, y (変換後の平面直角座標[m])
     """
-    # 緯度経度・平面直角座標系原点をラジアンに直す
-    phi_rad = np.deg2rad(phi_deg)
-    lambda_rad = np.deg2rad(lambda_deg)
-    phi0_rad = np.deg2rad(phi0_deg)
-    lambda0_rad = np.deg2rad(lambda0_deg)
-
-    # 定数 (a, F: 世界測地系-測地基準系1980（GRS80）楕円体)
-    m0 = 0.9999
-    a = 6378137
-    F = 298.257222101
-
-    n = 1/(2*F - 1)
-    A0 = 1 + n**2/4 + n**4/64
-    A1 = (-3/2) * (n - n**3/8 - n**5/64)
-    A2 = (15/16) * (n**2 - n**4/4)
-    A3 = (-35/48) * (n**3 - (5/16)*(n**5))
-    A4 = (315/512) * n**4
-    A5 = (-693/1280) * n**5
-
-    alpha1 = n/2 - 2*n**2/3 + 5*(n**3)/16 + 41*(n**4)/180 - 127*(n**5)/288
-    alpha2 = 13*n**2/48 - 3*(n**3)/5 + 557*(n**4)/1440 + 281*(n**5)/630
-    alpha3 = 61*(n**3)/240 - 103*(n**4)/140 + 15061*(n**5)/26880
-    alpha4 = 49561*(n**4)/161280 - 179*(n**5)/168
-    alpha5 = 34729*(n**5)/80640
-
-    A_arr = np.array([A0, A1, A2, A3, A4, A5])
-    alpha_arr = np.array([alpha1, alpha2, alpha3, alpha4, alpha5])
-
-    Sphi0_hat = (m0*a / (1+n)) * (A0*phi0_rad +
-                                  A_arr[1:] @ np.sin(2*phi0_rad*np.arange(1, 6)))
-    A_hat = (m0*a / (1+n)) * A0
-
-    lambda_c = np.cos(lambda_rad - lambda0_rad)
-    lambda_s = np.sin(lambda_rad - lambda0_rad)
-
-    t1 = 2*np.sqrt(n)/(1+n)
-    t = np.sinh(np.arctanh(np.sin(phi_rad)) -
-                t1*np.arctanh(t1*np.sin(phi_rad)))
-    t_hat = np.sqrt(1 + pow(t, 2))
-
-    Xi_comma = np.arctan(t/lambda_c)
-    Eta_comma = np.arctanh(lambda_s/t_hat)
-
-    sum_2 = (alpha_arr * np.sin(2*Xi_comma*np.arange(1, 6))
-             ) @ np.cosh(2*Eta_comma*np.arange(1, 6))
-    sum_3 = (alpha_arr * np.cos(2*Xi_comma*np.arange(1, 6))
-             ) @ np.sinh(2*Eta_comma*np.arange(1, 6))
-    x = A_hat * (Xi_comma + sum_2) - Sphi0_hat
-    y = A_hat * (Eta_comma + sum_3)
-
-    return [x, y]
+    return list(convert_lat_long_to_cartesian_array(phi_deg, lambda_deg, phi0_deg, lambda0_deg))
 
 
 def cvt_plane_cartesian_to_world(xp, yp):
@@ -3,19 +3,54 @@ import csv
 import json
 import math
 import os
+import pickle
 import shutil
 
 import cv2
 import numpy as np
-from tqdm import tqdm
 
 from commons import image_util
 from commons.constants import *
+from commons.detection_cache import DetectionCache, calc_file_hash, calc_frame_set_hash
+from commons.detection_checkpoint import DetectionCheckpoint
+from commons.ground_plane_lut import GroundPlaneLUT
+from commons.relative_coord import (
+    PROJ_MODE_CENTER,
+    PROJ_MODE_EQUIDISTANT,
+    calc_direction_coords,
+    calc_relative_coords,
+    calc_vertical_aov,
+)
+from commons.result_io import REL_COORD_FORMATS, RESULT_FORMAT_JSON
+from commons.result_stream import ResultStreamWriter, convert_result_stream_to_json
+from tools.visualization_writer import VisualizationWriter
 from yolo.detector import DetectorYOLOv8
 
 ROUNDED_DIGIT_NUM = 6
 
 
+def get_image_size(img_path, image_size=None):
+    """画像の解像度(w, h)を取得する
+
+    Args:
+        img_path (str): 入力画像のパス
+        image_size (Tuple[int, int]): 画像の解像度(w, h)。指定した場合は画像を読み込まない
+
+    Returns:
+        Tuple[int, int]: 画像の解像度(w, h)
+    """
+    if image_size is not None:
+        return image_size
+
+    if not os.path.exists(img_path):
+        print(f"File [{img_path}] is not found.")
+        return
+
+    img = image_util.read_image(img_path)
+    h, w = img.shape[:2]
+    return w, h
+
+
 def calc_dist_ctr_proj(
     img_path,
     theta,
@@ -23,6 +58,7 @@ def calc_dist_ctr_proj(
     camera_elevation_angle,
     camera_height,
     return_extra=False,
+    image_size=None,
 ):
     """画像から検出した車両情報から車両までの距離を推定する機能です。(中心射影)
 
@@ -33,43 +69,32 @@ def calc_dist_ctr_proj(
         camera_elevation_angle (float): カメラの仰角(degrees)
         camera_height (float): カメラの高さ
         return_extra (float): 計算した距離の他は返すかどうか
+        image_size (Tuple[int, int]): 画像の解像度(w, h)。指定した場合は画像を読み込まない
 
     Returns:
         float: 車までの距離
     """
-    if not os.path.exists(img_path):
-        print(f"File [{img_path}] is not found.")
-        return
-
     # 画像の解像度を(w, h)とする。
-    img = image_util.read_image(img_path)
-    h, w, _ = img.shape
-
-    # 垂直視野角Φ(phi)を計算する
-    theta_rad = math.radians(theta)
-    tan_phi_half = (h / w) * math.tan(theta_rad / 2)
-    phi = 2 * math.atan(tan_phi_half)
-
-    # 車を検出したときの下向きの視点の角度をψ(psi_y)と呼びます。
-    cy = h / 2
-    if y == cy and camera_elevation_angle == 0:
+    image_size = get_image_size(img_path, image_size)
+    if image_size is None:
         return
+    w, h = image_size
 
-    y = y - cy
-    tan_psi_y = (y / cy) * math.tan(phi / 2)
-    psi_y = math.atan(tan_psi_y)
+    if y == h / 2 and camera_elevation_angle == 0:
+        return
 
-    # 車までの奥行き方向の距離
-    camera_elevation_angle_rad = math.radians(camera_elevation_angle)
-    dy = camera_height / math.tan(psi_y - camera_elevation_angle_rad)
+    _, dy, _, _, psi_y = calc_relative_coords(
+        [w / 2], [y], image_size, theta, camera_elevation_angle, camera_height, PROJ_MODE_CENTER
+    )
+    dy = float(dy[0])
 
     if not return_extra:
         return dy
-    return dy, w, h, phi, psi_y
+    phi = float(calc_vertical_aov(image_size, theta, PROJ_MODE_CENTER))
+    return dy, w, h, phi, float(psi_y[0])
 
 
-# 対象の相対座標の計算(中心射影方式)
-def calc_relative_coord_ctr_proj(
+def calc_relative_coord(
     img_path,
     theta,
     y,
@@ -77,8 +102,10 @@ def calc_relative_coord_ctr_proj(
     camera_elevation_angle,
     camera_height,
     return_extra=False,
+    image_size=None,
+    proj_mode=PROJ_MODE_CENTER,
 ):
-    """対象の相対座標の計算(中心射影方式)
+    """対象1台の相対座標の計算 (複数台まとめて計算する場合は calc_relative_coords を使用する)
 
     Args:
         img_path (str): 入力画像のパス
@@ -88,55 +115,37 @@ def calc_relative_coord_ctr_proj(
         camera_elevation_angle (float): カメラの仰角(degrees)
         camera_height (float): カメラの高さ
         return_extra (float): 計算した相対座標の他は返すかどうか
+        image_size (Tuple[int, int]): 画像の解像度(w, h)。指定した場合は画像を読み込まない
+        proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
 
     Returns:
         Tuple[float, float, float]: 対象の相対座標
     """
+    image_size = get_image_size(img_path, image_size)
+    if image_size is None:
+        return
+    w, h = image_size
 
-    # 画像の中心座標
-    c_x, c_y = image_util.get_center_coordinates(img_path)
-
-    if return_extra:
-        dy, w, h, phi, psi_y = calc_dist_ctr_proj(
-            img_path,
-            theta,
-            y,
-            camera_elevation_angle,
-            camera_height,
-            return_extra=return_extra,
-        )
-    else:
-        dy = calc_dist_ctr_proj(
-            img_path,
-            theta,
-            y,
-            camera_elevation_angle,
-            camera_height,
-            return_extra=return_extra,
-        )
+    if proj_mode == PROJ_MODE_CENTER and y == h / 2 and camera_elevation_angle == 0:
+        return
 
-    # x方向の距離
-    x = x - c_x
-    theta_rad = math.radians(theta)
-    tan_psi_x = (x / c_x) * math.tan(theta_rad / 2)
-    psi_x = math.atan(tan_psi_x)
-    dx = dy * tan_psi_x
+    dx, dy, d, psi_x, psi_y = calc_relative_coords(
+        [x], [y], image_size, theta, camera_elevation_angle, camera_height, proj_mode
+    )
 
     # 対象車の空間座標
     # (dx, dy, -1.6)となる(単位m)
-    relative_coordinates = (dx, dy, -camera_height)
-
-    # 車までの直線距離
-    d = math.sqrt(dx * dx + dy * dy)
+    relative_coordinates = (float(dx[0]), float(dy[0]), -camera_height)
 
     if not return_extra:
         return relative_coordinates
 
-    return (relative_coordinates, w, h, phi, psi_y, psi_x, d)
+    phi = float(calc_vertical_aov(image_size, theta, proj_mode))
+    return (relative_coordinates, w, h, phi, float(psi_y[0]), float(psi_x[0]), float(d[0]))
 
 
-# 対象の相対座標の計算(等距離射影方式)
-def calc_relative_coord_equidistant_proj(
+# 対象の相対座標の計算(中心射影方式)
+def calc_relative_coord_ctr_proj(
     img_path,
     theta,
     y,
@@ -144,8 +153,9 @@ def calc_relative_coord_equidistant_proj(
     camera_elevation_angle,
     camera_height,
     return_extra=False,
+    image_size=None,
 ):
-    """対象の相対座標の計算(等距離射影方式)
+    """対象の相対座標の計算(中心射影方式)
 
     Args:
         img_path (str): 入力画像のパス
@@ -155,63 +165,53 @@ def calc_relative_coord_equidistant_proj(
         camera_elevation_angle (float): カメラの仰角(degrees)
         camera_height (float): カメラの高さ
         return_extra (float): 計算した相対座標の他は返すかどうか
+        image_size (Tuple[int, int]): 画像の解像度(w, h)。指定した場合は画像を読み込まない
 
     Returns:
         Tuple[float, float, float]: 対象の相対座標
     """
-    if not os.path.exists(img_path):
-        print(f"File [{img_path}] is not found.")
-        return
-
-    # 画像の解像度を(w, h)とする。
-    img = image_util.read_image(img_path)
-    h, w, _ = img.shape
-
-    # 画像中心の座標
-    cx, cy = w / 2, h / 2
-
-    theta_rad = math.radians(theta)
-
-    # 垂直方向の視野角Φ
-    phi = theta_rad * (h / w)
-
-    # 対象点と画像中心の距離
-    dist_to_center = math.sqrt((x - cx)**2 + (y - cy)**2)
-
-    # 対象点への対角方向角
-    psi_xy = dist_to_center / w * theta_rad
-
-    # 奥行きピクセル距離
-    ptemp = dist_to_center * (1 / math.tan(psi_xy))
-
-    # 対象点への水平方向角
-    psi_x = math.atan((x - cx) / ptemp)
-
-    # 対象点への垂直方向角
-    psi_y = math.atan((y - cy) / ptemp)
-
-    camera_elevation_angle_rad = math.radians(camera_elevation_angle)
-    dy = camera_height / math.tan(psi_y - camera_elevation_angle_rad)
-    dx = dy * math.tan(psi_x)
+    return calc_relative_coord(
+        img_path, theta, y, x, camera_elevation_angle, camera_height, return_extra, image_size, PROJ_MODE_CENTER
+    )
 
-    # 車までの直線距離
-    d = math.sqrt(dx**2 + dy**2)
 
-    # 対象車の空間座標
-    relative_coordinates = (dx, dy, -camera_height)
+# 対象の相対座標の計算(等距離射影方式)
+def calc_relative_coord_equidistant_proj(
+    img_path,
+    theta,
+    y,
+    x,
+    camera_elevation_angle,
+    camera_height,
+    return_extra=False,
+    image_size=None,
+):
+    """対象の相対座標の計算(等距離射影方式)
 
-    if not return_extra:
-        return relative_coordinates
+    Args:
+        img_path (str): 入力画像のパス
+        theta (float): 水平視野角θの値(degrees)
+        y (float): 車を検出したときの下側の高さ方向のピクセル
+        x (float): 検出車矩形の中央下部の座標
+        camera_elevation_angle (float): カメラの仰角(degrees)
+        camera_height (float): カメラの高さ
+        return_extra (float): 計算した相対座標の他は返すかどうか
+        image_size (Tuple[int, int]): 画像の解像度(w, h)。指定した場合は画像を読み込まない
 
-    return (relative_coordinates, w, h, phi, psi_y, psi_x, d)
+    Returns:
+        Tuple[float, float, float]: 対象の相対座標
+    """
+    return calc_relative_coord(
+        img_path, theta, y, x, camera_elevation_angle, camera_height, return_extra, image_size, PROJ_MODE_EQUIDISTANT
+    )
 
 
 # 車検出結果及び車の相対座標を可視化する
 def visualize_result(image, bbox, obj_name, coord, id):
-    """車検出結果及び車の相対座標を可視化する
+    """車検出結果及び車の相対座標を可視化する (画像に直接描画する)
 
     Args:
-        image (np.ndarray): 画像
+        image (np.ndarray): 画像 (描画先)
         bbox (np.ndarray): 矩形
         obj_name (str): 検出対象（車）
         coord (list): 車の相対座標
@@ -238,9 +238,8 @@ def visualize_result(image, bbox, obj_name, coord, id):
     text_pos = (new_bbox[0], new_bbox[1] - 5)
 
     # draw bbox & relative coord of object
-    output_image = np.copy(image)
     output_image = cv2.rectangle(
-        output_image,
+        image,
         (new_bbox[0], new_bbox[1]),
         (new_bbox[2], new_bbox[3]),
         BBOX_COLOR,
@@ -274,6 +273,171 @@ def visualize_result(image, bbox, obj_name, coord, id):
 
     return output_image
 
+
+def save_visualization(output_fpath, image, bboxes, names, coords, ids, image_type):
+    """1フレームの全検出車を描画し、可視化画像を保存する
+
+    Args:
+        output_fpath (str): 可視化画像の保存先
+        image (np.ndarray): 画像 (描画先。コピーせずに直接描画する)
+        bboxes (np.ndarray): 矩形のリスト
+        names (list): 検出対象（車）のリスト
+        coords (list): 車の相対座標のリスト
+        ids (list): 検出車のidのリスト
+        image_type (str): 画像の拡張子
+    """
+    for bbox, name, coord, obj_id in zip(bboxes, names, coords, ids):
+        visualize_result(image, bbox, name, coord, obj_id)
+    image_util.save_image(output_fpath, image, image_type=image_type)
+
+def iter_cached_detections(records, labels, input_dir, output_dir, visualize_interval=1, skip_frames=0):
+    """キャッシュした物体検出・トラッキング結果をフレーム順に返す
+
+    入力画像フォルダに画像がある場合のみ、可視化するフレームの画像を読み込む。
+
+    Args:
+        records (list): フレームごとの(画像名, 解像度(w, h), 矩形のリスト, クラス名のリスト, トラッキングIDのリスト)のリスト
+        labels (str): ラベルファイル(labels.txt)の内容
+        input_dir (str | FrameStream): 入力画像フォルダパス、または補正済みフレームのストリーム
+        output_dir (str): 出力結果フォルダパス
+        visualize_interval (int): 可視化するフレームの間隔 (0の場合は可視化しない)
+        skip_frames (int): 返さない先頭のフレーム数 (チェックポイントから再開する場合の処理済みのフレーム数)
+
+    Yields:
+        Tuple[str, np.ndarray, Tuple[int, int], list, list, list]:
+            画像パス、入力画像(可視化しないフレーム、読み込めない場合はNone)、解像度(w, h)、矩形、クラス名、トラッキングID
+    """
+    # 物体検出を実行した場合と同じラベルファイルを出力する
+    labels_dir = os.path.join(output_dir, "labels")
+    os.makedirs(labels_dir, exist_ok=True)
+    with open(os.path.join(labels_dir, "labels.txt"), "w", encoding="utf-8") as f:
+        f.write(labels)
+
+    for frame_idx, (image_name, image_size, detect_bboxes, detect_names, tracking_ids) in enumerate(
+        records[skip_frames:], start=skip_frames
+    ):
+        image_path = image_name
+        input_image = None
+        if isinstance(input_dir, str) and visualize_interval > 0 and frame_idx % visualize_interval == 0:
+            image_path = os.path.join(input_dir, image_name)
+            if os.path.exists(image_path):
+                input_image = image_util.read_image(image_path)
+        yield image_path, input_image, image_size, detect_bboxes, detect_names, tracking_ids
+
+
+def iter_detections(detector, input_dir, output_dir, detection_cache=None, skip_frames=0):
+    """物体検出・トラッキングを実行し、結果をフレーム順に返す
+
+    detection_cache を指定した場合は、全フレームの検出後に結果をキャッシュに保存する。
+
+    Args:
+        detector (DetectorYOLOv8): モデルを読み込んだ検出器
+        input_dir (str | FrameStream): 入力画像フォルダパス、または補正済みフレームのストリーム
+        output_dir (str): 出力結果フォルダパス
+        detection_cache (DetectionCache): 検出結果のキャッシュ (Noneの場合は保存しない)
+        skip_frames (int): 検出しない先頭のフレーム数 (チェックポイントから再開する場合の処理済みのフレーム数)
+
+    Yields:
+        Tuple[str, np.ndarray, Tuple[int, int], list, list, list]:
+            画像パス、入力画像、解像度(w, h)、矩形、クラス名、トラッキングID
+    """
+    records = []
+    for (
+        image_path,
+        input_image,
+        detect_bboxes,
+        _,
+        detect_names,
+        tracking_ids,
+    ) in detector.iter_detect_ultralytics(
+        input_dir, output_dir, target_class=TARGET_DETECTION_CLASS, skip_frames=skip_frames
+    ):
+        image_size = (input_image.shape[1], input_image.shape[0])
+        if detection_cache is not None:
+            records.append((os.path.basename(image_path), image_size, detect_bboxes, detect_names, tracking_ids))
+        yield image_path, input_image, image_size, detect_bboxes, detect_names, tracking_ids
+
+    if detection_cache is not None:
+        with open(os.path.join(output_dir, "labels", "labels.txt"), "r", encoding="utf-8") as f:
+            labels = f.read()
+        detection_cache.save(records, labels)
+
+
+def update_checkpoint(checkpoint, checkpoint_interval, num_frames, detector, result_writer, visualization_writer,
+                      output_dir, warning_detect_imgs):
+    """checkpoint_interval フレームごとにチェックポイントを保存する
+
+    Args:
+        checkpoint (DetectionCheckpoint): チェックポイント (Noneの場合は保存しない)
+        checkpoint_interval (int): チェックポイントを保存するフレームの間隔
+        num_frames (int): 処理済みのフレーム数
+        detector (DetectorYOLOv8): 検出器
+        result_writer (ResultStreamWriter): 結果の書き込み先
+        visualization_writer (VisualizationWriter): 可視化画像の描画・保存
+        output_dir (str): 出力結果フォルダパス
+        warning_detect_imgs (list): 車を検出できなかった画像名のリスト
+
+    Returns:
+        DetectionCheckpoint: チェックポイント (トラッカーの状態を保存できない場合はNone)
+    """
+    if checkpoint is None or num_frames % checkpoint_interval != 0:
+        return checkpoint
+
+    try:
+        tracker_state = detector.get_tracker_state() if detector.tracker is not None else None
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        print(f"Warning: トラッカーの状態を保存できないため、チェックポイントを保存しません。: {e}")
+        return None
+
+    # 再開時は処理済みのフレームの可視化画像を出力しないため、保存が終わるまで待つ
+    visualization_writer.flush()
+
+    labels_path = os.path.join(output_dir, "labels", "labels.txt")
+    checkpoint.save({
+        "num_frames": num_frames,
+        "num_results": result_writer.num_results,
+        "labels_size": os.path.getsize(labels_path) if os.path.exists(labels_path) else 0,
+        "warning_detect_imgs": warning_detect_imgs,
+        "tracker": tracker_state,
+    })
+    return checkpoint
+
+
+def make_camera_parameter(
+    image_size,
+    theta,
+    camera_height,
+    camera_elevation_angle,
+    camera_horizontal_angle,
+    proj_mode,
+):
+    """結果ファイルに出力するカメラパラメータを作成する
+
+    Args:
+        image_size (Tuple[int, int]): 画像の解像度(w, h)
+        theta (float): 水平視野角θの値(degrees)
+        camera_height (float): カメラ高さ
+        camera_elevation_angle (float): カメラの仰角(degrees)
+        camera_horizontal_angle (float): 進行方向とカメラの水平方向とのなす角度(degrees)
+        proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
+
+    Returns:
+        dict: カメラパラメータ
+    """
+    w, h = image_size
+    phi_deg = round(math.degrees(calc_vertical_aov(image_size, theta, proj_mode)), ROUNDED_DIGIT_NUM)
+
+    return {
+        "aov_horizontal": theta,
+        "aov_vertical": phi_deg,
+        "image_size": [w, h],    
+        "camera_height" : camera_height,
+        "camera_elevation_angle" : camera_elevation_angle,
+        "camera_horizontal_angle" : camera_horizontal_angle,
+        "proj_mode" : proj_mode
+    }
+
+
 # 車の相対座標を検出・推定する
 def detect_and_calc(
     input_dir,
@@ -285,11 +449,27 @@ def detect_and_calc(
     proj_mode,
     max_distance_tracker,
     max_dissappear_num_tracker,
+    detection_batch_size=DETECTION_BATCH_SIZE,
+    tracker=DETECTION_TRACKER,
+    detection_backend=DETECTION_BACKEND,
+    detection_int8=DETECTION_INT8,
+    int8_calibration_dir=None,
+    detection_cache_dir=None,
+    distance_lut=DISTANCE_LUT,
+    lut_cache_dir=None,
+    visualize_interval=1,
+    output_format=RESULT_FORMAT_JSON,
+    checkpoint=None,
+    checkpoint_interval=0,
+    resume_state=None,
 ):
     """車の相対座標を検出・推定する
 
+    結果はフレームごとに detection_distance_result.jsonl に書き込むため、メモリ使用量はフレーム数によらない。
+    異常終了した場合も、書き込み済みのフレームの結果はファイルに残る。
+
     Args:
-        input_dir (str): 入力画像フォルダパス
+        input_dir (str | FrameStream): 入力画像フォルダパス、または補正済みフレームのストリーム
         output_dir (str): 出力結果フォルダパス
         theta (float): 水平視野角θの値(degrees)
         camera_height (float): カメラ高さ
@@ -301,6 +481,29 @@ def detect_and_calc(
         max_dissappear_frame_num (int):
             検知が途切れた場合に保持し続けるフレーム数。
             一時的に検知が途切れても、このフレーム数以内に復活する場合はトラッキングが途切れない。（同一IDが振られる）
+        detection_batch_size (int): 1回の推論で検出するフレーム数 (1の場合は1フレームずつトラッキング)
+        tracker (str): トラッカーの設定ファイル (botsort.yaml / bytetrack.yaml)
+        detection_backend (str): 推論バックエンド (pytorch / openvino / onnx)
+        detection_int8 (bool): INT8量子化したモデルを使用するかどうか (openvinoのみ)
+        int8_calibration_dir (str):
+            INT8量子化のキャリブレーションに使用する画像フォルダパス。
+            Noneの場合は入力画像フォルダを使用する(フレームストリームの場合はFP32モデルを使用する)
+        detection_cache_dir (str):
+            物体検出結果のキャッシュの保存先フォルダパス (Noneの場合はキャッシュしない)。
+            フレームセット・モデルの重み・閾値・トラッカー設定が同じキャッシュがある場合は、物体検出を実行しない
+        distance_lut (bool): 画素ごとの相対座標のテーブル(GroundPlaneLUT)から相対座標を求めるかどうか
+        lut_cache_dir (str): 相対座標のテーブルの保存先フォルダパス (Noneの場合は保存しない)
+        visualize_interval (int):
+            可視化画像を出力するフレームの間隔 (1: 全フレーム、N: Nフレームごと、0: 出力しない)。
+            描画・保存はバックグラウンドのスレッドで実行する
+        output_format (str):
+            結果ファイルの形式 (json: 全フレームの書き込み後に detection_distance_result.json に変換する、
+            jsonl: detection_distance_result.jsonl のまま出力する)
+        checkpoint (DetectionCheckpoint): チェックポイント (Noneの場合は保存しない)
+        checkpoint_interval (int): チェックポイントを保存するフレームの間隔
+        resume_state (dict):
+            再開するチェックポイントの状態 (Noneの場合は最初から実行する)。
+            処理済みのフレームは検出せず、トラッカーを保存した状態に戻して続きのフレームから検出する
 
     """
 
@@ -310,87 +513,143 @@ def detect_and_calc(
     detector.IOU_THD = DETECTION_IOU_THD
     detector.MAX_DISTANCE_TRACKER = max_distance_tracker
     detector.MAX_DISSAPPEAR_FRAME_NUM_TRACKER = max_dissappear_num_tracker
-    
-    detector.load_model()
-    (
-        image_path_list,
-        abs_detect_bbox_list,
-        rel_detect_bbox_list,
-        detect_name_list,
-        tracking_id_list,
-    ) = detector.detect_ultralytics(
-        input_dir, output_dir, target_class=TARGET_DETECTION_CLASS
-    )
-
-    data_results = []
-
-    # calculate relative coordinate of objects
-    print("Calculate relative coordinate of objects")
-    image_num = len(image_path_list)
+    detector.BATCH_SIZE = detection_batch_size
+    detector.TRACKER = tracker
+
+    # 検出結果はカメラパラメータに依存しないため、カメラパラメータ以外が同じ場合はキャッシュを使用する
+    detection_cache = None
+    cached_detections = None
+    if detection_cache_dir is not None:
+        detection_cache = DetectionCache(detection_cache_dir, {
+            "frames": calc_frame_set_hash(input_dir),
+            "weights": calc_file_hash(YOLO_V8_MODEL_FILE),
+            "target_class": TARGET_DETECTION_CLASS,
+            "conf_thd": detector.CONF_THD,
+            "iou_thd": detector.IOU_THD,
+            "offset_thd": detector.OFFSET_THD,
+            "depricate_iou_thd": DEPRICATE_IOU_THD,
+            "tracker": detector.get_tracker_settings(),
+            "batch_size": detection_batch_size,
+            "backend": detection_backend,
+            "int8": detection_int8,
+        })
+        cached_detections = detection_cache.load()
+
+    if cached_detections is None and resume_state is not None and resume_state["tracker"] is None:
+        print("Warning: チェックポイントにトラッカーの状態が無いため、最初から実行します。")
+        resume_state = None
+    # 処理済みのフレーム数
+    skip_frames = 0 if resume_state is None else resume_state["num_frames"]
+
+    if cached_detections is not None:
+        detection_results = iter_cached_detections(
+            *cached_detections, input_dir, output_dir, visualize_interval, skip_frames
+        )
+    else:
+        if int8_calibration_dir is None and isinstance(input_dir, str):
+            int8_calibration_dir = input_dir
+        detector.load_model(
+            backend=detection_backend,
+            int8=detection_int8,
+            calibration_dir=int8_calibration_dir,
+        )
+        if checkpoint is not None:
+            detector.enable_tracker_state()
+        if resume_state is not None:
+            detector.set_tracker_state(resume_state["tracker"])
+            # ラベルファイルはチェックポイント以降に追記した行を削除して続きから追記する
+            with open(os.path.join(output_dir, "labels", "labels.txt"), "r+b") as f:
+                f.truncate(resume_state["labels_size"])
+            # 処理済みのフレームの検出結果が無いため、キャッシュは保存しない
+            detection_cache = None
+        detection_results = iter_detections(detector, input_dir, output_dir, detection_cache, skip_frames)
+
+    # 結果はフレームごとに書き込む (ヘッダーのカメラパラメータは最初のフレームの解像度から求める)
+    stream_file_name = os.path.join(output_dir, REL_COORD_STREAM_FILE_NAME)
+    result_writer = ResultStreamWriter(stream_file_name, resume=resume_state is not None)
     warning_detect_imgs = []
-
-    for ii, image_path, detect_bboxes, detect_names, tracking_ids in tqdm(
-        zip(
-            list(range(image_num)),
-            image_path_list,
-            abs_detect_bbox_list,
-            detect_name_list,
-            tracking_id_list,
-        ),
-        total = image_num,
-        desc = "Processing"
-    ):
+    if resume_state is not None:
+        # チェックポイント以降に書き込んだ結果は再度書き込むため削除する
+        result_writer.truncate(resume_state["num_results"])
+        warning_detect_imgs = list(resume_state["warning_detect_imgs"])
+        print(f"チェックポイントから再開します。(処理済みフレーム数: {skip_frames})")
+    # 解像度(w, h)ごとの相対座標のテーブル
+    luts = {}
+
+    # 可視化画像の描画・保存はバックグラウンドで実行する
+    visualization_writer = VisualizationWriter()
+
+    # detect objects & calculate relative coordinate of objects frame by frame
+    for frame_idx, (
+        image_path,
+        input_image,
+        image_size,
+        detect_bboxes,
+        detect_names,
+        tracking_ids,
+    ) in enumerate(detection_results, start=skip_frames):
         image_fn = os.path.basename(image_path)
         frame = os.path.splitext(image_fn)[0].split("_")[-1]
         frame = int(frame)
         detections = []
 
+        if result_writer.header is None:
+            result_writer.write_header({
+                "camera_parameter": make_camera_parameter(
+                    image_size, theta, camera_height, camera_elevation_angle, camera_horizontal_angle, proj_mode
+                ),
+            })
+
         if len(detect_names) == 0:
             warning_detect_imgs.append(image_fn)
+            checkpoint = update_checkpoint(
+                checkpoint, checkpoint_interval, frame_idx + 1, detector, result_writer, visualization_writer,
+                output_dir, warning_detect_imgs
+            )
             continue
 
-        input_image = image_util.read_image(image_path)
-        output_image = np.copy(input_image)
-        relative_dxs = []
         relative_coordinates_list = []
 
-        for jj, detect_name in enumerate(detect_names):
-            y = detect_bboxes[jj][3]
-            x = (detect_bboxes[jj][0] + detect_bboxes[jj][2]) / 2
-
-            # calculate relative coordinate
-            if proj_mode == 0:
-                results = calc_relative_coord_ctr_proj(
-                    image_path, theta, y, x, camera_elevation_angle, camera_height, True
-                )
-            elif proj_mode == 1:
-                results = calc_relative_coord_equidistant_proj(
-                    image_path, theta, y, x, camera_elevation_angle, camera_height, True
+        # calculate relative coordinate of all objects in the frame
+        detect_bboxes = np.asarray(detect_bboxes, dtype=np.float64)
+        xs = (detect_bboxes[:, 0] + detect_bboxes[:, 2]) / 2
+        ys = detect_bboxes[:, 3]
+        if distance_lut:
+            if image_size not in luts:
+                luts[image_size] = GroundPlaneLUT(
+                    image_size, theta, camera_elevation_angle, camera_height, proj_mode, lut_cache_dir,
                 )
+            _, _, ds, psi_xs, psi_ys = luts[image_size].lookup(xs, ys)
+        else:
+            _, _, ds, psi_xs, psi_ys = calc_relative_coords(
+                xs, ys, image_size, theta, camera_elevation_angle, camera_height, proj_mode
+            )
+        d_cameras = [round(d, ROUNDED_DIGIT_NUM) for d in ds.tolist()]
+
+        # 進行方向に対してdx、dyの距離を計算する
+        dx_directions, dy_directions = calc_direction_coords(
+            np.array(d_cameras), psi_xs, camera_horizontal_angle
+        )
+        psi_x_degs = np.degrees(psi_xs).tolist()
+        psi_y_degs = np.degrees(psi_ys).tolist()
+
+        for jj, detect_name in enumerate(detect_names):
+            x = xs[jj]
+            y = ys[jj]
+            psi_y_deg = round(psi_y_degs[jj], ROUNDED_DIGIT_NUM)
+            psi_x_deg = round(psi_x_degs[jj], ROUNDED_DIGIT_NUM)
+            d_camera = d_cameras[jj]
+            dx_direction = round(float(dx_directions[jj]), ROUNDED_DIGIT_NUM)
+            dy_direction = round(float(dy_directions[jj]), ROUNDED_DIGIT_NUM)
 
-            relative_coordinates = results[0]
-            w, h = results[1], results[2]
-            phi_deg = round(math.degrees(results[3]), ROUNDED_DIGIT_NUM)
-            psi_y_deg = round(math.degrees(results[4]), ROUNDED_DIGIT_NUM)
-            psi_x_deg = round(math.degrees(results[5]), ROUNDED_DIGIT_NUM)
-            dx_camera = round(relative_coordinates[0], ROUNDED_DIGIT_NUM)
-            dy_camera = round(relative_coordinates[1], ROUNDED_DIGIT_NUM)
-            d_camera = round(results[6], ROUNDED_DIGIT_NUM)
-            
-            # 進行方向に対してdx、dyの距離を計算する
-            camera_horizontal_angle_rad = math.radians(camera_horizontal_angle)
-            dx_direction = round(d_camera * math.sin(results[5] + camera_horizontal_angle_rad), ROUNDED_DIGIT_NUM)
-            dy_direction = round(d_camera * math.cos(results[5] + camera_horizontal_angle_rad), ROUNDED_DIGIT_NUM)
-            
-            relative_dxs.append(dx_direction)
             relative_coordinates_list.append([dx_direction, dy_direction, -camera_height])
 
             obj_id = tracking_ids[jj] + 1
 
             # [カメラの中心から検出車下部までの幅に対応する角度 (β)]と
             # [カメラの仰角(γ)]との間の差(β-γ)を求めて
-            camera_elevation_angle_rad = math.radians(camera_elevation_angle)
-            diff_angle = results[4] - camera_elevation_angle_rad
+            # camera_elevation_angle_rad = math.radians(camera_elevation_angle)
+            # diff_angle = psi_ys[jj] - camera_elevation_angle_rad
 
             # if (diff_angle < 0) or (abs(diff_angle) < CAMERA_ELEVATION_ANGLE_DIFF_THD):
             #     print(f"Warning: Object {obj_id} is higher than camera.")
@@ -404,23 +663,24 @@ def detect_and_calc(
             }
             detections.append(detection_result_elem)   
         
-        # visualize detected object & relative coordinate
-        for jj, detect_name in enumerate(detect_names):
-            obj_id = tracking_ids[jj] + 1
-
-            output_image = visualize_result(
-                output_image,
-                detect_bboxes[jj],
-                detect_name,
-                relative_coordinates_list[jj],
-                obj_id,
-            )
-
-        # save visualization image
         image_fn_prefix, ext = os.path.splitext(image_fn)
         output_fn = f"{image_fn_prefix}{REL_COORD_IMG_SUFFIX}{ext}"
         output_fpath = os.path.join(output_dir, output_fn)
-        image_util.save_image(output_fpath, output_image, image_type=ext)
+
+        # visualize detected object & relative coordinate
+        # (visualize_interval フレームごと。キャッシュを使用し、入力画像が無い場合は可視化しない)
+        # 入力画像は以降の処理で使用しないため、コピーせずに直接描画する
+        if input_image is not None and visualize_interval > 0 and frame_idx % visualize_interval == 0:
+            visualization_writer.submit(
+                save_visualization,
+                output_fpath,
+                input_image,
+                detect_bboxes,
+                detect_names,
+                relative_coordinates_list,
+                [obj_id + 1 for obj_id in tracking_ids],
+                ext,
+            )
 
         data_result = {
             "file": output_fpath,
@@ -429,41 +689,48 @@ def detect_and_calc(
             },
             "detections": detections
         }
-        data_results.append(data_result)
+        result_writer.write(data_result)
+        checkpoint = update_checkpoint(
+            checkpoint, checkpoint_interval, frame_idx + 1, detector, result_writer, visualization_writer,
+            output_dir, warning_detect_imgs
+        )
+
+    result_writer.close()
+
+    # 可視化画像の保存が終わるまで待つ
+    visualization_writer.close()
 
     # print warnings
     for img in warning_detect_imgs:
         print(f"Warning: Cannot detect car in image [{img}]")
 
-    data = {
-        "camera_parameter": {
-            "aov_horizontal": theta,
-            "aov_vertical": phi_deg,
-            "image_size": [w, h],    
-            "camera_height" : camera_height,
-            "camera_elevation_angle" : camera_elevation_angle,
-            "camera_horizontal_angle" : camera_horizontal_angle,
-            "proj_mode" : proj_mode
-        },
-        "results": data_results,
-    }
-
     # write to json file
-    json_file_name = output_dir + "/" + REL_COORD_JSON_FILE_NAME
-    with open(json_file_name, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if output_format == RESULT_FORMAT_JSON:
+        json_file_name = output_dir + "/" + REL_COORD_JSON_FILE_NAME
+        convert_result_stream_to_json(stream_file_name, json_file_name)
+        os.remove(stream_file_name)
+
+    # 全フレームの処理が終わったため、チェックポイントは不要
+    if checkpoint is not None:
+        checkpoint.remove()
 
 
-def main():
+def main(argv=None):
     # 引数をパースする
     parser = argparse.ArgumentParser(description="対象の相対座標を計算し、レーン推定を実施する")
-    parser.add_argument(
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
         "--input_dir",
         type=str,
-        required=True,
-        default="input",
+        default=None,
         help="入力画像フォルダパス",
     )
+    input_group.add_argument(
+        "--input_video",
+        type=str,
+        default=None,
+        help="入力動画ファイルパス (指定した場合は動画から直接フレームを読み込み、歪み補正して検出する)",
+    )
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -478,12 +745,85 @@ def main():
         default="input/position_estimation_setting.json",
         help="距離推定の設定ファイル",
     )
+    parser.add_argument(
+        "--frame_skip",
+        type=int,
+        required=False,
+        default=0,
+        help="--input_video指定時のframe-skip（タイプ：int; default=0）",
+    )
+    parser.add_argument(
+        "--intrinsic_camera_matrix_path",
+        type=str,
+        default=None,
+        help="--input_video指定時のカメラ内部パラメータ行列ファイルパス",
+    )
+    parser.add_argument(
+        "--calibration_matrix_P2_path",
+        type=str,
+        default=None,
+        help="--input_video指定時の射影行列(P2)ファイルパス",
+    )
+    parser.add_argument(
+        "--dist_coeffs_path",
+        type=str,
+        default=None,
+        help="--input_video指定時の歪み係数ファイルパス",
+    )
+    parser.add_argument(
+        "--src_output_dir",
+        type=str,
+        default=None,
+        help="--input_video指定時に抽出画像を保存するフォルダパス (指定しない場合は保存しない)",
+    )
+    parser.add_argument(
+        "--distortion_output_dir",
+        type=str,
+        default=None,
+        help="--input_video指定時に補正画像を保存するフォルダパス (指定しない場合は保存しない)",
+    )
+    parser.add_argument(
+        "--map_cache_dir",
+        type=str,
+        default=None,
+        help="--input_video指定時に歪み補正マップを保存するフォルダパス (指定しない場合は保存しない)",
+    )
+    parser.add_argument(
+        "--detection_cache_dir",
+        type=str,
+        default=None,
+        help="物体検出結果のキャッシュの保存先フォルダパス (指定しない場合はキャッシュしない)",
+    )
+    parser.add_argument(
+        "--lut_cache_dir",
+        type=str,
+        default=None,
+        help="設定ファイルの distance_lut が true の場合に、相対座標のテーブルを保存するフォルダパス (指定しない場合は保存しない)",
+    )
+    parser.add_argument(
+        "--visualize_interval",
+        type=int,
+        default=1,
+        help="可視化画像を出力するフレームの間隔 (1: 全フレーム、N: Nフレームごと、0: 出力しない。default=1)",
+    )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        choices=REL_COORD_FORMATS,
+        default=RESULT_FORMAT_JSON,
+        help="結果ファイルの形式 (json: detection_distance_result.json、"
+        "jsonl: フレームごとに1行ずつ書き込んだ detection_distance_result.jsonl。default=json)",
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=int,
+        default=0,
+        help="チェックポイントを保存するフレームの間隔 (0: 保存しない。default=0)。"
+        "同じ引数・設定で再実行した場合は、出力結果フォルダのチェックポイントから再開する",
+    )
 
     # parse input arguments
-    args = parser.parse_args()
-
-    input_dir = args.input_dir
-    assert isinstance(input_dir, str)
+    args = parser.parse_args(argv)
 
     output_dir = args.output_dir
     assert isinstance(output_dir, str)
@@ -496,14 +836,42 @@ def main():
     with open(pos_est_setting_file, "r", encoding="utf-8") as f:
         position_estimation_settings = json.load(f)
 
+    # 同じ引数・設定のチェックポイントがある場合は、出力結果フォルダを残して再開する
+    checkpoint = None
+    resume_state = None
+    if args.checkpoint_interval > 0:
+        checkpoint_args = {key: value for key, value in vars(args).items() if key != "checkpoint_interval"}
+        checkpoint = DetectionCheckpoint(output_dir, {
+            "args": checkpoint_args,
+            "settings": position_estimation_settings,
+        })
+        resume_state = checkpoint.load()
+
     # if output directory is existed, remove and recreate
-    if os.path.exists(output_dir):
+    if resume_state is None and os.path.exists(output_dir):
         shutil.rmtree(output_dir)
     os.makedirs(output_dir, exist_ok=True)
 
+    if args.input_video is not None:
+        from tools.frame_stream import FrameStream
+
+        # 動画から読み込んだフレームを画像ファイルを介さずに検出に渡す
+        input_source = FrameStream(
+            args.input_video,
+            intrinsic_camera_matrix_path=args.intrinsic_camera_matrix_path,
+            calibration_matrix_P2_path=args.calibration_matrix_P2_path,
+            dist_coeffs_path=args.dist_coeffs_path,
+            frame_skip=args.frame_skip,
+            src_output_dir=args.src_output_dir,
+            distortion_output_dir=args.distortion_output_dir,
+            map_cache_dir=args.map_cache_dir,
+        )
+    else:
+        input_source = args.input_dir
+
     # detect cars、calculate relative coordinate
     detect_and_calc(
-        input_dir,
+        input_source,
         output_dir,
         position_estimation_settings["theta"],
         position_estimation_settings["camera_height"],
@@ -512,6 +880,19 @@ def main():
         position_estimation_settings["proj_mode"],
         position_estimation_settings["max_distance"],
         position_estimation_settings["max_dissappear_frame_num"],
+        position_estimation_settings.get("detection_batch_size", DETECTION_BATCH_SIZE),
+        position_estimation_settings.get("tracker", DETECTION_TRACKER),
+        position_estimation_settings.get("detection_backend", DETECTION_BACKEND),
+        position_estimation_settings.get("detection_int8", DETECTION_INT8),
+        position_estimation_settings.get("int8_calibration_dir"),
+        args.detection_cache_dir,
+        position_estimation_settings.get("distance_lut", DISTANCE_LUT),
+        args.lut_cache_dir,
+        args.visualize_interval,
+        args.output_format,
+        checkpoint,
+        args.checkpoint_interval,
+        resume_state,
     )
 
 
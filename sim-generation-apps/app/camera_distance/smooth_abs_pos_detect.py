@@ -1,15 +1,152 @@
 import argparse
-import copy
-import json
 import os
 import sys
 
-from commons.constants import ABS_COORD_JSON_FILE_NAME
+import numpy as np
+
+from commons.detection_model import Detection
+from commons.result_io import get_abs_coord_file_name, get_result_format, load_result_json, save_result_json
+from commons.track_index import TrackIndex
 from cvt_lat_long_cartesian import calc_org_lat_long
-from tools.estimate_abs_pos import interpolate_abs_pos
+from tools.trajectory_smoother import (
+    SMOOTHING_METHODS,
+    SMOOTHING_NEIGHBOR,
+    calc_lat_long,
+    smooth_neighbor_average,
+    smooth_savgol,
+)
+
+
+def get_world_coords(detections):
+    """検出の世界座標を配列にする
+
+    Args:
+        detections (list): 検出(Detection)のリスト
+
+    Returns:
+        np.ndarray: 世界座標(x, y, z) (N, 3) (zが無い場合はNaN)
+    """
+    coords = np.full((len(detections), 3), np.nan)
+    for ii, detection in enumerate(detections):
+        world_coordinate = detection.world_coordinate
+        coords[ii, :len(world_coordinate)] = world_coordinate[:3]
+    return coords
+
+
+def update_detections(detections, coords, velocities, yaws, phi0_deg, lambda0_deg):
+    """平滑化した座標・速度・方向で検出を更新する
+
+    Args:
+        detections (list): 更新する検出(Detection)のリスト
+        coords (np.ndarray): 平滑化した世界座標(x, y, z) (N, 3)
+        velocities (np.ndarray): 速度 (N,)
+        yaws (np.ndarray): 方向(degrees) (N,)
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+    """
+    if not detections:
+        return
+    lat, long = calc_lat_long(coords, phi0_deg, lambda0_deg)
+    for detection, coord, lat_est, lon_est, velocity_est, yaw_est in zip(
+        detections, coords.tolist(), lat.tolist(), long.tolist(), velocities.tolist(), yaws.tolist()
+    ):
+        detection.world_coordinate[0] = coord[0]
+        detection.world_coordinate[1] = coord[1]
+        if len(detection.world_coordinate) > 2:
+            detection.world_coordinate[2] = coord[2]
+        detection.latitude = lat_est
+        detection.longitude = lon_est
+        detection.velocity = velocity_est
+        detection.yaw = yaw_est
+
+
+def smooth_detections_neighbor(output_results, track_index, repeat, phi0_deg, lambda0_deg):
+    """前後フレームの座標からの内挿を繰り返して他車の動きを平滑化する (従来と同じ結果)
+
+    先頭フレームから連続して検出されている物体のみ、全物体をまとめて平滑化する。
 
+    Args:
+        output_results (list): 結果のリスト
+        track_index (TrackIndex): 検出の索引
+        repeat (int): 平滑化の繰り返し数
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+    """
+    # detections of each obj detected continuously from first frame
+    tracks = []
+    for obj_id in track_index.obj_ids():
+        _, result_idxes, _ = track_index.get_track(obj_id)
+        is_continuous = result_idxes == np.arange(len(result_idxes))
+        length = len(result_idxes) if is_continuous.all() else int(np.argmin(is_continuous))
+        if length >= 3:
+            tracks.append(track_index.get_detections(obj_id)[:length])
+    if not tracks:
+        return
 
-def main():
+    num_frames = max(len(detections) for detections in tracks)
+    frames = np.array([result["frame"] for result in output_results[:num_frames]], dtype=np.float64)
+    coords = np.full((len(tracks), num_frames, 3), np.nan)
+    velocities = np.full((len(tracks), num_frames), np.nan)
+    for ii, detections in enumerate(tracks):
+        coords[ii, :len(detections)] = get_world_coords(detections)
+        velocities[ii, :len(detections)] = [detection.velocity for detection in detections]
+
+    coords, velocities, yaws, smoothed = smooth_neighbor_average(
+        frames, coords, velocities, [len(detections) for detections in tracks], repeat)
+
+    obj_idxes, frame_idxes = np.nonzero(smoothed)
+    update_detections(
+        [tracks[ii][kk] for ii, kk in zip(obj_idxes.tolist(), frame_idxes.tolist())],
+        coords[obj_idxes, frame_idxes],
+        velocities[obj_idxes, frame_idxes],
+        yaws[obj_idxes, frame_idxes],
+        phi0_deg, lambda0_deg)
+
+
+def smooth_detections_savgol(output_results, track_index, window_length, polyorder, fps, phi0_deg, lambda0_deg):
+    """Savitzky-Golay フィルタで他車の動きを平滑化し、速度・方向を求め直す
+
+    物体ごとに連続して検出されているフレームを1区間とし、窓の長さ以上の区間のみ平滑化する。
+
+    Args:
+        output_results (list): 結果のリスト
+        track_index (TrackIndex): 検出の索引
+        window_length (int): 窓の長さ (奇数)
+        polyorder (int): 多項式の次数
+        fps (int): FPS
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+    """
+    smoothed_detections = []
+    smoothed_coords = []
+    smoothed_velocities = []
+    smoothed_yaws = []
+    for obj_id in track_index.obj_ids():
+        frames, result_idxes, _ = track_index.get_track(obj_id)
+        detections = track_index.get_detections(obj_id)
+        # split into continuously detected sections
+        bounds = np.concatenate([[0], np.nonzero(np.diff(result_idxes) != 1)[0] + 1, [len(result_idxes)]])
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            if end - start < window_length:
+                continue
+            coords, velocities, yaws = smooth_savgol(
+                frames[start:end], get_world_coords(detections[start:end]), window_length, polyorder, fps)
+            smoothed_detections.extend(detections[start:end])
+            smoothed_coords.append(coords)
+            smoothed_velocities.append(velocities)
+            smoothed_yaws.append(yaws)
+    if not smoothed_detections:
+        return
+
+    update_detections(
+        smoothed_detections,
+        np.concatenate(smoothed_coords),
+        np.concatenate(smoothed_velocities),
+        np.concatenate(smoothed_yaws),
+        phi0_deg, lambda0_deg)
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description="他車の動きの平滑化"
     )
@@ -24,15 +161,48 @@ def main():
         type=int,
         required=False,
         default=1,
-        help="平滑化の繰り返し数",
+        help="平滑化の繰り返し数 (neighbor のみ)",
+    )
+    parser.add_argument(
+        "--method",
+        type=str,
+        required=False,
+        default=SMOOTHING_NEIGHBOR,
+        choices=SMOOTHING_METHODS,
+        help="平滑化の方法 (neighbor: 前後フレームからの内挿の繰り返し、savgol: Savitzky-Golay フィルタ)",
+    )
+    parser.add_argument(
+        "--window_length",
+        type=int,
+        required=False,
+        default=9,
+        help="Savitzky-Golay フィルタの窓の長さ (奇数、savgol のみ)",
+    )
+    parser.add_argument(
+        "--polyorder",
+        type=int,
+        required=False,
+        default=2,
+        help="Savitzky-Golay フィルタの多項式の次数 (savgol のみ)",
+    )
+    parser.add_argument(
+        "--fps",
+        type=int,
+        required=False,
+        default=30,
+        help="FPS (savgol のみ)",
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     car_abs_coord_file_path = args.car_abs_coord_file_path
     repeat = args.repeat
+    method = args.method
+    
+    if method != SMOOTHING_NEIGHBOR and (args.window_length % 2 == 0 or not 0 <= args.polyorder < args.window_length):
+        print("「window_length」は奇数、「polyorder」は0以上「window_length」未満を指定してください。")
+        sys.exit()
     
-    with open(car_abs_coord_file_path, "r", errors="ignore") as f:
-        car_abs_coords = json.load(f)
+    car_abs_coords = load_result_json(car_abs_coord_file_path, for_update=True)
     
     if "EPSG" not in car_abs_coords.keys():
         print("[EPSG]情報なし")
@@ -40,72 +210,24 @@ def main():
     
     phi0_deg, lambda0_deg, epsg_code = calc_org_lat_long(epsg_code=car_abs_coords["EPSG"])
     
-    output_dict = copy.deepcopy(car_abs_coords)
-    output_results = output_dict["results"]
+    output_dict = car_abs_coords
+    output_results = Detection.from_results(output_dict["results"])
+    
+    # index of detections by obj_id (smoothing does not add or remove detections)
+    track_index = TrackIndex(output_results)
+    
+    if method == SMOOTHING_NEIGHBOR:
+        smooth_detections_neighbor(output_results, track_index, repeat, phi0_deg, lambda0_deg)
+    else:
+        smooth_detections_savgol(output_results, track_index, args.window_length, args.polyorder, args.fps,
+                                 phi0_deg, lambda0_deg)
     
-    for i in range(repeat):
-        prev_detections_idxes = {}
-        for ii, result in enumerate(output_results):
-            # First frame
-            if ii == 0:
-                for jj, detection in enumerate(result["detections"]):
-                    prev_detections_idxes |= {
-                        detection["obj_id"]: jj
-                    }
-                continue
-            
-            # Last frame
-            if ii == len(output_results) - 1:
-                continue
-            
-            # Get index of detections of next frame
-            next_detections_idxes = {}
-            for jj, detection in enumerate(output_results[ii+1]["detections"]):
-                next_detections_idxes |= {
-                    detection["obj_id"]: jj
-                }
-            
-            # Smoothen abs pos
-            curr_detections_idxes = {}
-            for jj, detection in enumerate(result["detections"]):
-                obj_id = detection["obj_id"]
-                if obj_id in prev_detections_idxes.keys() and obj_id in next_detections_idxes.keys():
-                    prev_idx = prev_detections_idxes[obj_id]
-                    next_idx = next_detections_idxes[obj_id]
-                    xy_est, lat_est, lon_est, velocity_est, yaw_est = interpolate_abs_pos(result["frame"],
-                                                                                        output_results[ii-1]["frame"], 
-                                                                                        output_results[ii+1]["frame"],
-                                                                                        output_results[ii-1]["detections"][prev_idx]["world_coordinate"],
-                                                                                        output_results[ii+1]["detections"][next_idx]["world_coordinate"],
-                                                                                        output_results[ii-1]["detections"][prev_idx]["velocity"],
-                                                                                        output_results[ii+1]["detections"][next_idx]["velocity"],
-                                                                                        phi0_deg, lambda0_deg)
-                    
-                    # Update detection data
-                    detection["world_coordinate"][0] = xy_est[0]
-                    detection["world_coordinate"][1] = xy_est[1]
-                    if len(detection["world_coordinate"]) > 2:
-                        frame_ratio = (result["frame"] - output_results[ii-1]["frame"]) / (output_results[ii+1]["frame"] - output_results[ii-1]["frame"])
-                        detection["world_coordinate"][2] = output_results[ii-1]["detections"][prev_idx]["world_coordinate"][2] + \
-                            (output_results[ii+1]["detections"][next_idx]["world_coordinate"][2] - \
-                            output_results[ii-1]["detections"][prev_idx]["world_coordinate"][2]) * frame_ratio
-                    
-                    detection["latitude"] = lat_est
-                    detection["longitude"] = lon_est
-                    detection["velocity"] = velocity_est
-                    detection["yaw"] = yaw_est
-                    
-                    curr_detections_idxes |= {
-                        detection["obj_id"]: jj
-                    }
-            
-            prev_detections_idxes = curr_detections_idxes
-            
     # output result to json
-    output_abs_coord_file_path = os.path.join(os.path.dirname(car_abs_coord_file_path), ABS_COORD_JSON_FILE_NAME)
+    Detection.to_results(output_results)
+    output_abs_coord_file_path = os.path.join(os.path.dirname(car_abs_coord_file_path),
+                                              get_abs_coord_file_name(get_result_format(car_abs_coord_file_path)))
 
-    with open(output_abs_coord_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(output_dict, f, ensure_ascii=False, indent=2)
+    save_result_json(output_abs_coord_file_path, output_dict)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
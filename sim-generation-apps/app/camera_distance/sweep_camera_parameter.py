@@ -0,0 +1,323 @@
+import argparse
+import itertools
+import json
+import os
+import warnings
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.styles import Alignment, Border, Side, colors
+from openpyxl.utils import get_column_letter
+
+from commons.constants import *
+from commons.detection_cache import load_detection_arrays
+from commons.relative_coord import calc_direction_coords, calc_relative_coords, calc_vertical_aov
+
+OUTPUT_EXCEL_FILE_NAME = "summary_camera_parameter_sweep.xlsx"
+OUTPUT_CSV_FILE_NAME = "summary_camera_parameter_sweep.csv"
+ROUNDED_DIGIT_NUM = 6
+
+# 1回の計算で扱う要素数(パラメータの組合せ数×検出数)の上限 (メモリ使用量を抑える)
+SWEEP_CHUNK_ELEMENTS = 1 << 22
+
+# index of the first line to insert in the excel file
+EXCEL_HEADER_LINE_IDX = 2
+HEADER_COLS = [
+    "水平方向視野角(θ°)",
+    "カメラの高さ(m)",
+    "カメラの仰角(°)",
+    "垂直方向の視野角(Φ°)",
+    "検出数",
+    "有効な検出数",
+    "車までの距離の平均(m)",
+    "車までの距離の中央値(m)",
+    "車までの距離の最小値(m)",
+    "車までの距離の最大値(m)",
+]
+REFERENCE_HEADER_COLS = [
+    "参照との対応数",
+    "x方向の距離の平均絶対誤差(m)",
+    "奥行き方向の距離の平均絶対誤差(m)",
+    "距離の二乗平均平方根誤差(m)",
+]
+
+
+def load_detection_points(detection_cache_file):
+    """キャッシュした検出結果から、検出車矩形の中央下部の座標を読み込む
+
+    Args:
+        detection_cache_file (str): 物体検出結果のキャッシュファイルパス (infer_distance_to_car.py の --detection_cache_dir に保存したファイル)
+
+    Returns:
+        dict: 検出ごとの配列 (frame: フレーム番号、obj_id: 検出車のid、x, y: 矩形の中央下部の座標、w, h: 画像の解像度)
+    """
+    arrays = load_detection_arrays(detection_cache_file)
+    frames = np.array([int(os.path.splitext(name)[0].split("_")[-1]) for name in arrays["image_names"]], dtype=np.int64)
+    frame_idx = np.repeat(np.arange(len(frames)), arrays["counts"])
+    bboxes = arrays["bboxes"]
+    image_sizes = arrays["image_sizes"][frame_idx]
+
+    return {
+        "frame": frames[frame_idx],
+        "obj_id": arrays["ids"] + 1,
+        "x": (bboxes[:, 0] + bboxes[:, 2]) / 2,
+        "y": bboxes[:, 3],
+        "w": image_sizes[:, 0].astype(np.float64),
+        "h": image_sizes[:, 1].astype(np.float64),
+    }
+
+
+def load_reference_distances(reference_file, points):
+    """参照距離を読み込み、検出ごとに対応付ける
+
+    Args:
+        reference_file (str): 参照距離のcsvファイルパス (frame, obj_id, distance_x, distance_y 列。detect2csv.py の出力と同じ形式)
+        points (dict): 検出ごとの配列 (load_detection_points の戻り値)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 検出ごとの参照距離 dx、dy (対応する参照が無い場合はnan)
+    """
+    ref_df = pd.read_csv(reference_file, skipinitialspace=True)
+    ref_df = ref_df.drop_duplicates(subset=["frame", "obj_id"], keep="last")
+    ref_index = pd.MultiIndex.from_arrays([ref_df["frame"].astype(np.int64), ref_df["obj_id"].astype(np.int64)])
+    det_index = pd.MultiIndex.from_arrays([points["frame"], points["obj_id"]])
+    pos = ref_index.get_indexer(det_index)
+
+    found = pos >= 0
+    ref_dx = np.full(len(pos), np.nan)
+    ref_dy = np.full(len(pos), np.nan)
+    ref_dx[found] = ref_df["distance_x"].to_numpy(dtype=np.float64)[pos[found]]
+    ref_dy[found] = ref_df["distance_y"].to_numpy(dtype=np.float64)[pos[found]]
+    return ref_dx, ref_dy
+
+
+def make_parameter_grid(thetas, camera_heights, camera_elevation_angles):
+    """パラメータの全組合せを作成する
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: 組合せごとの水平視野角θ、カメラの高さ、カメラの仰角
+    """
+    grid = np.array(list(itertools.product(thetas, camera_heights, camera_elevation_angles)), dtype=np.float64)
+    return grid[:, 0], grid[:, 1], grid[:, 2]
+
+
+def sweep_relative_coords(
+    points,
+    thetas,
+    camera_heights,
+    camera_elevation_angles,
+    camera_horizontal_angle,
+    proj_mode,
+    ref_distances=None,
+):
+    """パラメータの組合せごとに全検出の相対座標を計算し、組合せごとの集計値を返す
+
+    (組合せ数, 検出数)の配列で全組合せをまとめて計算する。
+    SWEEP_CHUNK_ELEMENTS を超える場合は、組合せを分割して計算する。
+
+    Args:
+        points (dict): 検出ごとの配列 (load_detection_points の戻り値)
+        thetas (np.ndarray): 組合せごとの水平視野角θ(degrees)
+        camera_heights (np.ndarray): 組合せごとのカメラの高さ
+        camera_elevation_angles (np.ndarray): 組合せごとのカメラの仰角(degrees)
+        camera_horizontal_angle (float): 進行方向とカメラの水平方向とのなす角度(degrees)
+        proj_mode (int): 射影方式 (0: 中心射影方式、1: 等距離射影方式)
+        ref_distances (Tuple[np.ndarray, np.ndarray]): 検出ごとの参照距離 dx、dy (Noneの場合は誤差を計算しない)
+
+    Returns:
+        list: 組合せごとの集計値のリスト (HEADER_COLS、参照距離がある場合は REFERENCE_HEADER_COLS の順)
+    """
+    xs, ys = points["x"][np.newaxis, :], points["y"][np.newaxis, :]
+    image_size = (points["w"][np.newaxis, :], points["h"][np.newaxis, :])
+    num_detections = xs.shape[1]
+    chunk_size = max(1, SWEEP_CHUNK_ELEMENTS // max(1, num_detections))
+
+    rows = []
+    for start in range(0, len(thetas), chunk_size):
+        theta = thetas[start:start + chunk_size, np.newaxis]
+        camera_height = camera_heights[start:start + chunk_size, np.newaxis]
+        camera_elevation_angle = camera_elevation_angles[start:start + chunk_size, np.newaxis]
+
+        _, dy_camera, d, psi_x, _ = calc_relative_coords(
+            xs, ys, image_size, theta, camera_elevation_angle, camera_height, proj_mode
+        )
+        dx, dy = calc_direction_coords(d, psi_x, camera_horizontal_angle)
+
+        # カメラより上(地平線より上)にある検出は距離を計算できないため除く
+        valid = np.isfinite(d) & (dy_camera > 0)
+        d_valid = np.where(valid, d, np.nan)
+        counts = [np.full(len(theta), num_detections), valid.sum(axis=1)]
+
+        # 有効な検出が無い組合せは nan とする (全て nan の行を集計した場合の RuntimeWarning は出力しない)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            stats = [
+                np.nanmean(d_valid, axis=1),
+                np.nanmedian(d_valid, axis=1),
+                np.nanmin(d_valid, axis=1),
+                np.nanmax(d_valid, axis=1),
+            ]
+
+            if ref_distances is not None:
+                ref_dx, ref_dy = ref_distances
+                matched = valid & np.isfinite(ref_dx) & np.isfinite(ref_dy)
+                err_x = np.where(matched, np.abs(dx - ref_dx), np.nan)
+                err_y = np.where(matched, np.abs(dy - ref_dy), np.nan)
+                ref_counts = [matched.sum(axis=1)]
+                ref_stats = [
+                    np.nanmean(err_x, axis=1),
+                    np.nanmean(err_y, axis=1),
+                    np.sqrt(np.nanmean(err_x ** 2 + err_y ** 2, axis=1)),
+                ]
+
+        # 垂直視野角は最初の検出の画像の解像度で計算する
+        if num_detections:
+            phi_deg = np.degrees(calc_vertical_aov(image_size, theta, proj_mode))[:, 0]
+        else:
+            phi_deg = np.full(len(theta), np.nan)
+        for ii in range(len(theta)):
+            row = [
+                float(theta[ii, 0]),
+                float(camera_height[ii, 0]),
+                float(camera_elevation_angle[ii, 0]),
+                round(float(phi_deg[ii]), ROUNDED_DIGIT_NUM),
+            ]
+            row += [int(count[ii]) for count in counts]
+            row += [round(float(stat[ii]), ROUNDED_DIGIT_NUM) for stat in stats]
+            if ref_distances is not None:
+                row += [int(count[ii]) for count in ref_counts]
+                row += [round(float(stat[ii]), ROUNDED_DIGIT_NUM) for stat in ref_stats]
+            rows.append(row)
+
+    return rows
+
+
+def save_excel_file(output_path, df_data):
+    """組合せごとの集計値をエクセルに出力する (summary_video_result.py と同じ書式)"""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "camera_parameter_sweep"
+
+    border_side = Side("thin", color=colors.BLACK)
+    border_medium = Side("medium", color=colors.BLACK)
+    alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+
+    rows = [df_data.columns.tolist()] + df_data.values.tolist()
+    for row_offset, data in enumerate(rows):
+        row_idx = EXCEL_HEADER_LINE_IDX + row_offset
+        for col_offset, value in enumerate(data):
+            cell = ws.cell(row_idx, 2 + col_offset)
+            cell.value = None if (isinstance(value, float) and np.isnan(value)) else value
+            cell.alignment = alignment
+            border_top = border_medium if row_offset <= 1 else border_side
+            cell.border = Border(left=border_side, right=border_side, top=border_top, bottom=border_side)
+
+    for col_offset in range(len(rows[0])):
+        ws.column_dimensions[get_column_letter(2 + col_offset)].width = 16
+
+    wb.save(str(output_path))
+
+
+def main(argv=None):
+    # 引数をパースする
+    parser = argparse.ArgumentParser(description="カメラパラメータの組合せごとに相対座標を計算し、比較表にまとめる")
+    parser.add_argument(
+        "--detection_cache_file",
+        type=str,
+        required=True,
+        help="物体検出結果のキャッシュファイルパス (infer_distance_to_car.py の --detection_cache_dir に保存したファイル)",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="出力エクセルのフォルダーパス",
+    )
+    parser.add_argument(
+        "--pos_est_setting_file",
+        type=str,
+        required=False,
+        default="input/position_estimation_setting.json",
+        help="距離推定の設定ファイル (proj_mode、camera_horizontal_angle、および組合せを指定しないパラメータの値)",
+    )
+    parser.add_argument(
+        "--theta",
+        type=float,
+        nargs="+",
+        default=None,
+        help="水平視野角θの値(degrees)のリスト (指定しない場合は設定ファイルの値)",
+    )
+    parser.add_argument(
+        "--camera_height",
+        type=float,
+        nargs="+",
+        default=None,
+        help="カメラの高さのリスト (指定しない場合は設定ファイルの値)",
+    )
+    parser.add_argument(
+        "--camera_elevation_angle",
+        type=float,
+        nargs="+",
+        default=None,
+        help="カメラの仰角(degrees)のリスト (指定しない場合は設定ファイルの値)",
+    )
+    parser.add_argument(
+        "--reference_file",
+        type=str,
+        default=None,
+        help="参照距離のcsvファイルパス (frame, obj_id, distance_x, distance_y 列。指定した場合は誤差を比較する)",
+    )
+
+    # parse input arguments
+    args = parser.parse_args(argv)
+
+    detection_cache_file = args.detection_cache_file
+    assert isinstance(detection_cache_file, str)
+
+    output_dir = args.output_dir
+    assert isinstance(output_dir, str)
+
+    # read setting file
+    with open(args.pos_est_setting_file, "r", encoding="utf-8") as f:
+        position_estimation_settings = json.load(f)
+
+    thetas, camera_heights, camera_elevation_angles = make_parameter_grid(
+        args.theta or [position_estimation_settings["theta"]],
+        args.camera_height or [position_estimation_settings["camera_height"]],
+        args.camera_elevation_angle or [position_estimation_settings["camera_elevation_angle"]],
+    )
+
+    if not os.path.exists(detection_cache_file):
+        print(f"File [{detection_cache_file}] is not found.")
+        return
+
+    points = load_detection_points(detection_cache_file)
+    ref_distances = None
+    header_cols = list(HEADER_COLS)
+    if args.reference_file is not None:
+        ref_distances = load_reference_distances(args.reference_file, points)
+        header_cols += REFERENCE_HEADER_COLS
+
+    rows = sweep_relative_coords(
+        points,
+        thetas,
+        camera_heights,
+        camera_elevation_angles,
+        position_estimation_settings["camera_horizontal_angle"],
+        position_estimation_settings["proj_mode"],
+        ref_distances,
+    )
+    df_data = pd.DataFrame(columns=header_cols, data=rows)
+
+    # make output dir
+    os.makedirs(output_dir, exist_ok=True)
+
+    # execute
+    df_data.to_csv(os.path.join(output_dir, OUTPUT_CSV_FILE_NAME), index=False, encoding="utf-8")
+    save_excel_file(os.path.join(output_dir, OUTPUT_EXCEL_FILE_NAME), df_data)
+    print(f"{len(rows)} camera parameter combinations, {len(points['x'])} detections")
+
+
+if __name__ == "__main__":
+    main()
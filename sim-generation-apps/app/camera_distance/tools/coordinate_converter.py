@@ -8,6 +8,7 @@ import numpy as np
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from commons.constants import *
+from commons.lane_geometry import load_lane_geometry
 from cvt_lat_long_cartesian import (
     convert_cartesian_to_lat_long,
     cvt_world_to_plane_cartesian,
@@ -33,36 +34,17 @@ def convert_coordinates(x, y, phi0_deg, lambda0_deg, map_offset):
 
     return lat, long
 
-def get_converted_coordinates_lane_coord(input_json_path):
+def get_converted_coordinates_lane_coord(input_json_path, world=False):
     """車線の座標を軽度・緯度に変換する
 
+    変換済みの座標はjsonファイルと同じフォルダにサイドカーとして保存し、
+    jsonファイルが更新されていなければ次回以降は変換せずに読み込む。
+
     Args:
         input_json_path (str): レーン座標のjsonファイルパス 
-    """
-    # Read data
-    f = open(input_json_path, "r", encoding="utf-8", errors="ignore")
-    data = json.load(f)
-    f.close()
+        world (bool): 緯度・経度の代わりに世界座標(座標系原点のオフセットを加えた座標)を返すかどうか
 
-    epsg, map_offset = (
-        data["EPSG"],
-        data["map_offset"],
-    )
-
-    # calc original lat-lon
-    phi0_deg, lambda0_deg, epsg_code = calc_org_lat_long(epsg_code=epsg)
-    
-    coords = []
-    roads = data["roads"]
-    for road in roads:
-        lanes = road["lanes"]
-
-        for lane in lanes:
-            coordinate = lane["coordinate"]
-            for i in range(len(coordinate)):
-                lat, long = convert_coordinates(coordinate[i][0], coordinate[i][1], phi0_deg, lambda0_deg, map_offset)
-                coordinate[i][0] = lat
-                coordinate[i][1] = long
-                coords.append([lat, long])
-
-    return data
+    Returns:
+        dict: 変換済みのレーン座標 (EPSG, map_offset, roads)
+    """
+    return load_lane_geometry(input_json_path).to_road_data(world=world)
@@ -1,5 +1,6 @@
 import os
 import glob
+import hashlib
 import argparse
 import shutil
 import numpy as np
@@ -7,7 +8,12 @@ import cv2
 from tqdm import tqdm
 
 
-def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path):
+def get_calibration_paths(intrinsic_camera_matrix_path=None, calibration_matrix_P2_path=None, dist_coeffs_path=None):
+    """未指定(None)のキャリブレーションファイルパスをこのフォルダのファイルで補完する
+
+    Returns:
+        Tuple[str, str, str]: カメラ内部パラメータ行列、射影行列(P2)、歪み係数のファイルパス
+    """
     curr_dir = os.path.dirname(os.path.abspath(__file__))
     if intrinsic_camera_matrix_path is None:
         intrinsic_camera_matrix_path = os.path.join(curr_dir, 'intrinsic_camera_matrix.npy')
@@ -15,6 +21,22 @@ def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, c
         calibration_matrix_P2_path = os.path.join(curr_dir, 'calibration_matrix_P2.npy')
     if dist_coeffs_path is None:
         dist_coeffs_path = os.path.join(curr_dir, 'dist_coeffs.npy')
+    return intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path
+
+
+def load_calibration(intrinsic_camera_matrix_path=None, calibration_matrix_P2_path=None, dist_coeffs_path=None):
+    """歪み補正に使用するカメラ行列と歪み係数を読み込む
+
+    Args:
+        intrinsic_camera_matrix_path (str): カメラ内部パラメータ行列ファイルパス (Noneの場合はこのフォルダのファイル)
+        calibration_matrix_P2_path (str): 射影行列(P2)ファイルパス (Noneの場合はこのフォルダのファイル)
+        dist_coeffs_path (str): 歪み係数ファイルパス (Noneの場合はこのフォルダのファイル)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: カメラ内部パラメータ行列、歪み係数
+    """
+    intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path = get_calibration_paths(
+        intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path)
 
     # Load the intrinsic matrix, P2 matrix, and distortion coefficients
     if os.path.exists(intrinsic_camera_matrix_path) and os.path.exists(calibration_matrix_P2_path) and os.path.exists(dist_coeffs_path):
@@ -31,6 +53,113 @@ def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, c
     # else:
     #     assert()
 
+    return intrinsic_matrix, dist_coeffs
+
+
+def calc_calibration_hash(*file_paths):
+    """キャリブレーションファイルの内容からハッシュ値を計算する
+
+    Args:
+        file_paths (str): キャリブレーションファイルパス
+
+    Returns:
+        str: ハッシュ値(16進数文字列)
+    """
+    sha = hashlib.sha256()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+class Undistorter:
+    """歪み補正マップ(remapテーブル)を使って画像の歪みを補正する
+
+    マップは解像度ごとに1度だけ作成し、cv2.undistort と同じ補正結果を cv2.remap で求める。
+    map_cache_dir を指定した場合は、カメラ内部パラメータ行列・歪み係数ファイルのハッシュ値と解像度を
+    キーとしてマップをファイルに保存し、同じキャリブレーションのマップは作成せずに読み込む。
+    """
+
+    def __init__(self, intrinsic_camera_matrix_path=None, calibration_matrix_P2_path=None, dist_coeffs_path=None,
+                 map_cache_dir=None):
+        """
+        Args:
+            intrinsic_camera_matrix_path (str): カメラ内部パラメータ行列ファイルパス (Noneの場合はこのフォルダのファイル)
+            calibration_matrix_P2_path (str): 射影行列(P2)ファイルパス (Noneの場合はこのフォルダのファイル)
+            dist_coeffs_path (str): 歪み係数ファイルパス (Noneの場合はこのフォルダのファイル)
+            map_cache_dir (str): 歪み補正マップの保存先フォルダ (Noneの場合はファイルに保存しない)
+        """
+        intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path = get_calibration_paths(
+            intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path)
+        self.intrinsic_matrix, self.dist_coeffs = load_calibration(
+            intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path)
+        self.calibration_hash = calc_calibration_hash(intrinsic_camera_matrix_path, dist_coeffs_path)
+        self.map_cache_dir = map_cache_dir
+        # 解像度(w, h)ごとの歪み補正マップ
+        self.maps = {}
+
+    def get_map_cache_path(self, image_size):
+        """歪み補正マップの保存先ファイルパス"""
+        w, h = image_size
+        return os.path.join(self.map_cache_dir, f'undistort_map_{self.calibration_hash}_{w}x{h}.npz')
+
+    def get_maps(self, image_size):
+        """解像度に対応する歪み補正マップを取得する (未作成の場合は読み込み、または作成する)
+
+        Args:
+            image_size (Tuple[int, int]): 解像度(w, h)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: cv2.remap に渡すマップ
+        """
+        if image_size in self.maps:
+            return self.maps[image_size]
+
+        maps = None
+        cache_path = None
+        if self.map_cache_dir is not None:
+            cache_path = self.get_map_cache_path(image_size)
+            if os.path.exists(cache_path):
+                try:
+                    with np.load(cache_path) as cache:
+                        maps = (cache['map1'], cache['map2'])
+                    print(f"Loaded undistortion map: {cache_path}")
+                except (OSError, ValueError, KeyError):
+                    print(f"Warning: 歪み補正マップを読み込めないため、作成し直します。: {cache_path}")
+
+        if maps is None:
+            maps = cv2.initUndistortRectifyMap(
+                self.intrinsic_matrix, self.dist_coeffs, None, self.intrinsic_matrix, image_size, cv2.CV_16SC2)
+            if cache_path is not None:
+                # 複数ジョブから同時に書き込まれても壊れないように、一時ファイルに書いてから置き換える
+                os.makedirs(self.map_cache_dir, exist_ok=True)
+                tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, map1=maps[0], map2=maps[1])
+                os.replace(tmp_path, cache_path)
+                print(f"Saved undistortion map: {cache_path}")
+
+        self.maps[image_size] = maps
+        return maps
+
+    def undistort(self, img):
+        """画像1枚の歪みを補正する
+
+        Args:
+            img (np.ndarray): 入力画像(BGR)
+
+        Returns:
+            np.ndarray: 補正画像
+        """
+        h, w = img.shape[:2]
+        map1, map2 = self.get_maps((w, h))
+        return cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+
+
+def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path,
+                          map_cache_dir=None):
+    undistorter = Undistorter(intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path, map_cache_dir)
+
     # フォルダ内の画像のファイルリストを取得する
     files = glob.glob(os.path.join(input_dir, '*.jpg'))
     files.sort()
@@ -51,7 +180,7 @@ def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, c
     for f in files:
         # 画像を1枚ずつ読み込んで 補正画像を出力フォルダに保存する
         img = cv2.imread(f)
-        undistorted_frame = cv2.undistort(img, intrinsic_matrix, dist_coeffs)
+        undistorted_frame = undistorter.undistort(img)
 
         name = os.path.splitext(os.path.basename(f))[0]
         # output_fn = name + "_correction.jpg"
@@ -63,7 +192,7 @@ def distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, c
     bar.close()
 
 
-def main():
+def main(argv=None):
     # 引数をパースする
     parser = argparse.ArgumentParser(description="画像の歪みを補正する")
     parser.add_argument(
@@ -98,8 +227,14 @@ def main():
         default=None,
         help="出力結果フォルダパス",
     )
+    parser.add_argument(
+        "--map_cache_dir",
+        type=str,
+        default=None,
+        help="歪み補正マップの保存先フォルダパス (指定しない場合は保存しない)",
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     input_dir = args.input_dir
     assert isinstance(input_dir, str)
 
@@ -115,7 +250,8 @@ def main():
     dist_coeffs_path = args.dist_coeffs_path
     assert isinstance(dist_coeffs_path, str)
     
-    distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path)
+    distortion_correction(input_dir, output_dir, intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path,
+                          args.map_cache_dir)
 
 
 if __name__ == "__main__":
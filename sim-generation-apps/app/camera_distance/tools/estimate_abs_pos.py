@@ -1,6 +1,13 @@
 import math
+
+import numpy as np
+
 from commons.math_util import get_angle_2d
-from cvt_lat_long_cartesian import convert_cartesian_to_lat_long, cvt_world_to_plane_cartesian
+from cvt_lat_long_cartesian import (
+    convert_cartesian_to_lat_long,
+    convert_cartesian_to_lat_long_array,
+    cvt_world_to_plane_cartesian,
+)
 
 
 def interpolate_abs_pos(frame: int, frame1: int, frame2: int, coord1: list, coord2: list, 
@@ -69,4 +76,193 @@ def interpolate_abs_pos(frame: int, frame1: int, frame2: int, coord1: list, coor
         yaw = get_angle_2d(movement_dx, movement_dy)
         yaw_est = math.degrees(yaw)
         
-    return [xw_est, yw_est], lat_est, lon_est, velocity_est, yaw_est
\ No newline at end of file
+    return [xw_est, yw_est], lat_est, lon_est, velocity_est, yaw_est
+
+
+def interpolate_abs_pos_array(frames, frames1, frames2, coords1, coords2,
+                              velocities1, velocities2, phi0_deg: float, lambda0_deg: float):
+    """内挿法・外挿法で絶対座標と速度をまとめて計算する。(interpolate_abs_pos の配列版)
+
+    Args:
+        frames (np.ndarray): 計算するフレーム (M,)
+        frames1 (np.ndarray): 参照する第一フレーム (M,)
+        frames2 (np.ndarray): 参照する第二フレーム (M,)
+        coords1 (np.ndarray): 参照する第一絶対座標 (M, 2)
+        coords2 (np.ndarray): 参照する第二絶対座標 (M, 2)
+        velocities1 (np.ndarray): 参照する第一速度 (M,)
+        velocities2 (np.ndarray): 参照する第二速度 (M,)
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            絶対座標 (M, 2)、緯度 (M,)、経度 (M,)、速度 (M,)、方向(degrees) (M,)
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    frames1 = np.asarray(frames1, dtype=np.float64)
+    frames2 = np.asarray(frames2, dtype=np.float64)
+    coords1 = np.asarray(coords1, dtype=np.float64).reshape(-1, 2)
+    coords2 = np.asarray(coords2, dtype=np.float64).reshape(-1, 2)
+    velocities1 = np.asarray(velocities1, dtype=np.float64)
+    velocities2 = np.asarray(velocities2, dtype=np.float64)
+
+    is_interpolate = (frames1 < frames) & (frames < frames2)
+    is_before = ~is_interpolate & (frames < frames1)
+    frame_diff = (frames2 - frames1)[:, np.newaxis]
+    coord_diff = coords2 - coords1
+
+    # interpolate / extrapolate before first frame / extrapolate after last frame
+    coords_interpolate = coords1 + coord_diff * ((frames - frames1)[:, np.newaxis] / frame_diff)
+    coords_before = coords1 - coord_diff * ((frames1 - frames)[:, np.newaxis] / frame_diff)
+    coords_after = coords2 + coord_diff * ((frames - frames2)[:, np.newaxis] / frame_diff)
+    coords_est = np.where(
+        is_interpolate[:, np.newaxis], coords_interpolate,
+        np.where(is_before[:, np.newaxis], coords_before, coords_after))
+
+    xp, yp = cvt_world_to_plane_cartesian(coords_est[:, 0], coords_est[:, 1])
+    lat_est, lon_est = convert_cartesian_to_lat_long_array(xp, yp, phi0_deg, lambda0_deg)
+
+    # vehicle velocity
+    velocity_est = np.where(is_before, velocities1, velocities2)
+
+    # vehicle direction (z-axis rotation angle)
+    movement = np.where(
+        is_interpolate[:, np.newaxis], coords_est - coords1,
+        np.where(is_before[:, np.newaxis], coords1 - coords_est, coords_est - coords2))
+    yaw = np.arctan2(movement[:, 1], movement[:, 0])
+    yaw = np.where(yaw >= 0, yaw, yaw + math.pi * 2)
+    yaw_est = np.degrees(yaw)
+
+    return coords_est, lat_est, lon_est, velocity_est, yaw_est
+
+
+def interpolate_own_car_abs_pos(results: list, detected_idxes: list, phi0_deg: float, lambda0_deg: float):
+    """自車の絶対座標を計算していないフレームの絶対座標・速度・方向を内挿法・外挿法でまとめて求める。
+
+    前後の計算済みフレーム(範囲外の場合は先頭または末尾の2フレーム)から求め、results を更新する。
+
+    Args:
+        results (list): 結果 (detected_idxes のフレームは自車の絶対座標・速度を計算済みであること)
+        detected_idxes (list): 自車の絶対座標を計算済みの結果のインデックス (昇順、2つ以上)
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+    """
+    detected_idxes = np.asarray(detected_idxes, dtype=np.intp)
+    is_detected = np.zeros(len(results), dtype=bool)
+    is_detected[detected_idxes] = True
+    est_idxes = np.flatnonzero(~is_detected)
+    if len(est_idxes) == 0:
+        return
+
+    # 前後の計算済みフレームの位置
+    pos = np.clip(np.searchsorted(detected_idxes, est_idxes), 1, len(detected_idxes) - 1)
+    idxes1 = detected_idxes[pos - 1]
+    idxes2 = detected_idxes[pos]
+
+    frames = [result["frame"] for result in results]
+    coords = [result["self"]["world_coordinate"][:2] if is_detected[ii] else [0, 0] for ii, result in enumerate(results)]
+    velocities = [result["self"]["velocity"] if is_detected[ii] else 0 for ii, result in enumerate(results)]
+    frames = np.asarray(frames, dtype=np.float64)
+    coords = np.asarray(coords, dtype=np.float64)
+    velocities = np.asarray(velocities, dtype=np.float64)
+
+    xy_est, lat_est, lon_est, velocity_est, yaw_est = interpolate_abs_pos_array(
+        frames[est_idxes], frames[idxes1], frames[idxes2], coords[idxes1], coords[idxes2],
+        velocities[idxes1], velocities[idxes2], phi0_deg, lambda0_deg)
+
+    for ii, xy, lat, lon, velocity, yaw in zip(
+            est_idxes.tolist(), xy_est.tolist(), lat_est.tolist(), lon_est.tolist(),
+            velocity_est.tolist(), yaw_est.tolist()):
+        results[ii]["self"] |= {
+            "world_coordinate": xy,
+            "latitude": lat,
+            "longitude": lon,
+            "velocity": velocity,
+            "yaw": yaw
+        }
+
+
+def calc_detect_car_pos_array(owned_prev_abs_pos, owned_curr_abs_pos, dx, dy):
+    """検出車の絶対座標をまとめて求める。
+
+    Args:
+        owned_prev_abs_pos (np.ndarray): 過去フレームのそれぞれ自車の平面座標 (世界座標系) (N, 2)
+        owned_curr_abs_pos (np.ndarray): 現フレームのそれぞれ自車の平面座標 (世界座標系) (N, 2)
+        dx (np.ndarray): 相対距離 (X-axis) (N,)
+        dy (np.ndarray): 相対距離 (Y-axis) (N,)
+
+    Returns:
+        np.ndarray: 検出車の絶対座標 (N, 2)
+    """
+    owned_prev_abs_pos = np.asarray(owned_prev_abs_pos, dtype=np.float64).reshape(-1, 2)
+    owned_curr_abs_pos = np.asarray(owned_curr_abs_pos, dtype=np.float64).reshape(-1, 2)
+    dx = np.asarray(dx, dtype=np.float64)
+    dy = np.asarray(dy, dtype=np.float64)
+
+    # 移動方向ベクトル
+    curr_dir = owned_curr_abs_pos - owned_prev_abs_pos
+    curr_dir_len = np.sqrt(curr_dir[:, 0] ** 2 + curr_dir[:, 1] ** 2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dy_dir = curr_dir / curr_dir_len[:, np.newaxis]
+
+    # 自車の現在方向にdx dyの方向を計算 (右側: (y, -x)、左側: (-y, x))
+    is_right_side = dx > 0
+    dx_dir = np.where(
+        is_right_side[:, np.newaxis],
+        np.column_stack([dy_dir[:, 1], -dy_dir[:, 0]]),
+        np.column_stack([-dy_dir[:, 1], dy_dir[:, 0]]))
+
+    # 検出車の絶対座標
+    dy_world = dy_dir * dy[:, np.newaxis]
+    dx_world = dx_dir * np.abs(dx)[:, np.newaxis]
+    return owned_curr_abs_pos + dy_world + dx_world
+
+
+def calc_detections_abs_pos(results: list, phi0_deg: float, lambda0_deg: float):
+    """全フレームの検出車の絶対座標・緯度・経度をまとめて求め、results を更新する。
+
+    検出車の相対距離(dx, dy)を、前フレームから現フレームへの自車の移動方向に合わせて回転し、自車の位置に加える。
+    先頭フレームは第2フレームへの移動方向・第2フレームの自車の位置を使う。
+    自車が移動していないフレームは、直前(無い場合は直後)の移動したフレームの移動方向を使う。
+
+    Args:
+        results (list): 結果 (自車の絶対座標を計算済みであること、検出は Detection.from_results で置き換えたもの)
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+    """
+    detections = [detection for result in results for detection in result["detections"]]
+    if not detections:
+        return
+
+    # 各フレームの自車の移動前・移動後の位置
+    owned_abs_pos = np.array(
+        [result["self"]["world_coordinate"][:2] for result in results], dtype=np.float64).reshape(-1, 2)
+    owned_prev_abs_pos = np.concatenate([owned_abs_pos[:1], owned_abs_pos[:-1]])
+    owned_curr_abs_pos = owned_abs_pos.copy()
+    if len(results) >= 2:
+        owned_curr_abs_pos[0] = owned_abs_pos[1]
+
+    # 移動していないフレームの移動方向は前後のフレームから補う
+    moved = np.any(owned_curr_abs_pos != owned_prev_abs_pos, axis=1)
+    if np.any(moved) and not np.all(moved):
+        moved_idxes = np.flatnonzero(moved)
+        ref_idxes = np.maximum.accumulate(np.where(moved, np.arange(len(results)), -1))
+        ref_idxes[ref_idxes < 0] = moved_idxes[0]
+        still_idxes = np.flatnonzero(~moved)
+        ref_idxes = ref_idxes[still_idxes]
+        owned_prev_abs_pos[still_idxes] = owned_curr_abs_pos[still_idxes] - (
+            owned_curr_abs_pos[ref_idxes] - owned_prev_abs_pos[ref_idxes])
+
+    frame_idxes = np.repeat(np.arange(len(results)), [len(result["detections"]) for result in results])
+    distances = np.array([detection.distance[:2] for detection in detections], dtype=np.float64)
+    detect_abs_pos = calc_detect_car_pos_array(
+        owned_prev_abs_pos[frame_idxes], owned_curr_abs_pos[frame_idxes], distances[:, 0], distances[:, 1])
+
+    xp, yp = cvt_world_to_plane_cartesian(detect_abs_pos[:, 0], detect_abs_pos[:, 1])
+    detected_lat, detected_lon = convert_cartesian_to_lat_long_array(xp, yp, phi0_deg, lambda0_deg)
+
+    for detection, abs_pos, lat, lon in zip(
+            detections, detect_abs_pos.tolist(), detected_lat.tolist(), detected_lon.tolist()):
+        detection.world_coordinate = abs_pos
+        detection.latitude = lat
+        detection.longitude = lon
\ No newline at end of file
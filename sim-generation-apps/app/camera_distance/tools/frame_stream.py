@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import threading
+
+import cv2
+
+from commons.detection_cache import update_file_hash
+from tools.video2image import iter_video_frames
+from tools.distortion_correction.distortion_correction import Undistorter
+
+# 各処理間のキューに保持するフレーム数の上限
+DEFAULT_QUEUE_SIZE = 8
+
+# キューの終端を表すオブジェクト
+_END_OF_STREAM = object()
+
+
+class _StageError:
+    """処理スレッドで発生した例外を受け渡すためのラッパー"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(out_queue, item, stop_event):
+    """停止要求を確認しながらキューに追加する
+
+    Returns:
+        bool: 追加できたかどうか (停止要求があった場合はFalse)
+    """
+    while not stop_event.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _iter_queue(in_queue, stop_event):
+    """停止要求を確認しながら、キューから終端まで順に取り出す"""
+    while not stop_event.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _END_OF_STREAM:
+            return
+        if isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+
+def _run_stage(source, func, out_queue, stop_event):
+    """sourceの各要素にfuncを適用し、結果をout_queueに追加する (処理スレッド本体)"""
+    try:
+        for item in source:
+            if not _put(out_queue, func(item), stop_event):
+                return
+    except BaseException as e:
+        _put(out_queue, _StageError(e), stop_event)
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+        _put(out_queue, _END_OF_STREAM, stop_event)
+
+
+class FrameStream:
+    """動画のデコード → 歪み補正を並行に実行し、補正済みフレームを順に返す
+
+    各処理は別スレッドで実行し、処理間は上限付きのキューで繋ぐ。
+    画像はメモリ上で受け渡し、出力フォルダを指定した場合のみファイルに保存する。
+    """
+
+    def __init__(
+        self,
+        video_path,
+        intrinsic_camera_matrix_path=None,
+        calibration_matrix_P2_path=None,
+        dist_coeffs_path=None,
+        frame_skip=0,
+        start_time=0,
+        end_time=-1,
+        gps_coord_file=None,
+        src_output_dir=None,
+        distortion_output_dir=None,
+        map_cache_dir=None,
+        queue_size=DEFAULT_QUEUE_SIZE,
+    ):
+        """
+        Args:
+            video_path (str): 動画ファイルパス
+            intrinsic_camera_matrix_path (str): カメラ内部パラメータ行列ファイルパス
+            calibration_matrix_P2_path (str): 射影行列(P2)ファイルパス
+            dist_coeffs_path (str): 歪み係数ファイルパス
+            frame_skip (int): frame-skip. Defaults to 0.
+            start_time (float): 動画からの画像抽出開始時間. Defaults to 0.
+            end_time (float): 動画からの画像抽出終了時間. Defaults to -1.
+            gps_coord_file (str): GPSデータファイルパス. Defaults to None.
+            src_output_dir (str): 抽出画像の保存先 (Noneの場合は保存しない)
+            distortion_output_dir (str): 補正画像の保存先 (Noneの場合は保存しない)
+            map_cache_dir (str): 歪み補正マップの保存先 (Noneの場合は保存しない)
+            queue_size (int): 処理間のキューに保持するフレーム数の上限
+        """
+        self.video_path = video_path
+        self.frame_skip = frame_skip
+        self.start_time = start_time
+        self.end_time = end_time
+        self.gps_coord_file = gps_coord_file
+        self.src_output_dir = src_output_dir
+        self.distortion_output_dir = distortion_output_dir
+        self.queue_size = queue_size
+        self.undistorter = Undistorter(
+            intrinsic_camera_matrix_path, calibration_matrix_P2_path, dist_coeffs_path, map_cache_dir
+        )
+
+        # 出力フォルダ作成
+        for output_dir in (src_output_dir, distortion_output_dir):
+            if output_dir is not None:
+                if os.path.exists(output_dir):
+                    shutil.rmtree(output_dir)
+                os.makedirs(output_dir, exist_ok=True)
+
+    def calc_source_hash(self):
+        """フレームの内容を決める入力(動画、抽出範囲、歪み補正パラメータ)からハッシュ値を計算する
+
+        Returns:
+            str: ハッシュ値(16進数文字列)
+        """
+        sha = hashlib.sha256()
+        update_file_hash(sha, self.video_path)
+        if self.gps_coord_file is not None:
+            update_file_hash(sha, self.gps_coord_file)
+        params = [self.frame_skip, self.start_time, self.end_time, self.undistorter.calibration_hash]
+        sha.update(json.dumps(params).encode("utf-8"))
+        return sha.hexdigest()
+
+    def _decode(self, item):
+        """動画フレームをBGR画像に変換する (指定があれば抽出画像を保存する)"""
+        image_name, frame = item
+        if self.src_output_dir is not None:
+            frame.to_image().save(os.path.join(self.src_output_dir, image_name + ".jpg"))
+        return image_name, frame.to_ndarray(format="bgr24")
+
+    def _undistort(self, item):
+        """歪みを補正する (指定があれば補正画像を保存する)"""
+        image_name, img = item
+        undistorted_frame = self.undistorter.undistort(img)
+        image_path = image_name + ".jpg"
+        if self.distortion_output_dir is not None:
+            image_path = os.path.join(self.distortion_output_dir, image_path)
+            cv2.imwrite(image_path, undistorted_frame)
+        return image_path, undistorted_frame
+
+    def __iter__(self):
+        """補正済みフレームを動画の順に返す
+
+        Yields:
+            Tuple[str, np.ndarray]: 画像パス(保存しない場合は画像名のみ)、補正画像(BGR)
+        """
+        stop_event = threading.Event()
+        decoded_queue = queue.Queue(maxsize=self.queue_size)
+        undistorted_queue = queue.Queue(maxsize=self.queue_size)
+
+        frames = iter_video_frames(
+            self.video_path, self.frame_skip, self.start_time, self.end_time, self.gps_coord_file
+        )
+        threads = [
+            threading.Thread(
+                target=_run_stage, args=(frames, self._decode, decoded_queue, stop_event), daemon=True
+            ),
+            threading.Thread(
+                target=_run_stage,
+                args=(_iter_queue(decoded_queue, stop_event), self._undistort, undistorted_queue, stop_event),
+                daemon=True,
+            ),
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            yield from _iter_queue(undistorted_queue, stop_event)
+        finally:
+            # 途中で終了した場合も処理スレッドを停止させる
+            stop_event.set()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,163 @@
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from cvt_lat_long_cartesian import convert_cartesian_to_lat_long_array, convert_lat_long_to_cartesian_array
+
+# 最も近いレーンを求める座標系
+CORRECTION_COORD_LAT_LONG = "lat_long"  # 緯度・経度
+CORRECTION_COORD_WORLD = "world"  # 世界座標 (平面直角座標系、m)
+CORRECTION_COORDS = [CORRECTION_COORD_LAT_LONG, CORRECTION_COORD_WORLD]
+
+
+def get_car_coords(car_infos, correction_coord=CORRECTION_COORD_LAT_LONG):
+    """補正に使用する車両座標を取得する
+
+    Args:
+        car_infos (list): 車両情報 ("latitude", "longitude", "world_coordinate" を持つ辞書) のリスト
+        correction_coord (str): 最も近いレーンを求める座標系 (CORRECTION_COORDS)
+
+    Returns:
+        np.ndarray: 車両座標 (緯度, 経度) または 世界座標(x, y) (N, 2)
+    """
+    if correction_coord == CORRECTION_COORD_WORLD:
+        coords = [car_info["world_coordinate"][:2] for car_info in car_infos]
+    else:
+        coords = [[car_info["latitude"], car_info["longitude"]] for car_info in car_infos]
+    return np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def get_detection_coords(detections, correction_coord=CORRECTION_COORD_LAT_LONG):
+    """補正に使用する検出車両の座標を取得する (get_car_coords の Detection 版)
+
+    Args:
+        detections (list): 検出(Detection)のリスト
+        correction_coord (str): 最も近いレーンを求める座標系 (CORRECTION_COORDS)
+
+    Returns:
+        np.ndarray: 車両座標 (緯度, 経度) または 世界座標(x, y) (N, 2)
+    """
+    if correction_coord == CORRECTION_COORD_WORLD:
+        coords = [detection.world_coordinate[:2] for detection in detections]
+    else:
+        coords = [[detection.latitude, detection.longitude] for detection in detections]
+    return np.array(coords, dtype=np.float64).reshape(-1, 2)
+
+
+def convert_corrected_coords(corrected_coordinates, correction_coord, phi0_deg, lambda0_deg):
+    """補正後の座標から緯度・経度と世界座標を求める (全座標をまとめて変換する)
+
+    Args:
+        corrected_coordinates (np.ndarray): 補正後の座標 (N, 3)
+        correction_coord (str): 補正後の座標の座標系 (CORRECTION_COORDS)
+        phi0_deg, lambda0_deg (float, float): 平面直角座標系原点の緯度、平面直角座標系原点の経度
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 緯度・経度 (N, 2)、世界座標(x, y, z) (N, 3)
+    """
+    corrected_coordinates = np.asarray(corrected_coordinates, dtype=np.float64).reshape(-1, 3)
+    # 世界座標(x, y)は平面直角座標系の(y, x)
+    if correction_coord == CORRECTION_COORD_WORLD:
+        world_coordinates = corrected_coordinates
+        lat, long = convert_cartesian_to_lat_long_array(
+            world_coordinates[:, 1], world_coordinates[:, 0], phi0_deg, lambda0_deg)
+        lat_long_coordinates = np.column_stack([lat, long])
+    else:
+        lat_long_coordinates = corrected_coordinates[:, :2]
+        xp, yp = convert_lat_long_to_cartesian_array(
+            lat_long_coordinates[:, 0], lat_long_coordinates[:, 1], phi0_deg, lambda0_deg)
+        world_coordinates = np.column_stack([yp, xp, corrected_coordinates[:, 2]])
+    return lat_long_coordinates, world_coordinates
+
+
+class LaneCorrector:
+    """車両座標を最も近いレーン上の点に補正する
+
+    レーン座標の STRtree を1度だけ作成し、複数の車両座標の最近傍レーンをまとめて求める。
+    距離が同じレーンが複数ある場合は、road_linestrings の順で先頭のレーンを選ぶ。
+    """
+
+    def __init__(self, road_linestrings: list):
+        """
+        Args:
+            road_linestrings (list): レーン座標 ("road", "lane", "line" を持つ辞書のリスト)
+
+        Raises:
+            ValueError: レーンが1つも無い場合
+        """
+        if not road_linestrings:
+            raise ValueError("補正先のレーンがありません")
+        self.road_ids = np.array([road["road"] for road in road_linestrings], dtype=object)
+        self.lane_ids = np.array([road["lane"] for road in road_linestrings], dtype=object)
+        self.lines = np.array([road["line"] for road in road_linestrings], dtype=object)
+        self.tree = STRtree(self.lines)
+
+    def query_nearest_lane(self, car_coordinates):
+        """車両座標ごとに最も近いレーンを求める
+
+        Args:
+            car_coordinates (np.ndarray): 車両座標 (N, 2以上)
+
+        Returns:
+            np.ndarray: 車両座標ごとのレーンのインデックス (N,)
+        """
+        car_coordinates = np.atleast_2d(np.asarray(car_coordinates, dtype=np.float64))
+        points = shapely.points(car_coordinates[:, 0], car_coordinates[:, 1])
+        point_indices, lane_indices = self.tree.query_nearest(points, all_matches=True)
+
+        # 距離が同じレーンが複数ある場合はインデックスが最小のレーン
+        nearest = np.full(len(points), len(self.lines), dtype=np.intp)
+        np.minimum.at(nearest, point_indices, lane_indices)
+        return nearest
+
+    def project(self, car_coordinates, lane_indices):
+        """車両座標を指定したレーン上の最も近い点に射影する (全座標をまとめて計算する)
+
+        Args:
+            car_coordinates (np.ndarray): 車両座標 (N, 2以上)
+            lane_indices (np.ndarray): 車両座標ごとの射影先レーンのインデックス (N,)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: 補正後の座標(x, y, z) (N, 3)、道路ID (N,)、レーンID (N,)
+        """
+        car_coordinates = np.atleast_2d(np.asarray(car_coordinates, dtype=np.float64))
+        lane_indices = np.asarray(lane_indices, dtype=np.intp)
+        lines = self.lines[lane_indices]
+        points = shapely.points(car_coordinates[:, 0], car_coordinates[:, 1])
+        corrected_points = shapely.line_interpolate_point(lines, shapely.line_locate_point(lines, points))
+        corrected_coordinates = shapely.get_coordinates(corrected_points, include_z=True)
+        return corrected_coordinates, self.road_ids[lane_indices], self.lane_ids[lane_indices]
+
+    def correct_array(self, car_coordinates):
+        """車両座標ごとに最も近いレーン上の点を求める (全座標をまとめて計算する)
+
+        Args:
+            car_coordinates (np.ndarray): 車両座標 (N, 2以上)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: 補正後の座標(x, y, z) (N, 3)、道路ID (N,)、レーンID (N,)
+        """
+        return self.project(car_coordinates, self.query_nearest_lane(car_coordinates))
+
+    def correct(self, car_coordinates):
+        """車両座標ごとに最も近いレーン上の点を求める
+
+        Args:
+            car_coordinates (np.ndarray): 車両座標 (N, 2以上)
+
+        Returns:
+            list: 車両座標ごとの(補正後の座標[x, y, z], 道路ID, レーンID)のリスト
+        """
+        corrected_coordinates, road_ids, lane_ids = self.correct_array(car_coordinates)
+        return list(zip(corrected_coordinates.tolist(), road_ids.tolist(), lane_ids.tolist()))
+
+    def correct_car_abs_coord(self, car_coordinate):
+        """車両座標と最も近いレーン座標を求める
+
+        Args:
+            car_coordinate (list): 車両座標
+
+        Returns:
+            Tuple[list, str, str]: 補正後の座標[x, y, z]、道路ID、レーンID
+        """
+        return self.correct([car_coordinate])[0]
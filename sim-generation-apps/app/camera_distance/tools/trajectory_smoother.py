@@ -0,0 +1,148 @@
+import math
+
+import numpy as np
+
+from cvt_lat_long_cartesian import convert_cartesian_to_lat_long_array, cvt_world_to_plane_cartesian
+
+# 平滑化の方法
+SMOOTHING_NEIGHBOR = "neighbor"  # 前後フレームの座標から内挿する (繰り返し数分、従来と同じ結果)
+SMOOTHING_SAVGOL = "savgol"  # Savitzky-Golay フィルタ (連続して検出されているフレームごと)
+SMOOTHING_METHODS = [SMOOTHING_NEIGHBOR, SMOOTHING_SAVGOL]
+
+
+def calc_yaw_array(dx, dy):
+    """移動量から方向(z軸回転角)をまとめて求める (get_angle_2d の配列版)
+
+    Args:
+        dx (np.ndarray): x方向の移動量
+        dy (np.ndarray): y方向の移動量
+
+    Returns:
+        np.ndarray: 方向(degrees) (0〜360)
+    """
+    yaw = np.arctan2(dy, dx)
+    yaw = np.where(yaw >= 0, yaw, yaw + math.pi * 2)
+    return np.degrees(yaw)
+
+
+def smooth_neighbor_average(frames, coords, velocities, lengths, repeat):
+    """前後フレームの座標からの内挿を繰り返して平滑化する (全物体をまとめて計算する)
+
+    各パスでは、フレームごとに直前のフレーム(平滑化済み)と直後のフレーム(平滑化前)の座標から内挿し、
+    速度は直後のフレームの速度、方向は直前のフレームからの移動方向とする。
+    物体ごとに先頭フレームから連続して検出されているフレームのみ平滑化する (先頭・末尾のフレームは除く)。
+
+    Args:
+        frames (np.ndarray): フレーム番号 (T,)
+        coords (np.ndarray): 物体ごとの世界座標(x, y, z) (O, T, 3) (zが無い場合はNaN)
+        velocities (np.ndarray): 物体ごとの速度 (O, T)
+        lengths (np.ndarray): 物体ごとの先頭フレームから連続して検出されているフレーム数 (O,)
+        repeat (int): 平滑化の繰り返し数
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+            平滑化した世界座標 (O, T, 3)、速度 (O, T)、方向(degrees) (O, T)、平滑化したかどうか (O, T)
+    """
+    frames = np.asarray(frames, dtype=np.float64)
+    coords = np.array(coords, dtype=np.float64)
+    velocities = np.array(velocities, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.intp)
+    num_frames = coords.shape[1]
+
+    smoothed = np.arange(num_frames)[np.newaxis, :] <= (lengths - 2)[:, np.newaxis]
+    smoothed[:, 0] = False
+    if repeat <= 0:
+        smoothed[:] = False
+    for _ in range(repeat):
+        for k in range(1, num_frames - 1):
+            active = smoothed[:, k]
+            if not active.any():
+                continue
+            frame_ratio = (frames[k] - frames[k - 1]) / (frames[k + 1] - frames[k - 1])
+            prev_coords = coords[active, k - 1]
+            coords[active, k] = prev_coords + (coords[active, k + 1] - prev_coords) * frame_ratio
+            velocities[active, k] = velocities[active, k + 1]
+
+    # direction from previous (smoothed) frame
+    yaws = np.full(velocities.shape, np.nan)
+    movement = coords[:, 1:, :2] - coords[:, :-1, :2]
+    yaws[:, 1:] = np.where(smoothed[:, 1:], calc_yaw_array(movement[..., 0], movement[..., 1]), np.nan)
+    return coords, velocities, yaws, smoothed
+
+
+def savgol_filter(values, window_length, polyorder, deriv=0):
+    """Savitzky-Golay フィルタで平滑化する (端は先頭・末尾の窓に当てはめた多項式の値とする)
+
+    Args:
+        values (np.ndarray): 等間隔の値 (N, C) (N >= window_length)
+        window_length (int): 窓の長さ (奇数)
+        polyorder (int): 多項式の次数 (window_length 未満)
+        deriv (int): 0の場合は平滑化した値、1の場合は1サンプルあたりの変化量
+
+    Returns:
+        np.ndarray: 平滑化した値 (N, C)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    half = window_length // 2
+    positions = np.arange(-half, half + 1, dtype=np.float64)[:, np.newaxis]
+    powers = np.arange(polyorder + 1)
+
+    # least squares polynomial of every window (N - window_length + 1, polyorder+1, C)
+    fit = np.linalg.pinv(positions ** powers)
+    windows = np.lib.stride_tricks.sliding_window_view(values, window_length, axis=0)
+    poly = np.einsum("pw,ncw->npc", fit, windows)
+
+    # value (or derivative) of polynomial at each position in window
+    if deriv == 0:
+        basis = positions ** powers
+    else:
+        basis = powers * positions ** np.maximum(powers - 1, 0)
+
+    filtered = np.empty_like(values)
+    filtered[:half] = np.einsum("wp,pc->wc", basis[:half], poly[0])
+    filtered[half:len(values) - half] = np.einsum("p,npc->nc", basis[half], poly)
+    filtered[len(values) - half:] = np.einsum("wp,pc->wc", basis[half + 1:], poly[-1])
+    return filtered
+
+
+def smooth_savgol(frames, coords, window_length, polyorder, fps):
+    """連続した検出の世界座標を Savitzky-Golay フィルタで平滑化し、速度・方向を求める
+
+    Args:
+        frames (np.ndarray): 連続したフレームのフレーム番号 (N,) (等間隔であること)
+        coords (np.ndarray): 連続したフレームの世界座標(x, y, z) (N, 3) (zが無い場合はNaN)
+        window_length (int): 窓の長さ (奇数)
+        polyorder (int): 多項式の次数 (window_length 未満)
+        fps (float): 1秒あたりのフレーム数
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: 平滑化した世界座標 (N, 3)、速度(km/h) (N,)、方向(degrees) (N,)
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    smoothed = coords.copy()
+    smoothed[:, :2] = savgol_filter(coords[:, :2], window_length, polyorder)
+    has_z = ~np.isnan(coords[:, 2])
+    if has_z.all():
+        smoothed[:, 2] = savgol_filter(coords[:, 2:], window_length, polyorder)[:, 0]
+
+    # movement per sample => m/s => km/h
+    movement = savgol_filter(coords[:, :2], window_length, polyorder, deriv=1)
+    frame_step = (frames[-1] - frames[0]) / (len(frames) - 1)
+    velocities = 3.6 * np.hypot(movement[:, 0], movement[:, 1]) * fps / frame_step
+    yaws = calc_yaw_array(movement[:, 0], movement[:, 1])
+    return smoothed, velocities, yaws
+
+
+def calc_lat_long(coords, phi0_deg, lambda0_deg):
+    """世界座標から緯度・経度をまとめて求める
+
+    Args:
+        coords (np.ndarray): 世界座標(x, y, ...) (N, 2以上)
+        phi0_deg (float): 平面直角座標系原点の緯度[度]
+        lambda0_deg (float): 平面直角座標系原点の経度[度]
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: 緯度 (N,)、経度 (N,)
+    """
+    xp, yp = cvt_world_to_plane_cartesian(coords[:, 0], coords[:, 1])
+    return convert_cartesian_to_lat_long_array(xp, yp, phi0_deg, lambda0_deg)
@@ -7,22 +7,19 @@ import numpy as np
 import pandas as pd
 
 
-def video_to_images(input_path, output_path, frame_skip=0, start_time=0, end_time=-1, gps_coord_file=None):
-    """動画から画像を抽出する関数
+def iter_video_frames(input_path, frame_skip=0, start_time=0, end_time=-1, gps_coord_file=None):
+    """動画から抽出対象のフレームを順に取り出すジェネレータ
 
     Args:
         input_path (str): 動画ファイルパス(タイプ：string）
-        output_path (str): 出力フォルダパス(タイプ：string）
         frame_skip (int): frame-skipは任意. Defaults to 0.
         start_time (float): 動画からの画像抽出開始時間. Defaults to 0.
         end_time (float): 動画からの画像抽出終了時間. Defaults to -1.
         gps_coord_file (str): GPSデータファイルパス. Defaults to None.
-    """
 
-    # 出力フォルダ作成
-    if os.path.exists(output_path):
-        shutil.rmtree(output_path)
-    os.makedirs(output_path, exist_ok=True)
+    Yields:
+        Tuple[str, av.VideoFrame]: 画像名(拡張子なし)、フレーム
+    """
 
     # 動画名を取得する
     file = os.path.basename(input_path)
@@ -64,29 +61,54 @@ def video_to_images(input_path, output_path, frame_skip=0, start_time=0, end_tim
     start_idx = int(start_time * video_fps)
     end_idx = -1 if (end_time == -1) else int(end_time * video_fps)
 
-    # フレームを保存するためのループ
+    # フレームを取り出すためのループ
     using_gps_frame = (gps_frames is not None)
     using_skip_frame = (frame_skip != 0)
     using_gps_skip_frame = (using_gps_frame and using_skip_frame)
 
-    for ii, frame in enumerate(container.decode(video=0)):
-        if (ii < start_idx):
-            continue
-        if (end_idx != -1 and ii > end_idx):
-            break
+    try:
+        for ii, frame in enumerate(container.decode(video=0)):
+            if (ii < start_idx):
+                continue
+            if (end_idx != -1 and ii > end_idx):
+                break
+
+            if (using_gps_skip_frame and ((ii in gps_frames) or ((ii-start_idx) % (frame_skip + 1) == 0))) \
+                or (using_skip_frame and (not using_gps_skip_frame) and ((ii-start_idx) % (frame_skip + 1) == 0)) \
+                or (using_gps_frame and (not using_gps_skip_frame) and (ii in gps_frames)) \
+                or ((not using_skip_frame) and ( not using_gps_frame) and ((ii-start_idx) % (frame_skip + 1) == 0)):
+
+                yield name + "_%05d" % ii, frame
+    finally:
+        container.close()
+
+
+def video_to_images(input_path, output_path, frame_skip=0, start_time=0, end_time=-1, gps_coord_file=None):
+    """動画から画像を抽出する関数
+
+    Args:
+        input_path (str): 動画ファイルパス(タイプ：string）
+        output_path (str): 出力フォルダパス(タイプ：string）
+        frame_skip (int): frame-skipは任意. Defaults to 0.
+        start_time (float): 動画からの画像抽出開始時間. Defaults to 0.
+        end_time (float): 動画からの画像抽出終了時間. Defaults to -1.
+        gps_coord_file (str): GPSデータファイルパス. Defaults to None.
+    """
 
-        if (using_gps_skip_frame and ((ii in gps_frames) or ((ii-start_idx) % (frame_skip + 1) == 0))) \
-            or (using_skip_frame and (not using_gps_skip_frame) and ((ii-start_idx) % (frame_skip + 1) == 0)) \
-            or (using_gps_frame and (not using_gps_skip_frame) and (ii in gps_frames)) \
-            or ((not using_skip_frame) and ( not using_gps_frame) and ((ii-start_idx) % (frame_skip + 1) == 0)):
+    # 出力フォルダ作成
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    os.makedirs(output_path, exist_ok=True)
 
-            output_fn = name + "_%05d.jpg" % ii
-            img_pil = frame.to_image()
-            img_pil.save(output_path + "/" + output_fn)
-            print(output_fn)
+    # フレームを保存するためのループ
+    for image_name, frame in iter_video_frames(input_path, frame_skip, start_time, end_time, gps_coord_file):
+        output_fn = image_name + ".jpg"
+        img_pil = frame.to_image()
+        img_pil.save(output_path + "/" + output_fn)
+        print(output_fn)
 
 
-def main():
+def main(argv=None):
     # 引数をパースする
     parser = argparse.ArgumentParser(description="動画からの画像切り出し機能")
     parser.add_argument(
@@ -131,7 +153,7 @@ def main():
     )
 
     # 入力引数をパースする
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     input_path = args.input_path
     assert isinstance(input_path, str)
@@ -0,0 +1,90 @@
+import queue
+import threading
+
+# 描画・保存を実行するスレッド数 (0の場合は呼び出し元のスレッドで実行する)
+DEFAULT_NUM_WORKERS = 2
+# キューに保持する処理数の上限 (上限に達した場合は空くまで待つ)
+DEFAULT_QUEUE_SIZE = 8
+
+# キューの終端を表すオブジェクト
+_END_OF_QUEUE = object()
+
+
+class VisualizationWriter:
+    """可視化画像の描画・保存をバックグラウンドのスレッドで実行する
+
+    処理は上限付きのキューで受け渡すため、保存が追いつかない場合は submit() が待つ (メモリ使用量は増えない)。
+    スレッドで発生した例外は、次の submit() または close() で呼び出し元に送出する。
+    """
+
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Args:
+            num_workers (int): 描画・保存を実行するスレッド数 (0の場合は呼び出し元のスレッドで実行する)
+            queue_size (int): キューに保持する処理数の上限
+        """
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.errors = []
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(num_workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        """キューの処理を順に実行する (スレッド本体)"""
+        while True:
+            item = self.queue.get()
+            if item is _END_OF_QUEUE:
+                self.queue.task_done()
+                return
+            func, args = item
+            try:
+                func(*args)
+            except BaseException as e:
+                self.errors.append(e)
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def submit(self, func, *args):
+        """処理を追加する
+
+        Args:
+            func (Callable): 描画・保存を行う関数
+            args: func の引数 (画像は func に渡した後に変更しないこと)
+        """
+        self._raise_error()
+        if not self.threads:
+            func(*args)
+            return
+        self.queue.put((func, args))
+
+    def flush(self):
+        """追加した処理が全て終わるまで待つ (スレッドは終了しない)"""
+        if self.threads:
+            self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        """追加した処理が全て終わるまで待ち、スレッドを終了する"""
+        for _ in self.threads:
+            self.queue.put(_END_OF_QUEUE)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # 呼び出し元の例外を優先する
+        try:
+            self.close()
+        except BaseException:
+            pass
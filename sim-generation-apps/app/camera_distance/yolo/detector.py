@@ -1,15 +1,19 @@
+import itertools
 import os
+import pickle
+import tempfile
 from pathlib import Path
 from typing import Tuple, List
 from numpy import random
 import torch
 import sys
+import yaml
 
 from ultralytics import YOLO
 sys.path.append(os.path.dirname(__file__))
 from commons.constants import YOLO_V8_MODEL_FILE, YOLOCLASSES, DEPRICATE_IOU_THD
 from commons.math_util import calc_IoU
-from utils.datasets import LoadBGRImages
+from utils.datasets import LoadBGRImages, LoadBGRFrames
 from utils.general import set_logging
 from utils.plots import plot_one_box
 from utils.torch_utils import select_device, time_synchronized
@@ -21,6 +25,10 @@ class DetectorBase:
     CONF_THD = 0.25
     IOU_THD = 0.45
     OFFSET_THD = 0.05
+    # number of frames per forward pass (1: model.track() frame by frame)
+    BATCH_SIZE = 1
+    # tracker config (botsort.yaml / bytetrack.yaml)
+    TRACKER = "botsort.yaml"
 
     def __init__(self, device='cpu'):
         self.augment = False
@@ -35,23 +43,146 @@ class DetectorBase:
 
         self.half = self.device.type != 'cpu'  # half precision only supported on CUDA
 
+        # tracker updated frame by frame instead of model.track() (None: use model.track() when BATCH_SIZE is 1)
+        self.tracker = None
+
 class DetectorYOLOv8(DetectorBase):
-    def load_model(self, weights=YOLO_V8_MODEL_FILE, image_size=640):
-        self.model = YOLO(weights)
+    # inference backends (pytorch: load weights as is, others: export on first use and load the exported model)
+    BACKENDS = ("pytorch", "openvino", "onnx")
+
+    def load_model(self, weights=YOLO_V8_MODEL_FILE, image_size=640, backend="pytorch", int8=False, calibration_dir=None):
+        """モデルを読み込む
+
+        backend が pytorch 以外の場合は、weights と同じフォルダにエクスポートしたモデルを読み込む。
+        (エクスポート済みのモデルが無い場合は、最初にエクスポートする)
+
+        Args:
+            weights (str): PyTorchの重みファイルパス
+            image_size (int): 推論時の画像サイズ
+            backend (str): 推論バックエンド (pytorch / openvino / onnx)
+            int8 (bool): INT8量子化したモデルを使用するかどうか (openvinoのみ)
+            calibration_dir (str): INT8量子化のキャリブレーションに使用する画像フォルダパス
+        """
         self.image_size = image_size
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unsupported backend '{backend}'. Supported backends: {self.BACKENDS}")
+
+        if backend == "pytorch":
+            self.model = YOLO(weights)
+            return
+
+        exported_model = self.export_model(weights, backend, int8, calibration_dir)
+        self.model = YOLO(exported_model, task="detect")
+
+    def get_exported_model_path(self, weights, backend, int8=False):
+        """エクスポートしたモデルのパス (ultralyticsのエクスポート先と同じ)"""
+        root = os.path.splitext(weights)[0]
+        if backend == "onnx":
+            return root + ".onnx"
+        return root + ("_int8" if int8 else "") + "_openvino_model"
+
+    def export_model(self, weights, backend, int8=False, calibration_dir=None):
+        """モデルを推論バックエンドの形式にエクスポートする (エクスポート済みの場合はそのパスを返す)
+
+        Args:
+            weights (str): PyTorchの重みファイルパス
+            backend (str): 推論バックエンド (openvino / onnx)
+            int8 (bool): INT8量子化するかどうか (openvinoのみ)
+            calibration_dir (str): INT8量子化のキャリブレーションに使用する画像フォルダパス
+
+        Returns:
+            str: エクスポートしたモデルのパス
+        """
+        if int8 and backend != "openvino":
+            print(f"Warning: INT8 quantization is only supported for openvino. Use FP32 {backend} model.")
+            int8 = False
+
+        exported_model = self.get_exported_model_path(weights, backend, int8)
+        if os.path.exists(exported_model):
+            print(f"Load exported model: {exported_model}")
+            return exported_model
+
+        if int8 and (calibration_dir is None or not os.path.isdir(calibration_dir)):
+            print("Warning: No calibration images for INT8 quantization. Use FP32 openvino model.")
+            int8 = False
+            exported_model = self.get_exported_model_path(weights, backend, int8)
+            if os.path.exists(exported_model):
+                print(f"Load exported model: {exported_model}")
+                return exported_model
+
+        # dynamic=True so that the exported model accepts any batch size (BATCH_SIZE)
+        model = YOLO(weights)
+        export_args = dict(format=backend, imgsz=self.image_size, dynamic=True, half=False, device="cpu")
+        if not int8:
+            return model.export(**export_args)
+
+        # calibrate INT8 quantization on our own frames (images in calibration_dir, no labels needed)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_yaml = os.path.join(tmp_dir, "calibration.yaml")
+            with open(data_yaml, "w", encoding="utf-8") as f:
+                yaml.safe_dump({
+                    "path": os.path.abspath(calibration_dir),
+                    "train": ".",
+                    "val": ".",
+                    "names": dict(model.names),
+                }, f, allow_unicode=True)
+            return model.export(**export_args, int8=True, data=data_yaml)
     
     def detect_ultralytics(self, input_path, output_path, target_class=["car"]) -> Tuple[List, List, List, List]:
+        image_paths: list = []
+        detected_objects: list = []
+        detected_object_names: list = []
+        relative_detected_objects: list = []
+        # List of tracking ids detected in each image
+        tracking_ids: list = []
+
+        for path, _, boxes_xyxy, boxes_rel, boxes_names, boxes_ids in self.iter_detect_ultralytics(
+            input_path, output_path, target_class=target_class
+        ):
+            image_paths.append(path)
+            detected_objects.append(boxes_xyxy)
+            relative_detected_objects.append(boxes_rel)
+            detected_object_names.append(boxes_names)
+            tracking_ids.append(boxes_ids)
+
+        return image_paths, detected_objects, relative_detected_objects, detected_object_names, tracking_ids
+
+    def iter_detect_ultralytics(self, input_path, output_path, target_class=["car"], skip_frames=0):
+        """画像1枚ずつ検出・トラッキングを行い、結果を順に返す
+
+        Args:
+            input_path (str | Iterable): 入力画像フォルダパス、または(画像パス, BGR画像)を順に返すフレームストリーム
+            output_path (str): 出力結果フォルダパス
+            target_class (list): 検出対象のクラス名
+            skip_frames (int):
+                検出しない先頭のフレーム数 (チェックポイントから再開する場合の処理済みのフレーム数)。
+                1以上の場合は、ラベルファイルを作成し直さずに追記する
+
+        Yields:
+            Tuple[str, np.ndarray, list, list, list, list]:
+                画像パス、入力画像、矩形(xmin, ymin, xmax, ymax)、相対矩形(x/W, y/H, w/W, h/H)、クラス名、トラッキングID
+        """
         # Directories
         save_dir = Path(output_path)
         (save_dir / 'labels' if self.save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir     
         txt_path = str(save_dir / 'labels' / 'labels.txt')
-        if self.save_txt:
+        if self.save_txt and skip_frames == 0:
             with open(txt_path, 'w', encoding='utf-8') as f:
                 f.write(f'image_name, class_id, class_name, x, y, w, h')
                 f.write(', conf\n') if self.save_conf else f.write('\n')
                 
         # Set Dataloader
-        dataset = LoadBGRImages(input_path, img_size=self.image_size)
+        if isinstance(input_path, (str, Path)):
+            dataset = LoadBGRImages(input_path, img_size=self.image_size)
+        else:
+            dataset = LoadBGRFrames(input_path)
+
+        # skip processed frames (frame stream has to be decoded in order)
+        if skip_frames > 0:
+            if isinstance(dataset, LoadBGRImages):
+                dataset.images = dataset.images[skip_frames:]
+            else:
+                dataset = itertools.islice(dataset, skip_frames, None)
 
         # Convert classes
         target_class = [YOLOCLASSES[t] for t in target_class]
@@ -61,30 +192,20 @@ class DetectorYOLOv8(DetectorBase):
         names = self.model.module.names if hasattr(self.model, 'module') else self.model.names
         colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
         
-        detected_objects: list = []
-        detected_object_names: list = []
-        relative_detected_objects: list = []
-        # List of tracking ids detected in each image
-        tracking_ids: list = []
-        idx = 0
+        idx = skip_frames
 
-        for path, img, img0 in dataset:
+        for path, img0, result, inference_time in self.iter_track_results(dataset, target_class):
             image_fn = os.path.basename(path)
             print(idx, image_fn)
 
-            plotted = False
-            detected_objects.append([])
-            detected_object_names.append([])
-            relative_detected_objects.append([])
-            
-            # Run inference
-            t1 = time_synchronized()
-            results = self.model.track(img0, classes=target_class, conf=self.CONF_THD, iou=self.IOU_THD, imgsz=self.image_size, 
-                                         augment=self.augment, half=self.half, device=self.device, agnostic_nms=self.agnostic_nms,
-                                         persist=True)
-            t2 = time_synchronized()
+            detected_objects = []
+            detected_object_names = []
+            relative_detected_objects = []
+            tracking_ids = []
+            # img0 is returned to the caller, so draw boxes on a copy only when saving images
+            img_plot = img0.copy() if self.save_img else None
             
-            boxes = results[0].boxes
+            boxes = result.boxes
             if boxes.id is None:
                 boxes_xyxy, boxes_xywh, boxes_conf, boxes_cls, boxes_ids = ([], [], [], [], [])
             else:
@@ -129,7 +250,7 @@ class DetectorYOLOv8(DetectorBase):
                     boxes_xyxy, boxes_xywh, boxes_conf, boxes_cls, boxes_ids = ([], [], [], [], [])
                     
                 # Write results
-                tracking_ids.append(list(boxes_ids)[::-1])
+                tracking_ids = list(boxes_ids)[::-1]
                 for i, xyxy in enumerate(reversed(boxes_xyxy)):
                     conf = boxes_conf[i]
                     cls = boxes_cls[i]
@@ -139,12 +260,12 @@ class DetectorYOLOv8(DetectorBase):
 
                     # absolute coordinate of bounding-box (xmin, ymin, xmax, ymax)
                     xmin, ymin, xmax, ymax = [x.numpy().tolist() for x in xyxy]
-                    detected_objects[idx].append([xmin, ymin, xmax, ymax])
-                    detected_object_names[idx].append(class_name)
+                    detected_objects.append([xmin, ymin, xmax, ymax])
+                    detected_object_names.append(class_name)
                     
                     # relative coordinate of bounding-box (x/W, y/H, w/W, h/H)
                     xywh = (boxes_xywh[i] / gn).tolist()
-                    relative_detected_objects[idx].append(xywh)
+                    relative_detected_objects.append(xywh)
                     
                     if self.save_txt:  # Write to file
                         
@@ -154,19 +275,136 @@ class DetectorYOLOv8(DetectorBase):
                             text += ('%g, ' * (len(line)-1) + '%g').rstrip() % line + '\n'
                             f.write(text)
 
-                    plot_one_box(xyxy, img0, label=None, color=colors[int(cls)], line_thickness=1)
-                    plotted = True
-            else:
-                tracking_ids.append([])
+                    if self.save_img:
+                        plot_one_box(xyxy, img_plot, label=None, color=colors[int(cls)], line_thickness=1)
 
             # Print time (inference + NMS)
-            print(f'{s}Done. ({(1E3 * (t2 - t1)):.1f}ms) Prediction')
+            print(f'{s}Done. ({(1E3 * inference_time):.1f}ms) Prediction')
 
-            if self.save_img and plotted:
+            if self.save_img and len(detected_objects):
                 output_fn = os.path.basename(path)
                 output_fpath = os.path.join(save_dir, output_fn)
-                write_image_unicode_path(output_fpath, img0)
+                write_image_unicode_path(output_fpath, img_plot)
+
+            yield path, img0, detected_objects, relative_detected_objects, detected_object_names, tracking_ids
 
             idx += 1
 
-        return dataset.images, detected_objects, relative_detected_objects, detected_object_names, tracking_ids
\ No newline at end of file
+    def iter_track_results(self, dataset, target_class):
+        """検出・トラッキングを行い、フレーム順に結果を返す
+
+        BATCH_SIZE が1の場合は、1フレームずつ model.track() を実行する。
+        BATCH_SIZE が2以上の場合は、BATCH_SIZE フレームずつ model.predict() で検出した後、
+        model.track() と同じ処理でトラッカーをフレーム順に1フレームずつ更新する。(トラッキングIDは同じになる)
+        tracker を設定した場合は、BATCH_SIZE が1の場合も model.predict() で検出し、tracker を更新する。
+
+        Args:
+            dataset (Iterable): (画像パス, 変換画像, 元画像)を順に返すデータセット
+            target_class (list): 検出対象のクラスID
+
+        Yields:
+            Tuple[str, np.ndarray, Results, float]: 画像パス、元画像、トラッキング結果、1フレームあたりの推論時間(s)
+        """
+        if self.BATCH_SIZE <= 1 and self.tracker is None:
+            for path, img, img0 in dataset:
+                t1 = time_synchronized()
+                results = self.model.track(img0, classes=target_class, conf=self.CONF_THD, iou=self.IOU_THD, imgsz=self.image_size, 
+                                             augment=self.augment, half=self.half, device=self.device, agnostic_nms=self.agnostic_nms,
+                                             persist=True, tracker=self.TRACKER)
+                t2 = time_synchronized()
+                yield path, img0, results[0], t2 - t1
+            return
+
+        tracker = self.tracker if self.tracker is not None else self.create_tracker()
+        batch_size = max(self.BATCH_SIZE, 1)
+        batch = []
+        for path, img, img0 in dataset:
+            batch.append((path, img0))
+            if len(batch) == batch_size:
+                yield from self.track_batch(batch, tracker, target_class)
+                batch = []
+        if len(batch):
+            yield from self.track_batch(batch, tracker, target_class)
+
+    def get_tracker_settings(self):
+        """トラッカーの設定ファイル(TRACKER)の内容を読み込む
+
+        Returns:
+            dict: トラッカーの設定
+        """
+        from ultralytics.utils import yaml_load
+        from ultralytics.utils.checks import check_yaml
+
+        return yaml_load(check_yaml(self.TRACKER))
+
+    def create_tracker(self):
+        """model.track() と同じ設定、フレームレートでトラッカーを作成する"""
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace
+
+        cfg = IterableSimpleNamespace(**self.get_tracker_settings())
+        if cfg.tracker_type not in TRACKER_MAP:
+            raise ValueError(f"Only 'bytetrack' and 'botsort' are supported for now, but got '{cfg.tracker_type}'")
+        return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=30)
+
+    def enable_tracker_state(self):
+        """トラッカーの状態を保存・復元できるようにする
+
+        model.track() 内部のトラッカーは保存できないため、create_tracker() で作成したトラッカーを
+        フレーム順に更新する。(トラッキングIDは model.track() と同じになる)
+        """
+        if self.tracker is None:
+            self.tracker = self.create_tracker()
+
+    def get_tracker_state(self):
+        """トラッカーの状態を取得する (enable_tracker_state() の後に使用する)
+
+        Returns:
+            bytes: トラッカーとトラッキングIDの採番状態を pickle したもの
+
+        Raises:
+            pickle.PicklingError, TypeError, AttributeError: トラッカーを pickle できない場合 (gmc_method が orb、sift など)
+        """
+        from ultralytics.trackers.basetrack import BaseTrack
+
+        return pickle.dumps({"tracker": self.tracker, "track_count": BaseTrack._count})
+
+    def set_tracker_state(self, state):
+        """get_tracker_state() で取得した状態にトラッカーを戻す
+
+        Args:
+            state (bytes): トラッカーの状態
+        """
+        from ultralytics.trackers.basetrack import BaseTrack
+
+        state = pickle.loads(state)
+        self.tracker = state["tracker"]
+        # track IDs are numbered by class-level counter
+        BaseTrack._count = state["track_count"]
+
+    def track_batch(self, batch, tracker, target_class):
+        """複数フレームをまとめて検出し、フレーム順にトラッカーを更新する
+
+        Args:
+            batch (list): (画像パス, 元画像)のリスト
+            tracker (BOTSORT | BYTETracker): トラッカー
+            target_class (list): 検出対象のクラスID
+
+        Yields:
+            Tuple[str, np.ndarray, Results, float]: 画像パス、元画像、トラッキング結果、1フレームあたりの推論時間(s)
+        """
+        t1 = time_synchronized()
+        results = self.model.predict([img0 for _, img0 in batch], classes=target_class, conf=self.CONF_THD, iou=self.IOU_THD,
+                                     imgsz=self.image_size, augment=self.augment, half=self.half, device=self.device,
+                                     agnostic_nms=self.agnostic_nms, batch=len(batch), verbose=False)
+        t2 = time_synchronized()
+
+        for (path, img0), result in zip(batch, results):
+            # same as ultralytics.trackers.track.on_predict_postprocess_end
+            det = result.boxes.cpu().numpy()
+            if len(det):
+                tracks = tracker.update(det, img0)
+                if len(tracks):
+                    result = result[tracks[:, -1].astype(int)]
+                    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+            yield path, img0, result, (t2 - t1) / len(batch)
\ No newline at end of file
@@ -173,6 +173,19 @@ class LoadBGRImages:  # for inference
         return path, img, img0
 
 
+class LoadBGRFrames:  # for inference (frame stream)
+    def __init__(self, frames):
+        # frames: iterable of (path, BGR image)
+        self.frames = frames
+        self.images = []
+
+    def __iter__(self):
+        # model.track() takes the original image, so letterbox conversion is not needed here
+        for path, img0 in self.frames:
+            self.images.append(path)
+            yield path, None, img0
+
+
 class LoadImages:  # for inference
     def __init__(self, path, img_size=640, stride=32):
         p = str(Path(path).absolute())  # os-agnostic absolute path
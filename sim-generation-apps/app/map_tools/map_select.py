@@ -189,7 +189,7 @@ def find_min_max(csv_path, column_names):
 
     return results
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="")
     parser.add_argument(
         "--route_data_path",
@@ -232,7 +232,7 @@ def main():
         default="lat",
         help="緯度のcolumn名",
     )
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     route_data_path = args.route_data_path
     map_data_path = args.map_data_path
     lane_id = args.lane_id
@@ -0,0 +1,532 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(APP_DIR, "camera_distance"))
+sys.path.append(os.path.join(APP_DIR, "map_tools"))
+sys.path.append(os.path.join(APP_DIR, "scenario"))
+sys.path.append(os.path.join(APP_DIR, "tool"))
+
+from commons.result_io import enable_memory_cache
+
+# 処理ステップの一覧 [(ステップ名, 開始メッセージ, 処理関数), ...]
+# 登録順に実行する。
+STEPS = []
+
+# パイプライン実行前のステップ (entrypoint.shで実行する)
+FIRST_PREVIOUS_STEP = "S3_COPY"
+TERMINATE_STEP = "TERMINATE_PROCESS"
+
+# 動画から画像を抽出する際のframe-skip
+VIDEO_FRAME_SKIP = "1"
+
+
+def register_step(step_name, message):
+    """処理ステップを登録するデコレータ
+
+    処理関数は PipelineContext を受け取り、保存するステップ名を返す。
+    (None を返した場合は登録したステップ名を保存する)
+
+    Args:
+        step_name (str): ステップ名 (last_stepに保存する名前)
+        message (str): ステップ開始時に表示するメッセージ
+    """
+    def decorator(func):
+        STEPS.append((step_name, message, func))
+        return func
+    return decorator
+
+
+class PipelineContext:
+    """各ステップで使用するファイル、ディレクトリ (entrypoint.shと同じ構成)"""
+
+    def __init__(self, work_dir, mp4_file, gps_coord_file, lane_id, pos_est_setting_file,
+                 stream_frames=False, save_frames=False, cache_dir=None, visualize_interval=1,
+                 lane_correction_coord="lat_long", smoothing_method="neighbor", checkpoint_interval=0):
+        self.app_dir = APP_DIR
+        self.work_dir = work_dir
+        self.input_dir = os.path.join(work_dir, "input")
+        self.mp4_file = mp4_file
+        self.gps_coord_file = gps_coord_file
+        self.lane_id = lane_id
+        self.pos_est_setting_file = pos_est_setting_file
+        # 動画から直接フレームを読み込んで検出するかどうか (画像ファイルを介さない)
+        self.stream_frames = stream_frames
+        # フレームストリーム時に抽出画像、補正画像をファイルに保存するかどうか
+        self.save_frames = save_frames
+        # ジョブ間で共有するキャッシュの保存先 (Noneの場合はファイルに保存しない)
+        self.cache_dir = cache_dir
+        # 相対距離推定の可視化画像を出力するフレームの間隔 (0の場合は出力しない)
+        self.visualize_interval = visualize_interval
+        # レーン補正で最も近いレーンを求める座標系 (lat_long / world)
+        self.lane_correction_coord = lane_correction_coord
+        # 他車の動きの平滑化の方法 (neighbor / savgol)
+        self.smoothing_method = smoothing_method
+        # 相対距離推定のチェックポイントを保存するフレームの間隔 (0の場合は保存しない)
+        self.checkpoint_interval = checkpoint_interval
+
+        self.image_src = os.path.join(work_dir, "image_src")
+        self.image_distortion = os.path.join(work_dir, "image_distortion")
+        self.image_infer = os.path.join(work_dir, "image_infer")
+        self.work_job_dir = os.path.join(work_dir, "job")
+        self.simulation_dir = os.path.join(self.work_job_dir, "scenario")
+        self.sdmg_edit = os.path.join(work_dir, "sdmg")
+        self.calibration_dir = os.path.join(APP_DIR, "camera_distance/tools/distortion_correction")
+
+        # 相対距離推定の結果はフレームごとに書き込んだ JSON Lines で受け渡す
+        self.infer_rel_coord_file = os.path.join(self.image_infer, "detection_distance_result.jsonl")
+        # ステップ間では列形式の軌跡データで受け渡し、jsonファイルは EXPORT_ABS_POS_JSON で出力する
+        self.car_abs_result_file = os.path.join(self.image_infer, "car_abs_pos_result.npz")
+        self.car_abs_result_json_file = os.path.join(self.image_infer, "car_abs_pos_result.json")
+        self.base_scenario_file = os.path.join(APP_DIR, "scenario/data/base_scenario.xml")
+        self.car_object_data_file = os.path.join(APP_DIR, "scenario/data/car_object_data.xml")
+        self.setting_json = os.path.join(APP_DIR, "scenario/data/setting.json")
+        self.scenario_xml_file = os.path.join(self.sdmg_edit, "scenario.xml")
+
+        self.map_select_file = ""
+        self.xodr_road_coordinate_file = ""
+        self.epsg_code = ""
+        self.road_correct_target_file = ""
+        self.load_map_select_result()
+
+    def find_input_json(self, keyword):
+        """入力フォルダから名前にkeywordを含むjsonファイルを探す"""
+        files = sorted(glob.glob(os.path.join(self.input_dir, "*.json")))
+        files = [f for f in files if keyword in os.path.basename(f)]
+        return files[0] if files else ""
+
+    def load_map_select_result(self):
+        """マップ選択結果を読み込む
+
+        Returns:
+            bool: マップ選択結果ファイルが存在するかどうか
+        """
+        self.map_select_file = self.find_input_json("MapSelectResult")
+        if not self.map_select_file:
+            return False
+
+        with open(self.map_select_file, "r", encoding="utf-8") as f:
+            map_select_result = json.load(f)
+        self.xodr_road_coordinate_file = map_select_result["road_coordinates_path"]
+        self.epsg_code = str(map_select_result["epsg"])
+        self.road_correct_target_file = self.find_input_json("self")
+        return True
+
+
+def save_last_step(step, status_file):
+    """DynamoDBまたはローカルJSONにステップを保存する (job_status_utils.shのsave_last_stepと同じ)
+
+    Args:
+        step (str): ステップ名
+        status_file (str): ローカル実行時のステータスファイルパス
+    """
+    source_id = os.environ.get("SOURCE_ID", "")
+    if os.environ.get("IS_LOCAL", "false") == "true":
+        job_id = os.environ.get("AWS_BATCH_JOB_ID", "")
+        with open(status_file, "w", encoding="utf-8") as f:
+            json.dump({"source_id": source_id, "job_id": job_id, "last_step": step}, f)
+    else:
+        creation_date_time = os.environ.get("CREATION_DATE_TIME", "")
+        key = {"source_id": {"S": source_id}, "creation_date_time": {"S": creation_date_time}}
+        subprocess.run([
+            "aws", "dynamodb", "update-item",
+            "--table-name", os.environ["DYNAMO_DB_NAME"],
+            "--key", json.dumps(key),
+            "--update-expression", "SET last_step = :step",
+            "--expression-attribute-values", json.dumps({":step": {"S": step}}),
+        ], check=True)
+
+
+def run_main(main_func, argv):
+    """スクリプトのmain関数を同一プロセス内で実行する
+
+    Args:
+        main_func (function): スクリプトのmain関数
+        argv (list): コマンドライン引数
+    """
+    try:
+        main_func(argv)
+    except SystemExit as e:
+        # 終了コード0のsys.exit()は、スクリプト単体で実行した場合と同様に次のステップへ進む
+        if e.code not in (None, 0):
+            raise
+
+
+def calibration_args(ctx: PipelineContext):
+    """歪み補正に使用するカメラ行列、歪み係数、歪み補正マップの保存先の引数"""
+    args = [
+        "--intrinsic_camera_matrix_path", os.path.join(ctx.calibration_dir, "intrinsic_camera_matrix.npy"),
+        "--calibration_matrix_P2_path", os.path.join(ctx.calibration_dir, "calibration_matrix_P2.npy"),
+        "--dist_coeffs_path", os.path.join(ctx.calibration_dir, "dist_coeffs.npy"),
+    ]
+    if ctx.cache_dir is not None:
+        args += ["--map_cache_dir", os.path.join(ctx.cache_dir, "undistort_maps")]
+    return args
+
+
+@register_step("MAP_SELECT", "GPS情報を基に、MAPを選択します。")
+def map_select_step(ctx: PipelineContext):
+    import map_select
+
+    run_main(map_select.main, [
+        "--route_data_path", ctx.gps_coord_file,
+        "--map_data_path", os.path.join(ctx.app_dir, "map_tools/map_data/"),
+        "--lane_id", ctx.lane_id,
+    ])
+
+    # マップ選択情報ファイルが存在するかどうかを確認
+    if not ctx.load_map_select_result():
+        print(f"対象のマップが見つかりませんでした。: {ctx.gps_coord_file}")
+        return TERMINATE_STEP
+
+
+@register_step("VIDEO_TO_IMAGE", "動画から画像を抽出")
+def video_to_image_step(ctx: PipelineContext):
+    if ctx.stream_frames:
+        print("フレームストリームのため、他車両の相対距離推定で動画から直接読み込みます。")
+        return
+
+    from tools import video2image
+
+    run_main(video2image.main, [
+        "--input_path", ctx.mp4_file,
+        "--output_path", ctx.image_src,
+        "--frame_skip", VIDEO_FRAME_SKIP,
+    ])
+
+
+@register_step("DISTORTION", "画像補正")
+def distortion_step(ctx: PipelineContext):
+    if ctx.stream_frames:
+        print("フレームストリームのため、他車両の相対距離推定で歪み補正します。")
+        return
+
+    from tools.distortion_correction import distortion_correction
+
+    run_main(distortion_correction.main, [
+        "--input_dir", ctx.image_src,
+        "--output_dir", ctx.image_distortion,
+    ] + calibration_args(ctx))
+
+
+@register_step("INFER_DISTANCE", "他車両の相対距離を推定")
+def infer_distance_step(ctx: PipelineContext):
+    import infer_distance_to_car
+
+    if ctx.stream_frames:
+        input_args = ["--input_video", ctx.mp4_file, "--frame_skip", VIDEO_FRAME_SKIP] + calibration_args(ctx)
+        if ctx.save_frames:
+            input_args += ["--src_output_dir", ctx.image_src, "--distortion_output_dir", ctx.image_distortion]
+    else:
+        input_args = ["--input_dir", ctx.image_distortion]
+    if ctx.cache_dir is not None:
+        input_args += [
+            "--detection_cache_dir", os.path.join(ctx.cache_dir, "detections"),
+            "--lut_cache_dir", os.path.join(ctx.cache_dir, "ground_plane_luts"),
+        ]
+
+    run_main(infer_distance_to_car.main, input_args + [
+        "--output_dir", ctx.image_infer,
+        "--pos_est_setting_file", ctx.pos_est_setting_file,
+        "--visualize_interval", str(ctx.visualize_interval),
+        "--output_format", "jsonl",
+        "--checkpoint_interval", str(ctx.checkpoint_interval),
+    ])
+
+
+@register_step("DETECT_CSV", "測距した結果を検出した車両ごとにCSV出力")
+def detect_csv_step(ctx: PipelineContext):
+    import detect2csv
+
+    run_main(detect2csv.main, [
+        "--rel_coord_file", ctx.infer_rel_coord_file,
+    ])
+
+
+@register_step("ABS_POS_SELF", "自車両の軌跡データを生成")
+def abs_pos_self_step(ctx: PipelineContext):
+    import calc_car_abs_pos_self
+
+    # Gセンサデータ(txt)は加速度csvとして読み込めないため、acc_data_fileは指定しない
+    run_main(calc_car_abs_pos_self.main, [
+        "--rel_coord_file", ctx.infer_rel_coord_file,
+        "--gps_coord_file", ctx.gps_coord_file,
+        "--epsg_code", ctx.epsg_code,
+        "--fps", "30",
+        "--output_format", "npz",
+    ])
+
+
+@register_step("CORRECT_CAR", "レーン情報を元に自車の絶対座標を補正")
+def correct_car_step(ctx: PipelineContext):
+    import correct_car_abs_pos_self
+
+    run_main(correct_car_abs_pos_self.main, [
+        "--lane_coord_file_path", ctx.xodr_road_coordinate_file,
+        "--car_abs_coord_file_path", ctx.car_abs_result_file,
+        "--road_correct_targets_file_path", ctx.road_correct_target_file,
+        "--correction_coord", ctx.lane_correction_coord,
+    ])
+
+
+@register_step("ABS_POS_DETECT", "他車両の軌跡データを生成")
+def abs_pos_detect_step(ctx: PipelineContext):
+    import calc_car_abs_pos_detect
+
+    run_main(calc_car_abs_pos_detect.main, [
+        "--car_abs_coord_file_path", ctx.car_abs_result_file,
+        "--epsg_code", ctx.epsg_code,
+        "--fps", "30",
+    ])
+
+
+@register_step("CORRECT_CAR_DETECT", "レーン情報を元に他車の絶対座標を補正")
+def correct_car_detect_step(ctx: PipelineContext):
+    import correct_car_abs_pos_detect
+
+    run_main(correct_car_abs_pos_detect.main, [
+        "--lane_coord_file_path", ctx.xodr_road_coordinate_file,
+        "--car_abs_coord_file_path", ctx.car_abs_result_file,
+        "--target_option", "beforeIn",
+        "--correction_coord", ctx.lane_correction_coord,
+    ])
+
+
+@register_step("SMOOTH_ABS_POS", "他車の速度を平均化")
+def smooth_abs_pos_step(ctx: PipelineContext):
+    import smooth_abs_pos_detect
+
+    run_main(smooth_abs_pos_detect.main, [
+        "--car_abs_coord_file_path", ctx.car_abs_result_file,
+        "--repeat", "3",
+        "--method", ctx.smoothing_method,
+    ])
+
+
+@register_step("CALC_VEL_YAW", "補正した座標での速度角度の再計算")
+def calc_vel_yaw_step(ctx: PipelineContext):
+    import calc_car_velocity_yaw
+
+    run_main(calc_car_velocity_yaw.main, [
+        "--car_abs_coord_file_path", ctx.car_abs_result_file,
+        "--fps", "30",
+    ])
+
+
+@register_step("EXPORT_ABS_POS_JSON", "軌跡データをjsonファイルに出力")
+def export_abs_pos_json_step(ctx: PipelineContext):
+    import convert_result_file
+
+    run_main(convert_result_file.main, [
+        "--input_file", ctx.car_abs_result_file,
+        "--output_file", ctx.car_abs_result_json_file,
+    ])
+
+
+@register_step("MAKE_CAR_ROUTE", "自車・他車の走行経路csvファイルを作成")
+def make_car_route_step(ctx: PipelineContext):
+    import make_car_route_csv
+
+    run_main(make_car_route_csv.main, [
+        "--xodr_road_json", ctx.xodr_road_coordinate_file,
+        "--abs_coord_file", ctx.car_abs_result_file,
+    ])
+
+
+@register_step("GENERATE_SCENARIO", "シナリオ生成")
+def generate_scenario_step(ctx: PipelineContext):
+    import scenario_xml_initialize
+    import set_map_to_scenario
+    import route2divp_route
+    import divp_scenario
+    import generate_ros_setting_json
+
+    xosc_config_json = os.path.join(ctx.sdmg_edit, "xosc_config.json")
+
+    print("シナリオINIT")
+    run_main(scenario_xml_initialize.main, [
+        "--abs_coord_file", ctx.car_abs_result_file,
+        "--base_scenario_xml", ctx.base_scenario_file,
+        "--car_data_xml", ctx.car_object_data_file,
+        "--output_dir", ctx.sdmg_edit,
+    ])
+
+    print("マップ設定")
+    run_main(set_map_to_scenario.main, [
+        "--scenario_xml_file", ctx.scenario_xml_file,
+        "--xosc_config_json", xosc_config_json,
+        "--map_info_file", ctx.map_select_file,
+    ])
+
+    print("経路をdivp経路に変換")
+    run_main(route2divp_route.main, [
+        "--car_routes_dir", ctx.image_infer,
+        "--output_dir", ctx.simulation_dir,
+    ])
+
+    print("generate divp scenario")
+    run_main(divp_scenario.main, [
+        "--scenario_xml_file", ctx.scenario_xml_file,
+        "--xosc_config_json", xosc_config_json,
+        "--car_routes_dir", ctx.simulation_dir,
+        "--output_dir", ctx.simulation_dir,
+    ])
+
+    # ROS実行用のsetting.json作成
+    print("generate setting json")
+    divp_route_csv_files = sorted(glob.glob(os.path.join(ctx.simulation_dir, "*.csv")))
+    divp_route_csv_args = ["--divp_route_csv_file", divp_route_csv_files[0]] if divp_route_csv_files else []
+    run_main(generate_ros_setting_json.main, divp_route_csv_args + [
+        "--base_setting_json", ctx.setting_json,
+        "--output_path", ctx.work_job_dir,
+        "--camera_fps", "3",
+    ])
+
+
+def run_pipeline(ctx: PipelineContext, last_step: str, status_file: str):
+    """前回のステップの次のステップから順番に実行する
+
+    entrypoint.shと同様に、前回のステップ自体も再実行する。
+
+    Args:
+        ctx (PipelineContext): 各ステップで使用するファイル、ディレクトリ
+        last_step (str): 前回のステップ
+        status_file (str): ローカル実行時のステータスファイルパス
+    """
+    # ステップ間の結果jsonはメモリ上で受け渡す
+    enable_memory_cache()
+
+    previous_step = FIRST_PREVIOUS_STEP
+    for step_name, message, func in STEPS:
+        if last_step in (previous_step, step_name):
+            print(message)
+            saved_step = func(ctx) or step_name
+            if saved_step != step_name:
+                print(f"異常終了: {last_step}")
+
+            # ステップを保存
+            save_last_step(saved_step, status_file)
+            last_step = saved_step
+            if saved_step == step_name:
+                print(f"完了: {last_step}")
+        previous_step = step_name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シナリオ生成の各ステップを1プロセスで実行する")
+    parser.add_argument(
+        "--work_dir",
+        type=str,
+        required=True,
+        help="作業フォルダパス",
+    )
+    parser.add_argument(
+        "--mp4_file",
+        type=str,
+        required=True,
+        help="前方カメラの動画ファイルパス",
+    )
+    parser.add_argument(
+        "--gps_coord_file",
+        type=str,
+        required=True,
+        help="GPSデータファイルパス",
+    )
+    parser.add_argument(
+        "--lane_id",
+        type=str,
+        required=False,
+        default="-100",
+        help="laneのID",
+    )
+    parser.add_argument(
+        "--pos_est_setting_file",
+        type=str,
+        required=True,
+        help="距離推定の設定ファイル",
+    )
+    parser.add_argument(
+        "--stream_frames",
+        action="store_true",
+        help="動画から直接フレームを読み込んで検出する (抽出画像、補正画像をファイルに保存しない)",
+    )
+    parser.add_argument(
+        "--save_frames",
+        action="store_true",
+        help="--stream_frames指定時も抽出画像、補正画像をファイルに保存する",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="ジョブ間で共有するキャッシュの保存先フォルダパス",
+    )
+    parser.add_argument(
+        "--visualize_interval",
+        type=int,
+        required=False,
+        default=1,
+        help="相対距離推定の可視化画像を出力するフレームの間隔 (1: 全フレーム、N: Nフレームごと、0: 出力しない)",
+    )
+    parser.add_argument(
+        "--lane_correction_coord",
+        type=str,
+        choices=["lat_long", "world"],
+        required=False,
+        default="lat_long",
+        help="レーン補正で最も近いレーンを求める座標系 (lat_long: 緯度・経度、world: 世界座標(平面直角座標系、m))",
+    )
+    parser.add_argument(
+        "--smoothing_method",
+        type=str,
+        choices=["neighbor", "savgol"],
+        required=False,
+        default="neighbor",
+        help="他車の動きの平滑化の方法 (neighbor: 前後フレームからの内挿の繰り返し、savgol: Savitzky-Golay フィルタ)",
+    )
+    parser.add_argument(
+        "--checkpoint_interval",
+        type=int,
+        required=False,
+        default=300,
+        help="相対距離推定のチェックポイントを保存するフレームの間隔 (0: 保存しない)。中断後の再実行時はチェックポイントから再開する",
+    )
+    parser.add_argument(
+        "--status_file",
+        type=str,
+        required=True,
+        help="ローカル実行時のステータスファイルパス",
+    )
+    parser.add_argument(
+        "--last_step",
+        type=str,
+        required=True,
+        help="前回のステップ",
+    )
+
+    args = parser.parse_args(argv)
+
+    ctx = PipelineContext(
+        args.work_dir,
+        args.mp4_file,
+        args.gps_coord_file,
+        args.lane_id,
+        args.pos_est_setting_file,
+        stream_frames=args.stream_frames,
+        save_frames=args.save_frames,
+        cache_dir=args.cache_dir,
+        visualize_interval=args.visualize_interval,
+        lane_correction_coord=args.lane_correction_coord,
+        smoothing_method=args.smoothing_method,
+        checkpoint_interval=args.checkpoint_interval,
+    )
+    run_pipeline(ctx, args.last_step, args.status_file)
+
+
+if __name__ == "__main__":
+    main()
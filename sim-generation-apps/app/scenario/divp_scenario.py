@@ -73,7 +73,7 @@ def extract_number_from_actor_name(actor_name):
     return None
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="対象の相対座標の計算")
     parser.add_argument(
         "--scenario_xml_file",
@@ -100,7 +100,7 @@ def main():
         help="output directory",
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     scenario_xml_file = args.scenario_xml_file
     assert isinstance(scenario_xml_file, str)
     xosc_config_json = args.xosc_config_json
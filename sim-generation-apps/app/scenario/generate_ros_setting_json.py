@@ -4,7 +4,7 @@ import json
 import pandas as pd
 import argparse
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="相対距離推定結果jsonファイルCSV変換")
     parser.add_argument(
         "--divp_route_csv_file",
@@ -32,7 +32,7 @@ def main():
         help="出力先ディレクトリ",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     divp_route_csv_file = args.divp_route_csv_file
     assert isinstance(divp_route_csv_file, str)
 
@@ -127,7 +127,7 @@ def convert_car_route_to_divp(car_routes_dir, environment, output_dir):
         route_data.to_csv(divp_route_path, index=False, encoding='utf-8')
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="対象の相対座標の計算")
     parser.add_argument(
         "--car_routes_dir",
@@ -148,7 +148,7 @@ def main():
         help="出力ディレクトリ",
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     car_routes_dir = args.car_routes_dir
     assert isinstance(car_routes_dir, str)
 
@@ -1,4 +1,5 @@
 import os
+import sys
 import re
 import json
 import argparse
@@ -9,6 +10,9 @@ import xml.etree.ElementTree as ET
 
 from scenario_util import save_xml_data
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../camera_distance')))
+from commons.result_io import load_result_columns
+
 def extract_frame(image_name):
     match = re.search(r'_(\d{5})', image_name)
     if match:
@@ -30,7 +34,7 @@ def extract_frame(image_name):
 #     ]
 # }
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="対象の相対座標の計算")
     parser.add_argument(
         "--base_scenario_xml",
@@ -65,7 +69,7 @@ def main():
         help="出力ディレクトリパス",
     )
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     base_scenario_xml = args.base_scenario_xml
     assert isinstance(base_scenario_xml, str)
     car_data_xml = args.car_data_xml
@@ -127,21 +131,23 @@ def main():
 
     # add object
     infer_label_file = os.path.join(os.path.dirname(os.path.abspath(abs_coord_file)), "labels/labels.txt")
-    with open(abs_coord_file, mode='r', encoding='utf-8') as f:
-        det_abs_coord_result = json.load(f)
+    # 使用する列のみ読み込む
+    frame_columns, detection_columns = load_result_columns(
+        abs_coord_file, frame_keys=["frame"], detection_keys=["obj_id", "world_coordinate"])
+    # detections of frame ii are rows detection_starts[ii]:detection_starts[ii + 1] of detection_columns
+    detection_starts = detection_columns['result_index'].searchsorted(range(len(frame_columns['frame']) + 1)).tolist()
 
     label_df = pd.read_csv(infer_label_file, skipinitialspace=True)
     label_df['frame'] = label_df['image_name'].apply(extract_frame)    
     
     # オブジェクト
-    for item in det_abs_coord_result['results']:
-        frame = item['frame']
+    for ii, frame in enumerate(frame_columns['frame']):
         frame_label_df = label_df[label_df['frame'] == frame]
         frame_label_length = len(frame_label_df)
         # other
-        for i, detect in enumerate(item['detections']):
-            obj_id = detect['obj_id']
-            world_coordinate = detect.get('world_coordinate')
+        for i, row in enumerate(range(detection_starts[ii], detection_starts[ii + 1])):
+            obj_id = detection_columns['obj_id'][row]
+            world_coordinate = detection_columns['world_coordinate'][row]
             if world_coordinate is None:
                 continue
             if frame_label_length <= i:
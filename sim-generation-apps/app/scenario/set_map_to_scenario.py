@@ -60,7 +60,7 @@ def map_setup(map_info, xml_file, xosc_config_json):
     with open(xosc_config_json, "w", encoding="utf-8") as f:
         json.dump(xosc_data_dict, f, ensure_ascii=False, indent=2)
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="対象の相対座標の計算")
     parser.add_argument(
         "--scenario_xml_file",
@@ -81,7 +81,7 @@ def main():
         help="相対距離推定結果jsonファイルパス",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     scenario_xml_file = args.scenario_xml_file
     assert isinstance(scenario_xml_file, str)
     xosc_config_json = args.xosc_config_json
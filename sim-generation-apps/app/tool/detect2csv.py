@@ -1,9 +1,14 @@
-import json
 import csv
 import argparse
 import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../camera_distance')))
+from commons.result_io import iter_result_records
 
 DETECT_CSV_HEADER = ["frame","file","obj_id","distance_x","distance_y","distance_z","angle_1","angle_2"]
+# 同時に開いておくCSVファイルの最大数 (超えた場合は閉じて、以降は追記で開き直す)
+MAX_OPEN_CSV_FILES = 64
 
 # launch.json
 # {
@@ -17,24 +22,23 @@ DETECT_CSV_HEADER = ["frame","file","obj_id","distance_x","distance_y","distance
 #     ]
 # }
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="相対距離推定結果jsonファイルCSV変換")
     parser.add_argument(
         "--rel_coord_file",
         type=str,
         required=True,
-        help="相対距離推定結果jsonファイルパス",
+        help="相対距離推定結果ファイルパス (.json / フレームごとに書き込んだ .jsonl)",
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     rel_coord_file = args.rel_coord_file
     assert isinstance(rel_coord_file, str)
 
-    with open(rel_coord_file, mode='r', encoding='utf-8') as f:
-        rel_coord_result = json.load(f)
-
-    obj_results = {}
-    for item in rel_coord_result['results']:
+    # 結果を1フレームずつ読み込み、検出した車両ごとのCSVファイルに追記する
+    csv_files = {}
+    created_obj_ids = set()
+    for item in iter_result_records(rel_coord_file):
         frame = item['frame']
         file = item['file']
 
@@ -42,9 +46,19 @@ def main():
             distance = detect['distance']
             angle = detect['angle']
             obj_id = str(detect['obj_id'])
-            if obj_id not in obj_results.keys():
-                obj_results[obj_id] = []
-            obj_results[obj_id].append(dict(zip(
+            if obj_id not in csv_files:
+                if len(csv_files) >= MAX_OPEN_CSV_FILES:
+                    for f, _ in csv_files.values():
+                        f.close()
+                    csv_files = {}
+                detect_csv = os.path.splitext(rel_coord_file)[0] + obj_id + ".csv"
+                f = open(detect_csv, mode='a' if obj_id in created_obj_ids else 'w', encoding='utf-8')
+                writer = csv.DictWriter(f, fieldnames=DETECT_CSV_HEADER)
+                if obj_id not in created_obj_ids:
+                    writer.writeheader()
+                    created_obj_ids.add(obj_id)
+                csv_files[obj_id] = (f, writer)
+            csv_files[obj_id][1].writerow(dict(zip(
                 DETECT_CSV_HEADER,
                 [
                     frame, file, obj_id,
@@ -52,13 +66,9 @@ def main():
                     angle[0], angle[1]
                 ]
             )))
-    
-    for key in obj_results.keys():
-        detect_csv = os.path.splitext(rel_coord_file)[0] + key + ".csv"
-        with open(detect_csv, mode='w', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=DETECT_CSV_HEADER)
-            writer.writeheader()
-            writer.writerows(obj_results[key])
+
+    for f, _ in csv_files.values():
+        f.close()
 
 
 if __name__ == "__main__":
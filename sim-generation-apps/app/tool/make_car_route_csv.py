@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import csv
 import matplotlib.pyplot as plt
@@ -8,6 +9,9 @@ import pandas as pd
 from shapely.geometry import LineString, Point
 import numpy as np
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../camera_distance')))
+from commons.result_io import load_result_columns
+
 BRAVS_CSV_HEADER = ["frame","timestamp","latitude","longitude","pos_z","roll_rad","pitch_rad","yaw_rad","vel_x","vel_y","vel_z","interpolation_type","road_id","lane_id"]
 ABS_RESULT_CSV_HEADER = ["frame","timestamp","pos_x","pos_y","pos_z","yaw_rad","vel","interpolation_type","road_id","lane_id"]
 SDMG_ROUTE_CSV_HEADER = ["timestamp","pos_x","pos_y","pos_z","roll_rad","pitch_rad","yaw_rad","vel_x","vel_y","vel_z"]
@@ -68,7 +72,7 @@ def recalc_beforein_position(df:pd.DataFrame, roads_data, map_offsets):
     return df
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="自車と検出者の絶対座標から経路出力")
     parser.add_argument(
         "--xodr_road_json",
@@ -90,7 +94,7 @@ def main():
         help="自車オフセット（y方向）",
     )
    
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     xodr_road_json = args.xodr_road_json
     assert isinstance(xodr_road_json, str)
     abs_coord_file = args.abs_coord_file
@@ -103,46 +107,45 @@ def main():
         map_offset = xodr_road_result["map_offset"]
         roads_data = xodr_road_result["roads"]
 
-    with open(abs_coord_file, mode='r', encoding='utf-8') as f:
-        det_abs_coord_result = json.load(f)
+    # 使用する列のみ読み込む (キーが無い場合はNone)
+    frame_columns, detection_columns = load_result_columns(
+        abs_coord_file,
+        frame_keys=["frame", "self.world_coordinate", "self.velocity", "self.latitude", "self.longitude", "self.yaw"],
+        detection_keys=["obj_id", "world_coordinate", "velocity", "yaw", "interpolation_type",
+                        "road_correction.road", "road_correction.lane"],
+    )
+    # detections of frame ii are rows detection_starts[ii]:detection_starts[ii + 1] of detection_columns
+    detection_starts = np.searchsorted(
+        detection_columns['result_index'], np.arange(len(frame_columns['frame']) + 1)).tolist()
 
     values = []
     other_values = {}
-    for item in det_abs_coord_result['results']:
-        frame = item['frame']
-        self_item = item.get('self')
-        if self_item is None:
-            continue
-        
-        self_world_coordinate = self_item.get('world_coordinate')
+    for ii, frame in enumerate(frame_columns['frame']):
+        self_world_coordinate = frame_columns['self.world_coordinate'][ii]
         if self_world_coordinate is None:
             continue
 
-        self_vel = self_item.get('velocity')
-        self_lat = self_item.get('latitude')
-        self_lon = self_item.get('longitude')
-        self_yaw = math.radians(self_item.get('yaw'))
+        self_vel = frame_columns['self.velocity'][ii]
+        self_lat = frame_columns['self.latitude'][ii]
+        self_lon = frame_columns['self.longitude'][ii]
+        self_yaw = math.radians(frame_columns['self.yaw'][ii])
         
         time = frame_to_timecode(frame)
         values.append([frame, time, self_lat, self_lon, self_world_coordinate[0], self_world_coordinate[1], self_world_coordinate[2], self_vel, self_yaw])
         
         # other
-        for detect in item['detections']:
-            obj_id = detect['obj_id']
-            world_coordinate = detect.get('world_coordinate')
+        for row in range(detection_starts[ii], detection_starts[ii + 1]):
+            obj_id = detection_columns['obj_id'][row]
+            world_coordinate = detection_columns['world_coordinate'][row]
             if world_coordinate is None:
                 continue
             
-            obj_vel = detect.get('velocity') if detect.get('velocity') is not None else self_vel
-            obj_yaw = detect.get('yaw') if detect.get('yaw') is not None else self_yaw
+            obj_vel = detection_columns['velocity'][row] if detection_columns['velocity'][row] is not None else self_vel
+            obj_yaw = detection_columns['yaw'][row] if detection_columns['yaw'][row] is not None else self_yaw
             obj_yaw = math.radians(obj_yaw)
-            obj_interpolation = detect.get('interpolation_type')
-            obj_road_correction = detect.get('road_correction')
-            obj_road_id = None
-            obj_lane_id = None
-            if obj_road_correction is not None:
-                obj_road_id = obj_road_correction.get('road')
-                obj_lane_id = obj_road_correction.get('lane')
+            obj_interpolation = detection_columns['interpolation_type'][row]
+            obj_road_id = detection_columns['road_correction.road'][row]
+            obj_lane_id = detection_columns['road_correction.lane'][row]
             obj_id_str = str(obj_id)
             if obj_id_str not in other_values:
                 other_values[obj_id_str] = []